@@ -10,22 +10,33 @@ providing a module with two functions named ``integrate_adaptive`` and
 from __future__ import absolute_import, division, print_function
 
 
-from collections import defaultdict
+from collections import defaultdict, deque
 import copy
+import hashlib
+import importlib
+import inspect
+import itertools
+import json
+import multiprocessing
 import os
+import pickle
+import threading
 import warnings
 
 import numpy as np
 
-from .util import _ensure_4args, _default
+from .util import _ensure_4args, _default, _Callback, _content_hash, _last_step
 from .plotting import plot_result, plot_phase_plane
-from .results import Result
+from .results import Result, BatchResult
 
 
 class RecoverableError(Exception):
     pass
 
 
+_thread_state_lock = threading.Lock()
+
+
 class ODESys(object):
     """ Object representing an ODE system.
 
@@ -127,6 +138,13 @@ class ODESys(object):
     autonomous_interface : bool or None
         Indicates whether the system appears autonomous upon call to
         :meth:`integrate`. ``None`` indicates that it is unknown.
+    sparse : bool
+        When ``True``, integrators supporting it use ``sparse_j_cb`` which
+        evaluates the non-zero entries (:attr:`nnz` of them) of the jacobian
+        in CSC order (given by ``colptrs`` & ``rowvals``), see e.g.
+        :class:`pyodesys.symbolic.SymbolicSys`.
+    nnz : int
+        Number of non-zero entries in a sparse jacobian (-1 if not :attr:`sparse`).
 
     Examples
     --------
@@ -139,9 +157,14 @@ class ODESys(object):
     Notes
     -----
     Banded jacobians are supported by "scipy" and "cvode" integrators.
+    Sparse jacobians are supported by "scipy" (``solve_ivp``) and "cvode" integrators.
 
     """
 
+    sparse = False
+    nnz = -1
+    _nderiv_integrators = ('cvode',)  # integrators able to report derivatives (``nderiv``)
+
     def __init__(self, f, jac=None, dfdx=None, first_step_cb=None, roots_cb=None, nroots=None,
                  band=None, names=(), param_names=(), indep_name=None, description=None, dep_by_name=False,
                  par_by_name=False, latex_names=(), latex_param_names=(), latex_indep_name=None,
@@ -190,6 +213,60 @@ class ODESys(object):
         if len(kwargs) > 0:
             raise ValueError("Unknown kwargs: %s" % str(kwargs))
 
+    def _has_jacobian(self):
+        """ Whether a jacobian is available (without building it). """
+        return self.j_cb is not None
+
+    def _thread_state(self):
+        """ Per-thread storage for state belonging to the ongoing integration. """
+        try:
+            return self.__dict__['_thread_local']
+        except KeyError:
+            with _thread_state_lock:
+                return self.__dict__.setdefault('_thread_local', threading.local())
+
+    @property
+    def _current_integration_kwargs(self):
+        """ Keyword arguments of the ongoing call to :meth:`integrate` (in this thread). """
+        return self._thread_state().integration_kwargs
+
+    @_current_integration_kwargs.setter
+    def _current_integration_kwargs(self, value):
+        self._thread_state().integration_kwargs = value
+
+    @property
+    def _internal(self):
+        """ Internal (xout, yout, params) of the last 1D integration (in this thread). """
+        return self._thread_state().internal
+
+    @_internal.setter
+    def _internal(self, value):
+        self._thread_state().internal = value
+
+    def _fingerprint_parts(self):
+        return None  # the callbacks are opaque, see SymbolicSys
+
+    def fingerprint(self):
+        """ Content hash identifying the system (see :meth:`pyodesys.results.Result.load`).
+
+        ``None`` unless the system is defined by expressions (e.g. :class:`pyodesys.symbolic.SymbolicSys`),
+        i.e. a system given by (opaque) callbacks never matches a stored fingerprint.
+        """
+        parts = self._fingerprint_parts()
+        return None if parts is None else _content_hash(*parts)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_thread_local', None)
+        if inspect.ismodule(self.numpy):
+            state['numpy'] = self.numpy.__name__
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state.get('numpy', None), str):
+            state['numpy'] = importlib.import_module(state['numpy'])
+        self.__dict__.update(state)
+
     @staticmethod
     def _array_from_dict(d, keys, numpy=np):
         vals = [d[k] for k in keys]
@@ -365,6 +442,33 @@ class ODESys(object):
             when jacobian is derived at runtime (high computational cost).
         force_predefined : bool (default: False)
             override behaviour of ``len(x) == 2`` => :meth:`adaptive`
+        batch_result : bool (default: False)
+            When integrating several instances (2D input): return a
+            :class:`pyodesys.results.BatchResult` instance (contiguous storage)
+            instead of a list of :class:`pyodesys.results.Result` instances.
+        dense_output : bool (default: False)
+            Store derivatives at the output points (``info['dense_output']``, shape
+            ``(nx, nderiv + 1, ny)``) so that :meth:`pyodesys.results.Result.at` evaluates
+            a Hermite interpolant through them (instead of refitting splines).
+            Integrators which can report derivatives from their own interpolating
+            polynomial (e.g. 'cvode') do so (``nderiv``, default: 2); for the others
+            the first derivative is evaluated from the right-hand-side at the output
+            points. Note that adaptive mode of ``'cvode'`` reports every internal step.
+            Not supported together with post-processors.
+        decimate : int (optional)
+            Adaptive mode: keep only every ``decimate``-th step (first, last and root
+            points are always kept).
+        decimate_tol : float (optional)
+            Adaptive mode: keep only the steps needed for linear interpolation between kept
+            points to reproduce the dropped ones within ``decimate_tol*(atol + rtol*abs(y))``.
+        yout_dtype : dtype (optional)
+            Store the dependent variables as e.g. ``np.float32``.
+
+            With ``integrator='scipy'`` (``scipy.integrate.ode``) ``decimate`` and ``yout_dtype``
+            are applied as the steps are taken. Otherwise (and for ``decimate_tol``, which needs
+            the neighbouring steps) they are applied to the output of each instance once it has
+            been integrated: this bounds the memory retained by the results, but not the peak
+            memory use during the integration of an instance.
         \\*\\*kwargs :
             Additional keyword arguments for ``_integrate_$(integrator)``.
 
@@ -398,21 +502,45 @@ class ODESys(object):
             kwargs['atol'] = atol
         kwargs['rtol'] = rtol
 
+        batch_result = kwargs.pop('batch_result', False)
+        dense_output = kwargs.pop('dense_output', False)
+        decimate, decimate_tol = kwargs.pop('decimate', None), kwargs.pop('decimate_tol', None)
+        yout_dtype = kwargs.pop('yout_dtype', None)
         integrator = kwargs.pop('integrator', None)
         if integrator is None:
             integrator = os.environ.get('PYODESYS_INTEGRATOR', 'scipy')
+        if dense_output:
+            if self.post_processors:
+                raise NotImplementedError("dense_output is not supported together with post_processors")
+            if integrator in self._nderiv_integrators:
+                kwargs.setdefault('nderiv', 2)
 
         args = tuple(map(self.numpy.atleast_2d, (_x, _y, _p)))
 
         self._current_integration_kwargs = kwargs
         if isinstance(integrator, str):
-            nfo = getattr(self, '_integrate_' + integrator)(*args, **kwargs)
+            if integrator == 'scipy':  # decimated & cast as the steps are taken
+                nfo = self._integrate_scipy(*args, decimate=decimate, yout_dtype=yout_dtype, **kwargs)
+            else:
+                nfo = getattr(self, '_integrate_' + integrator)(*args, **kwargs)
         else:
             kwargs['with_jacobian'] = getattr(integrator, 'with_jacobian', None)
             nfo = self._integrate(integrator.integrate_adaptive,
                                   integrator.integrate_predefined,
                                   *args, **kwargs)
-        if twodim:
+        for info in nfo:  # compact storage instance by instance (releasing the full output)
+            every = None if 'ndecimated' in info else decimate  # not already done by the integrator
+            if info.get('mode') == 'adaptive' and (every or decimate_tol is not None):
+                self._decimate(info, every, decimate_tol, kwargs['atol'], rtol)
+            if dense_output:
+                self._dense_output(info)
+            if yout_dtype is not None:
+                info['internal_yout'] = info['internal_yout'].astype(yout_dtype, copy=False)
+                if dense_output:
+                    info['dense_output'] = info['dense_output'].astype(yout_dtype)
+        if twodim and batch_result:
+            res = BatchResult.from_infos(nfo, self)
+        elif twodim:
             _xout = [d['internal_xout'] for d in nfo]
             _yout = [d['internal_yout'] for d in nfo]
             _params = [d['internal_params'] for d in nfo]
@@ -427,13 +555,146 @@ class ODESys(object):
             res = Result(*(self.post_process(_xout, _yout, _p) + (nfo, self)))
         return res
 
+    def iter_integrate(self, x, y0, params=(), chunks=10, checkpoint=None, **kwargs):
+        """ Integrate in chunks, yielding the output as the integration proceeds.
+
+        Every chunk is integrated by a call to :meth:`integrate` continuing from the
+        end of the previous chunk (the integrator is restarted, in adaptive mode with
+        the last accepted step as ``first_step``), hence the memory use is bounded by
+        the size of a chunk and output is available early.
+
+        Parameters
+        ----------
+        x : array_like or pair or float
+            See :meth:`integrate` (a pair means adaptive mode).
+        y0 : array_like
+            See :meth:`integrate` (a single instance).
+        params : array_like
+            See :meth:`integrate`.
+        chunks : int or array_like
+            Adaptive mode: number of (equally wide) chunks, or the interior breakpoints.
+            Predefined mode: number of chunks of the output points.
+        checkpoint : str (optional)
+            Path of a (JSON) file to which the state is written after every chunk. If the
+            file exists, the integration is resumed after its last completed chunk (giving
+            output identical to the uninterrupted integration). The checkpoint needs to match
+            the system (see :meth:`fingerprint`), ``params`` and ``x``.
+        \\*\\*kwargs :
+            See :meth:`integrate`.
+
+        Yields
+        ------
+        Length 2 tuples: (xout_chunk, yout_chunk)
+            Consecutive chunks of the output (the start of a chunk is not repeated).
+
+        Raises
+        ------
+        RuntimeError
+            If the integration of a chunk is unsuccessful.
+
+        """
+        if any(arr.ndim > 1 for arr in self.to_arrays(x, y0, params)):
+            raise ValueError("iter_integrate integrates a single instance")
+        try:
+            nx = len(x)
+        except TypeError:
+            x, nx = (0*x, x), 2
+        x = np.asarray(x)
+        if nx == 2 and not kwargs.get('force_predefined', False):
+            if np.ndim(chunks) == 0:
+                edges = np.linspace(x[0], x[1], chunks + 1)
+            else:
+                edges = np.concatenate(([x[0]], chunks, [x[1]]))
+            segments = [edges[idx:idx+2] for idx in range(edges.size - 1)]
+        else:
+            kwargs['force_predefined'] = True
+            segments = [x[s[0] - 1:s[-1] + 1] for s in np.array_split(np.arange(1, nx), chunks) if s.size]
+        if kwargs.get('integrator', None) == 'cvode':
+            kwargs.setdefault('record_steps', True)  # restart each chunk with the step size of the solver
+        _params = {k: np.asarray(v).tolist() for k, v in params.items()} if isinstance(params, dict) else (
+            np.asarray(params, dtype=np.float64).tolist())
+        first_chunk = 0
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with open(checkpoint, 'rt') as ifh:
+                state = json.load(ifh)
+            if self.fingerprint() is None:
+                raise ValueError("Cannot verify checkpoint %s (system without fingerprint)" % checkpoint)
+            if state['fingerprint'] != self.fingerprint() or state['params'] != _params or (
+                    state['x'] != float(segments[state['chunk'] - 1][-1])):
+                raise ValueError("Checkpoint %s does not match the integration" % checkpoint)
+            first_chunk, y0 = state['chunk'], np.array(state['y'])
+            if state['first_step'] is not None:
+                kwargs['first_step'] = state['first_step']
+        for idx in range(first_chunk, len(segments)):
+            res = self.integrate(segments[idx], y0, params, **kwargs)
+            if not res.info['success']:
+                raise RuntimeError("Integration of chunk %d failed: %s" % (idx, res.info.get('message')))
+            y0, first_step = res.yout[-1], _last_step(res.info)
+            if first_step is not None:
+                kwargs['first_step'] = first_step
+            yield res.xout[0 if idx == 0 else 1:], res.yout[0 if idx == 0 else 1:]
+            if checkpoint is not None:  # written once the consumer is done with the chunk
+                state = dict(fingerprint=self.fingerprint(), params=_params, chunk=idx + 1, x=float(res.xout[-1]),
+                             y=np.asarray(y0, dtype=np.float64).tolist(), first_step=first_step)
+                with open(checkpoint + '.tmp', 'wt') as ofh:
+                    json.dump(state, ofh)
+                os.replace(checkpoint + '.tmp', checkpoint)  # atomic: a preempted job leaves a valid file
+
+    def _decimate(self, info, every, tol, atol, rtol):
+        xout, yout = info['internal_xout'], info['internal_yout']
+        roots = info.get('root_indices', None)
+        keep = np.zeros(xout.size, dtype=bool)
+        keep[[0, -1]] = True
+        if roots is not None and len(roots) > 0:
+            keep[np.asarray(roots)] = True
+        if every:
+            keep[::every] = True
+        if tol is not None:
+            keep |= _interpolation_knots(xout, yout[:, 0, :] if yout.ndim == 3 else yout,
+                                         tol*np.asarray(atol), tol*rtol, keep)
+        indices = np.flatnonzero(keep)
+        info['internal_xout'], info['internal_yout'] = xout[indices], yout[indices]
+        if roots is not None:
+            info['root_indices'] = np.searchsorted(indices, roots).tolist()
+        info['ndecimated'] = xout.size - indices.size
+
+    def _dense_output(self, info):
+        yout = info['internal_yout']
+        if yout.ndim == 2:  # derivatives not reported by the integrator
+            x, p = info['internal_xout'], info['internal_params']
+            args = (p,) if len(p) > 0 else ()
+            dydx = np.array([np.asarray(self.f_cb(xv, yv, *args)) for xv, yv in zip(x, yout)]).reshape(yout.shape)
+            yout = np.stack((yout, dydx), axis=1)
+        info['internal_yout'] = yout[:, 0, :]
+        info['dense_output'] = yout
+
     def chained_parameter_variation(self, *args, **kwargs):
         """ See :func:`chained_parameter_variation`. """
         return chained_parameter_variation(self, *args, **kwargs)
 
+    def _scipy_name_with_jacobian(self, name, with_jacobian, method=None):
+        if name is None:
+            if not self._has_jacobian():
+                name = 'dopri5'
+            elif self.sparse:
+                name = 'BDF'
+            else:
+                name = 'lsoda'
+        if with_jacobian is None:
+            if name in ('lsoda', 'LSODA', 'BDF', 'Radau'):  # these might call jacobian
+                with_jacobian = True
+            elif name in ('RK23', 'RK45', 'DOP853'):
+                with_jacobian = False
+            elif name in ('dop853', 'dopri5'):
+                with_jacobian = False  # explicit steppers
+            elif name == 'vode':
+                with_jacobian = (method or 'adams') == 'bdf'
+        return name, with_jacobian
+
     def _integrate_scipy(self, intern_xout, intern_y0, intern_p,
                          atol=1e-8, rtol=1e-8, first_step=None, with_jacobian=None,
-                         force_predefined=False, name=None, **kwargs):
+                         force_predefined=False, name=None, batched=False, decimate=None, yout_dtype=None,
+                         **kwargs):
         """ Do not use directly (use ``integrate('scipy', ...)``).
 
         Uses `scipy.integrate.ode <http://docs.scipy.org/doc/scipy/reference/generated/scipy.integrate.ode.html>`_
@@ -442,8 +703,17 @@ class ODESys(object):
         ----------
         \*args :
             See :meth:`integrate`.
-        name : str (default: 'lsoda'/'dopri5' when jacobian is available/not)
-            What integrator wrapped in scipy.integrate.ode to use.
+        name : str (default: 'lsoda'/'dopri5' when jacobian is available/not, 'BDF' when sparse)
+            What integrator wrapped in scipy.integrate.ode to use. Names in upper case
+            ('BDF', 'Radau', 'LSODA', 'RK45', 'RK23' & 'DOP853') use
+            ``scipy.integrate.solve_ivp`` instead, see :meth:`_integrate_scipy_ivp`.
+        batched : bool (default: False)
+            Integrate all instances (rows of ``y0``/``params``) as one block-diagonal
+            system, see :meth:`_integrate_scipy_batched`.
+        decimate : int (optional)
+            Adaptive mode: keep only every ``decimate``-th step, applied as the steps are taken.
+        yout_dtype : dtype (optional)
+            Store the dependent variables as e.g. ``np.float32`` (as the steps are taken).
         \*\*kwargs :
             Keyword arguments passed onto `set_integrator(...) <
         http://docs.scipy.org/doc/scipy/reference/generated/
@@ -453,36 +723,38 @@ class ODESys(object):
         -------
         See :meth:`integrate`.
         """
+        if batched:
+            return self._integrate_scipy_batched(
+                intern_xout, intern_y0, intern_p, atol=atol, rtol=rtol, first_step=first_step,
+                with_jacobian=with_jacobian, force_predefined=force_predefined, name=name, **kwargs)
+        name, with_jacobian = self._scipy_name_with_jacobian(name, with_jacobian, kwargs.get('method'))
+        if name in self._scipy_ivp_methods:
+            return self._integrate_scipy_ivp(
+                intern_xout, intern_y0, intern_p, atol=atol, rtol=rtol, first_step=first_step,
+                with_jacobian=with_jacobian, force_predefined=force_predefined, name=name, **kwargs)
         from scipy.integrate import ode
         ny = intern_y0.shape[-1]
         nx = intern_xout.shape[-1]
+        if nx == 2 and not force_predefined:
+            yout_all = None
+        else:  # contiguous storage for all instances (see BatchResult)
+            yout_all = np.empty((intern_y0.shape[0], nx, ny), dtype=yout_dtype or np.float64)
         results = []
         for _xout, _y0, _p in zip(intern_xout, intern_y0, intern_p):
-            if name is None:
-                if self.j_cb is None:
-                    name = 'dopri5'
-                else:
-                    name = 'lsoda'
-            if with_jacobian is None:
-                if name == 'lsoda':  # lsoda might call jacobian
-                    with_jacobian = True
-                elif name in ('dop853', 'dopri5'):
-                    with_jacobian = False  # explicit steppers
-                elif name == 'vode':
-                    with_jacobian = kwargs.get('method', 'adams') == 'bdf'
-
             def rhs(t, y, p=()):
                 rhs.ncall += 1
                 return self.f_cb(t, y, p)
             rhs.ncall = 0
 
-            if self.j_cb is not None:
+            if with_jacobian and self.j_cb is not None:
                 def jac(t, y, p=()):
                     jac.ncall += 1
                     return self.j_cb(t, y, p)
                 jac.ncall = 0
+            else:
+                jac = None
 
-            r = ode(rhs, jac=jac if with_jacobian else None)
+            r = ode(rhs, jac=jac)
             if 'lband' in kwargs or 'uband' in kwargs or 'band' in kwargs:
                 raise ValueError("lband and uband set locally (set `band` at initialization instead)")
             if self.band is not None:
@@ -498,30 +770,25 @@ class ODESys(object):
                     warnings.warn("'adaptive' mode with SciPy's integrator (vode/lsoda) may overshoot (itask=2)")
                     warnings.warn("'adaptive' mode with SciPy's integrator is unreliable, consider using e.g. cvode")
                     # vode itask 2 (may overshoot)
-                    ysteps = [_y0]
-                    xsteps = [_xout[0]]
+                    recorder = _StepRecorder(decimate, yout_dtype)
+                    recorder(_xout[0], _y0)
                     while r.t < _xout[1]:
                         r.integrate(_xout[1], step=True)
                         if not r.successful():
                             raise RuntimeError("failed")
-                        xsteps.append(r.t)
-                        ysteps.append(r.y)
+                        recorder(r.t, r.y)
                 else:
-                    xsteps, ysteps = [], []
-
-                    def solout(x, y):
-                        xsteps.append(x)
-                        ysteps.append(y)
-                    r.set_solout(solout)
+                    recorder = _StepRecorder(decimate, yout_dtype)
+                    r.set_solout(recorder)
                     r.integrate(_xout[1])
                     if not r.successful():
                         raise RuntimeError("failed")
-                _yout = np.array(ysteps)
-                _xout = np.array(xsteps)
+                _xout, _yout, ndecimated = recorder.arrays()
 
             else:  # predefined
                 mode = 'predefined'
-                _yout = np.empty((nx, ny))
+                ndecimated = None
+                _yout = yout_all[len(results)]
                 _yout[0, :] = _y0
                 for idx in range(1, nx):
                     r.integrate(_xout[idx])
@@ -540,40 +807,317 @@ class ODESys(object):
                 'atol': atol,
                 'rtol': rtol
             }
-            if self.j_cb is not None:
+            if decimate and ndecimated is not None:
+                info['ndecimated'] = ndecimated
+            if jac is not None:
                 info['njev'] = jac.ncall
+            elif self._has_jacobian():
+                info['njev'] = 0
             results.append(info)
         return results
 
-    def _integrate(self, adaptive, predefined, intern_xout, intern_y0, intern_p,
-                   atol=1e-8, rtol=1e-8, first_step=0.0, with_jacobian=None,
-                   force_predefined=False, **kwargs):
+    _scipy_ivp_methods = ('RK45', 'RK23', 'DOP853', 'Radau', 'BDF', 'LSODA')
+
+    def _integrate_scipy_ivp(self, intern_xout, intern_y0, intern_p,
+                             atol=1e-8, rtol=1e-8, first_step=None, with_jacobian=None,
+                             force_predefined=False, name='BDF', **kwargs):
+        """ Do not use directly (use ``integrate('scipy', name='BDF', ...)``).
+
+        Uses `scipy.integrate.solve_ivp
+        <https://docs.scipy.org/doc/scipy/reference/generated/scipy.integrate.solve_ivp.html>`_.
+        For :attr:`sparse` systems the jacobian is passed as a ``scipy.sparse.csc_matrix``
+        (or only its sparsity pattern when ``with_jacobian=False``), which makes the implicit
+        methods ('BDF' & 'Radau') use sparse LU decomposition.
+
+        Parameters
+        ----------
+        \*args :
+            See :meth:`integrate`.
+        name : str
+            Passed as ``method`` to ``solve_ivp``.
+        \*\*kwargs :
+            Keyword arguments passed onto ``solve_ivp``.
+
+        Returns
+        -------
+        See :meth:`integrate`.
+        """
+        from scipy.integrate import solve_ivp
+        if self.band is not None:
+            raise NotImplementedError("Banded jacobian with solve_ivp (use e.g. name='lsoda')")
+        ny = intern_y0.shape[-1]
         nx = intern_xout.shape[-1]
+        if self.sparse:
+            from scipy.sparse import csc_matrix
+            colptrs, rowvals = self.colptrs, self.rowvals
+            sparsity = csc_matrix((np.ones(self.nnz), rowvals, colptrs), shape=(ny, ny))
+        if first_step is not None and first_step > 0:
+            kwargs['first_step'] = first_step
+        if nx == 2 and not force_predefined:
+            yout_all = None
+        else:  # contiguous storage for all instances (see BatchResult)
+            yout_all = np.empty((intern_y0.shape[0], nx, ny))
         results = []
         for _xout, _y0, _p in zip(intern_xout, intern_y0, intern_p):
+            def rhs(t, y):
+                return self.f_cb(t, y, _p)
+
+            ivp_kw = kwargs.copy()
+            if with_jacobian and self._has_jacobian():
+                if self.sparse:
+                    def jac(t, y):
+                        jac.ncall += 1
+                        return csc_matrix((np.asarray(self.sparse_j_cb(t, y, _p)), rowvals, colptrs),
+                                          shape=(ny, ny))
+                else:
+                    def jac(t, y):
+                        jac.ncall += 1
+                        return self.j_cb(t, y, _p)
+                jac.ncall = 0
+                ivp_kw['jac'] = jac
+            else:
+                jac = None
+                if self.sparse and name in ('BDF', 'Radau'):
+                    ivp_kw['jac_sparsity'] = sparsity
+
+            if nx == 2 and not force_predefined:
+                mode = 'adaptive'
+                t_eval = None
+            else:
+                mode = 'predefined'
+                t_eval = _xout
+            sol = solve_ivp(rhs, (_xout[0], _xout[-1]), _y0, method=name, t_eval=t_eval,
+                            atol=atol, rtol=rtol, **ivp_kw)
+            _xout, _yout = sol.t, sol.y.T
+            if mode == 'predefined' and _xout.size == nx:
+                yout_all[len(results)] = _yout
+                _xout, _yout = t_eval, yout_all[len(results)]
+            info = {
+                'internal_xout': _xout,
+                'internal_yout': _yout,
+                'internal_params': _p,
+                'success': sol.success,
+                'nfev': sol.nfev,
+                'njev': sol.njev,
+                'nlu': sol.nlu,
+                'n_steps': sol.t.size - 1 if mode == 'adaptive' else -1,
+                'message': sol.message,
+                'name': name,
+                'mode': mode,
+                'atol': atol,
+                'rtol': rtol
+            }
+            results.append(info)
+        return results
+
+    def _integrate_scipy_batched(self, intern_xout, intern_y0, intern_p,
+                                 atol=1e-8, rtol=1e-8, first_step=None, with_jacobian=None,
+                                 force_predefined=False, name=None, **kwargs):
+        """ Do not use directly (use ``integrate(..., integrator='scipy', batched=True)``).
+
+        Stacks the ``n`` instances into one block-diagonal system of size ``n*ny`` which
+        is integrated using a single ``scipy.integrate.ode`` instance. The callbacks
+        (:attr:`f_cb` & :attr:`j_cb`) are called once per evaluation with ``y`` of shape
+        ``(n, ny)`` and ``p`` of shape ``(n, nparams)`` (and ``x`` of shape ``(n,)``), i.e.
+        they need to be vectorized (as those of :class:`pyodesys.symbolic.SymbolicSys` are).
+        Implicit steppers ('vode' & 'lsoda') are given a banded jacobian so that the cost
+        of the linear algebra scales linearly with ``n``.
+
+        Notes
+        -----
+        All instances share the same steps, hence all instances need the same values of
+        the independent variable. The error norm of the stepper is taken over the whole
+        batch, so tolerances are met for the batch as a whole.
+        """
+        from scipy.integrate import ode
+        n, ny = intern_y0.shape
+        nx = intern_xout.shape[-1]
+        if np.any(intern_xout != intern_xout[0, :]):
+            raise ValueError("Batched integration requires the same xout for all instances.")
+        if name is None and self.sparse:
+            name = 'lsoda'  # the block-diagonal jacobian uses banded storage
+        name, with_jacobian = self._scipy_name_with_jacobian(name, with_jacobian, kwargs.get('method'))
+        if name in self._scipy_ivp_methods:
+            raise ValueError("Batched mode requires an integrator from scipy.integrate.ode")
+        if 'lband' in kwargs or 'uband' in kwargs or 'band' in kwargs:
+            raise ValueError("lband and uband set locally (set `band` at initialization instead)")
+        lband, uband = (ny - 1, ny - 1) if self.band is None else self.band
+        implicit = name in ('vode', 'lsoda')
+        if implicit:
+            kwargs['lband'], kwargs['uband'] = lband, uband
+        nparams = intern_p.shape[-1]
+
+        def _xarr(t):
+            return np.full(n, t)
+
+        def rhs(t, y):
+            rhs.ncall += 1
+            fout = np.asarray(self.f_cb(_xarr(t), y.reshape((n, ny)), intern_p) if nparams > 0 else
+                              self.f_cb(_xarr(t), y.reshape((n, ny))))
+            if fout.shape != (n, ny):
+                raise ValueError("f_cb is not vectorized (returned shape %s)" % str(fout.shape))
+            return fout.ravel()
+        rhs.ncall = 0
+
+        if implicit and with_jacobian and self.j_cb is not None:
+            if self.band is None:
+                _il, _jl = [a.ravel() for a in np.indices((ny, ny))]
+                _rows = _il - _jl + uband
+
+            def jac(t, y):
+                jac.ncall += 1
+                jout = np.asarray(self.j_cb(_xarr(t), y.reshape((n, ny)), intern_p) if nparams > 0 else
+                                  self.j_cb(_xarr(t), y.reshape((n, ny))))
+                if self.band is None:  # pack dense (n, ny, ny) blocks into banded storage
+                    packed = np.zeros((lband + uband + 1, n, ny))
+                    packed[_rows, :, _jl] = jout[:, _il, _jl].T
+                else:  # (n, lband + uband + 1, ny) already in banded storage
+                    packed = jout.transpose(1, 0, 2)
+                return packed.reshape((lband + uband + 1, n*ny))
+            jac.ncall = 0
+        else:
+            jac = None
+
+        r = ode(rhs, jac=jac)
+        _atol = np.atleast_1d(atol)
+        r.set_integrator(name, atol=atol if _atol.size == 1 else np.tile(_atol, n), rtol=rtol, **kwargs)
+        y0 = intern_y0.ravel()
+        x0, xend = intern_xout[0, 0], intern_xout[0, -1]
+        r.set_initial_value(y0, x0)
+        if nx == 2 and not force_predefined:
+            mode = 'adaptive'
+            if name in ('vode', 'lsoda'):
+                warnings.warn("'adaptive' mode with SciPy's integrator (vode/lsoda) may overshoot (itask=2)")
+                warnings.warn("'adaptive' mode with SciPy's integrator is unreliable, consider using e.g. cvode")
+                ysteps, xsteps = [y0], [x0]
+                while r.t < xend:
+                    r.integrate(xend, step=True)
+                    if not r.successful():
+                        raise RuntimeError("failed")
+                    xsteps.append(r.t)
+                    ysteps.append(r.y)
+            else:
+                xsteps, ysteps = [], []
+
+                def solout(x, y):
+                    xsteps.append(x)
+                    ysteps.append(y.copy())
+                r.set_solout(solout)
+                r.integrate(xend)
+                if not r.successful():
+                    raise RuntimeError("failed")
+            _xout = np.array(xsteps)
+            _yout = np.array(ysteps)
+        else:
+            mode = 'predefined'
+            _xout = intern_xout[0, :]
+            _yout = np.empty((nx, n*ny))
+            _yout[0, :] = y0
+            for idx in range(1, nx):
+                r.integrate(_xout[idx])
+                if not r.successful():
+                    raise RuntimeError("failed")
+                _yout[idx, :] = r.y
+        _yout = _yout.reshape((_xout.size, n, ny))
+        results = []
+        for idx in range(n):
+            info = {
+                'internal_xout': _xout,
+                'internal_yout': _yout[:, idx, :],
+                'internal_params': intern_p[idx, :],
+                'success': r.successful(),
+                'nfev': rhs.ncall,
+                'n_steps': -1,
+                'name': name,
+                'mode': mode,
+                'atol': atol,
+                'rtol': rtol
+            }
+            if jac is not None:
+                info['njev'] = jac.ncall
+            results.append(info)
+        return results
+
+    def _integrate(self, adaptive, predefined, intern_xout, intern_y0, intern_p,
+                   atol=1e-8, rtol=1e-8, first_step=0.0, with_jacobian=None,
+                   force_predefined=False, nthreads=None, executor=None, **kwargs):
+        """ Integrates each instance using ``adaptive`` or ``predefined``.
+
+        Parameters
+        ----------
+        adaptive : callable
+            Signature as e.g. ``pycvodes.integrate_adaptive``.
+        predefined : callable
+            Signature as e.g. ``pycvodes.integrate_predefined``.
+        \\*args :
+            See :meth:`integrate`.
+        nthreads : int (optional)
+            Number of threads used to integrate the instances (rows of ``y0``/``params``)
+            concurrently. Only pays off when the integrator releases the GIL (which e.g.
+            pycvodes & pygslodeiv2 does while inside the solver).
+            Default: ``int(os.environ.get('PYODESYS_NTHREADS', '1'))``.
+        executor : ``concurrent.futures.Executor`` instance (optional)
+            Executor to submit instances to (mutually exclusive with ``nthreads``).
+            Note that the callbacks of the system are called from the worker threads.
+        \\*\\*kwargs :
+            Keyword arguments passed on to ``adaptive``/``predefined``.
+
+        Returns
+        -------
+        List of info dicts (in the same order as the instances).
+        """
+        nx = intern_xout.shape[-1]
+        if with_jacobian is None:
+            raise ValueError("Need to pass with_jacobian")
+        if nthreads is not None and executor is not None:
+            raise ValueError("Pass either nthreads or executor (not both)")
+        integration_kwargs = getattr(self, '_current_integration_kwargs', None)
+        # _Callback instances write directly into the arrays provided by the solver:
+        f_out, roots_out = [isinstance(cb, _Callback) for cb in (self.f_cb, self.roots_cb)]
+        sparse = with_jacobian is True and kwargs.get('nnz', -1) >= 0  # e.g. pycvodes with KLU
+        if with_jacobian is True and not sparse:
+            j_out = isinstance(self.j_cb, _Callback)  # dfdx_cb is only looked up if requested
+        if nx == 2 and not force_predefined:
+            yout_all = None
+        else:  # contiguous storage for all instances (see BatchResult)
+            nderiv = kwargs.get('nderiv', 0)
+            yout_all = np.empty((intern_y0.shape[0], nx) + ((nderiv + 1,) if nderiv else ()) + intern_y0.shape[-1:])
+
+        def _integrate_one(idx, _xout, _y0, _p):
+            if integration_kwargs is not None:
+                self._current_integration_kwargs = integration_kwargs  # thread local
             new_kwargs = dict(dx0=first_step, atol=atol,
                               rtol=rtol, check_indexing=False)
             new_kwargs.update(kwargs)
 
             def _f(x, y, fout):
                 try:
-                    if len(_p) > 0:
+                    if f_out:
+                        self.f_cb(x, y, _p, out=fout)
+                    elif len(_p) > 0:
                         fout[:] = np.asarray(self.f_cb(x, y, _p))
                     else:
                         fout[:] = np.asarray(self.f_cb(x, y))
                 except RecoverableError:
                     return 1  # recoverable error
 
-            if with_jacobian is None:
-                raise ValueError("Need to pass with_jacobian")
+            if sparse:
+                def _j(x, y, data, colptrs, rowvals):
+                    self.sparse_j_cb(x, y, _p, out=data)
+                    colptrs[:] = self.colptrs
+                    rowvals[:] = self.rowvals
             elif with_jacobian is True:
                 def _j(x, y, jout, dfdx_out=None, fy=None):
-                    if len(_p) > 0:
+                    if j_out:
+                        self.j_cb(x, y, _p, out=jout)
+                    elif len(_p) > 0:
                         jout[:, :] = np.asarray(self.j_cb(x, y, _p))
                     else:
                         jout[:, :] = np.asarray(self.j_cb(x, y))
                     if dfdx_out is not None:
-                        if len(_p) > 0:
+                        if isinstance(self.dfdx_cb, _Callback):
+                            self.dfdx_cb(x, y, _p, out=dfdx_out)
+                        elif len(_p) > 0:
                             dfdx_out[:] = np.asarray(self.dfdx_cb(x, y, _p))
                         else:
                             dfdx_out[:] = np.asarray(self.dfdx_cb(x, y))
@@ -593,7 +1137,9 @@ class ODESys(object):
 
             if self.roots_cb is not None:
                 def _roots(x, y, out):
-                    if len(_p) > 0:
+                    if roots_out:
+                        self.roots_cb(x, y, _p, out=out)
+                    elif len(_p) > 0:
                         out[:] = np.asarray(self.roots_cb(x, y, _p))
                     else:
                         out[:] = np.asarray(self.roots_cb(x, y))
@@ -610,12 +1156,26 @@ class ODESys(object):
             else:
                 yout, info = predefined(_f, _j, _y0, _xout, **new_kwargs)
                 info['mode'] = 'predefined'
+                if yout.shape == yout_all.shape[1:]:
+                    yout_all[idx, ...] = yout
+                    yout = yout_all[idx]
 
             info['internal_xout'] = _xout
             info['internal_yout'] = yout
             info['internal_params'] = _p
-            results.append(info)
-        return results
+            return info
+
+        if executor is None:
+            if nthreads is None:
+                nthreads = int(os.environ.get('PYODESYS_NTHREADS', '1'))
+            nthreads = min(nthreads, intern_y0.shape[0])
+            if nthreads <= 1:
+                return [_integrate_one(idx, *args) for idx, args in enumerate(zip(intern_xout, intern_y0, intern_p))]
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=nthreads) as pool:
+                return list(pool.map(_integrate_one, range(len(intern_y0)), intern_xout, intern_y0, intern_p))
+        else:
+            return list(executor.map(_integrate_one, range(len(intern_y0)), intern_xout, intern_y0, intern_p))
 
     def _integrate_gsl(self, *args, **kwargs):
         """ Do not use directly (use ``integrate(..., integrator='gsl')``).
@@ -665,7 +1225,8 @@ class ODESys(object):
         Uses CVode from CVodes in
         `SUNDIALS <https://computation.llnl.gov/casc/sundials/>`_
         (via `pycvodes <https://pypi.python.org/pypi/pycvodes>`_)
-        to integrate the ODE system. """
+        to integrate the ODE system. For :attr:`sparse` systems ``linear_solver``
+        defaults to ``'klu'`` (sparse direct solver, requires SUNDIALS built with KLU). """
         import pycvodes  # Python interface to SUNDIALS's cvodes integrators
         kwargs['with_jacobian'] = kwargs.get(
             'method', 'bdf') in pycvodes.requires_jac
@@ -674,6 +1235,8 @@ class ODESys(object):
                              " initialization instead)")
         if self.band is not None:
             kwargs['lband'], kwargs['uband'] = self.band
+        if self.sparse and kwargs.setdefault('linear_solver', 'klu') == 'klu':
+            kwargs['nnz'] = self.nnz
         kwargs['autonomous_exprs'] = self.autonomous_exprs
         return self._integrate(pycvodes.integrate_adaptive,
                                pycvodes.integrate_predefined,
@@ -772,6 +1335,65 @@ def _new_x(xout, x, guaranteed_autonomous):
         return xout[-1], x[-1]
 
 
+class _StepRecorder(object):
+    """ Records every ``every``-th step (and the last one) as they are taken, ``y`` stored as ``dtype``. """
+
+    def __init__(self, every=None, dtype=None):
+        self.every, self.dtype = every or 1, dtype
+        self.xsteps, self.ysteps = [], []
+        self.nsteps = 0
+        self._pending = None  # latest step not (yet) kept
+
+    def __call__(self, x, y):
+        step = (x, np.array(y, dtype=self.dtype))
+        if self.nsteps % self.every == 0:
+            self.xsteps.append(step[0])
+            self.ysteps.append(step[1])
+            self._pending = None
+        else:
+            self._pending = step
+        self.nsteps += 1
+
+    def arrays(self):
+        """ Returns (xout, yout, number of dropped steps). """
+        if self._pending is not None:
+            self.xsteps.append(self._pending[0])
+            self.ysteps.append(self._pending[1])
+            self._pending = None
+        return np.array(self.xsteps), np.array(self.ysteps), self.nsteps - len(self.xsteps)
+
+
+def _interpolation_knots(x, y, atol, rtol, fixed):
+    """ Greedy selection of knots for linear interpolation of ``y`` (within ``atol + rtol*abs(y)``).
+
+    Every interval between consecutive knots (which include the ones in ``fixed``) is
+    as long as found by doubling followed by bisection.
+    """
+    def _ok(i, j):  # linear interpolation from i to j reproduces points in between
+        w = (x[i+1:j] - x[i])/(x[j] - x[i])
+        yi = y[i] + w[:, None]*(y[j] - y[i])
+        return np.all(np.abs(yi - y[i+1:j]) <= atol + rtol*np.abs(y[i+1:j]))
+
+    knots = np.zeros(x.size, dtype=bool)
+    fixed_idx = np.flatnonzero(fixed)
+    for start, stop in zip(fixed_idx[:-1], fixed_idx[1:]):
+        i = start
+        while stop - i > 1:
+            step = 1
+            while i + 2*step <= stop and _ok(i, i + 2*step):
+                step *= 2
+            lo, hi = i + step, min(i + 2*step, stop + 1)  # _ok(i, lo), not _ok(i, hi) (or hi beyond stop)
+            while hi - lo > 1:
+                mid = (lo + hi)//2
+                if _ok(i, mid):
+                    lo = mid
+                else:
+                    hi = mid
+            knots[lo] = True
+            i = lo
+    return knots
+
+
 def integrate_auto_switch(odes, kw, x, y0, params=(), **kwargs):
     """ Auto-switching between formulations of ODE system.
 
@@ -949,3 +1571,147 @@ def chained_parameter_variation(subject, durations, y0, varied_params, default_p
                                             npoints=npoints, **integrate_kwargs)
 
     return out
+
+
+_integrate_many_systems = {}  # worker-process cache: digest of payload -> ODESys instance
+
+
+def _integrate_many_worker(payload, x, y0, params, kwargs):
+    key = hashlib.sha1(payload).hexdigest()
+    odesys = _integrate_many_systems.get(key, None)
+    if odesys is None:
+        odesys = pickle.loads(payload)
+        if not isinstance(odesys, ODESys):
+            odesys = odesys()  # factory
+        _integrate_many_systems.clear()  # only keep the most recent system around
+        _integrate_many_systems[key] = odesys
+    return [(r.xout, r.yout, r.params, r.info) for r in odesys.integrate(x, y0, params, **kwargs)]
+
+
+def _is_shared(arr):
+    if isinstance(arr, dict):  # by name (cf. ODESys.to_arrays): shared unless values are varied
+        return all(np.ndim(v) == 0 for v in arr.values())
+    if hasattr(arr, '__iter__') and not hasattr(arr, '__len__'):
+        return False  # iterable (e.g. generator) of rows
+    if isinstance(arr, (list, tuple)) and len(arr) > 0 and isinstance(arr[0], dict):
+        return False  # rows by name
+    return np.ndim(arr) <= 1
+
+
+def _dict_rows(dct):
+    """ Splits a dict with varied (array) values into one dict per instance. """
+    n = max(len(v) for v in dct.values() if np.ndim(v) > 0)
+    return [{k: v[idx] if np.ndim(v) > 0 else v for k, v in dct.items()} for idx in range(n)]
+
+
+def _stack_rows(rows):
+    if isinstance(rows[0], dict):
+        return {k: np.array([row[k] for row in rows]) for k in rows[0]}
+    return np.array(rows)
+
+
+def integrate_many(odesys, x, y0, params=(), nprocs=None, chunksize=None, executor=None, **kwargs):
+    """ Integrate many instances of an ODE system using a pool of worker processes.
+
+    The instances are split into chunks which are integrated (using :meth:`ODESys.integrate`)
+    in worker processes. Each worker process builds its copy of the system only once.
+
+    Parameters
+    ----------
+    odesys : :class:`ODESys` instance or callable
+        Either a picklable system (e.g. :class:`pyodesys.symbolic.SymbolicSys` which drops
+        its compiled callbacks when pickled and regenerates them when unpickled), or a picklable
+        callable (e.g. a module level function or a ``functools.partial`` of one) taking no
+        arguments and returning the system. The latter is needed for systems with
+        pre-/post-processors which are closures (e.g. :class:`PartiallySolvedSystem`).
+    x : array_like
+        Either shared by all instances (1D) or one row per instance (2D or an iterable of rows).
+    y0 : array_like or dict
+        One row per instance (2D or an iterable, e.g. a generator, of rows).
+    params : array_like or dict
+        Either shared by all instances (1D) or one row per instance (2D or an iterable of rows).
+        Rows may be dicts (for systems with ``dep_by_name``/``par_by_name``), a dict with
+        array values gives one instance per element.
+    nprocs : int
+        Number of worker processes. Default: ``PYODESYS_NPROCS`` or the number of CPUs.
+    chunksize : int
+        Number of instances per task. Default: even split into four chunks per process
+        (or 1 if the number of instances is not known in advance).
+    executor : ``concurrent.futures.Executor`` instance (optional)
+        Executor to submit chunks to (``nprocs`` should then be its number of workers,
+        default: the number of CPUs).
+    \\*\\*kwargs :
+        Keyword arguments passed on to :meth:`ODESys.integrate`.
+
+    Returns
+    -------
+    List of :class:`pyodesys.results.Result` instances (in the same order as the instances).
+
+    Examples
+    --------
+    >>> from pyodesys.symbolic import SymbolicSys
+    >>> odesys = SymbolicSys.from_callback(lambda t, y, p: [-p[0]*y[0]], 1, 1)
+    >>> results = integrate_many(odesys, [0, 1, 2], [[1], [2], [3]], [.5], nprocs=2)
+    >>> print(round(results[2].yout[-1, 0], 5))
+    1.10364
+
+    """
+    if isinstance(odesys, ODESys):
+        parent_sys = odesys
+    else:
+        parent_sys = odesys()
+    payload = pickle.dumps(odesys, protocol=pickle.HIGHEST_PROTOCOL)
+
+    if nprocs is None:
+        if executor is None:
+            nprocs = int(os.environ.get('PYODESYS_NPROCS', '0')) or multiprocessing.cpu_count()
+        else:
+            nprocs = multiprocessing.cpu_count()
+    if isinstance(y0, dict) and not _is_shared(y0):
+        y0 = _dict_rows(y0)
+    if isinstance(params, dict) and not _is_shared(params):
+        params = _dict_rows(params)
+    if chunksize is None:
+        if hasattr(y0, '__len__') and not isinstance(y0, dict):
+            chunksize = max(1, -(-len(y0) // (4*nprocs)))
+        else:
+            chunksize = 1
+
+    if np.ndim(x) == 0:
+        x = (0*x, x)  # cf. ODESys.to_arrays
+    xs = itertools.repeat(x) if _is_shared(x) else iter(x)
+    ps = itertools.repeat(params) if _is_shared(params) else iter(params)
+    if isinstance(y0, dict):  # shared by the varied x and/or params (otherwise a single instance)
+        ys = iter([y0]) if _is_shared(x) and _is_shared(params) else itertools.repeat(y0)
+    else:
+        ys = iter(y0)
+    rows = zip(xs, ys, ps)
+
+    def _chunks():
+        while True:
+            chunk = list(itertools.islice(rows, chunksize))
+            if not chunk:
+                return
+            yield tuple(_stack_rows(col) for col in zip(*chunk))
+
+    def _collect(future):
+        for xout, yout, _params, info in future.result():
+            results.append(Result(xout, yout, _params, info, parent_sys))
+
+    def _run(pool):
+        pending = deque()  # bounded number of chunks in flight (y0 may be a generator)
+        for chunk in _chunks():
+            pending.append(pool.submit(_integrate_many_worker, payload, *(chunk + (kwargs,))))
+            if len(pending) >= 2*nprocs:
+                _collect(pending.popleft())
+        while pending:
+            _collect(pending.popleft())
+
+    results = []
+    if executor is None:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=nprocs) as pool:
+            _run(pool)
+    else:
+        _run(executor)
+    return results
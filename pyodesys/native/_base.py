@@ -4,17 +4,21 @@ from __future__ import (absolute_import, division, print_function)
 from datetime import datetime as dt
 from functools import reduce
 import logging
+import multiprocessing
 from operator import add
 import os
+import re
 import shutil
 import sys
 import tempfile
+import time
 
 
 import numpy as np
 import pkg_resources
 
 from ..symbolic import SymbolicSys
+from ..util import _content_hash
 from .. import __version__
 
 try:
@@ -27,11 +31,12 @@ else:
     cachedir = appdirs.user_cache_dir(appname, appauthor)
 
 try:
-    from pycodeexport.codeexport import Cpp_Code
+    from pycodeexport.codeexport import Cpp_Code, Interceptor
 except ImportError:
     Cpp_Code = object
     compile_sources = None
 else:
+    from pycodeexport.util import render_mako_template_to
     from pycompilation import compile_sources
 
 
@@ -49,6 +54,193 @@ _compile_kwargs = {
 _ext_suffix = '.so'  # sysconfig.get_config_var('EXT_SUFFIX')
 _obj_suffix = '.o'  # os.path.splitext(_ext_suffix)[0] + '.o'  # '.obj'
 
+_generated_line = "This file was generated using pyodesys-"
+_cse_token_regex = re.compile(r'\bcse\d+\b')
+
+
+def _chunks(cses, entries, chunk_size):
+    """ Splits ``entries`` into chunks which only carry the common subexpressions they need.
+
+    Parameters
+    ----------
+    cses : list of (token, code) pairs (in order of evaluation)
+    entries : list of (key, code) pairs
+    chunk_size : int
+        Maximum number of entries per chunk.
+
+    Returns
+    -------
+    ``None`` if ``entries`` fit in one chunk, otherwise a list of dicts with the keys
+    ``'cses'`` and ``'exprs'``.
+    """
+    if chunk_size <= 0 or len(entries) <= chunk_size:
+        return None
+    cse_deps = {token: set(_cse_token_regex.findall(code)) for token, code in cses}
+    result = []
+    for offset in range(0, len(entries), chunk_size):
+        chunk_entries = entries[offset:offset+chunk_size]
+        result.append({
+            'cses': _needed_cses(cses, cse_deps, [code for _, code in chunk_entries]),
+            'exprs': chunk_entries
+        })
+    return result
+
+
+def _needed_cses(cses, cse_deps, codes):
+    needed = set()
+    for code in codes:
+        needed.update(_cse_token_regex.findall(code))
+    for token, _ in reversed(cses):
+        if token in needed:
+            needed.update(cse_deps[token])
+    return [(token, code) for token, code in cses if token in needed]
+
+
+def _csr_pattern(exprs, ny):
+    """ Compressed sparse row pattern of a (printed) dense jacobian, the diagonal is always included.
+
+    Parameters
+    ----------
+    exprs : dict mapping (ri, ci) to code (``'0'`` for structural zeros)
+    ny : int
+
+    Returns
+    -------
+    Length 3 tuple: ``rowptr, colidx, diag`` (``diag[i]`` is the position of element (i, i))
+    """
+    rowptr, colidx, diag = [0], [], []
+    for ri in range(ny):
+        for ci in range(ny):
+            if ri == ci:
+                diag.append(len(colidx))
+            elif exprs[ri, ci] == '0':
+                continue
+            colidx.append(ci)
+        rowptr.append(len(colidx))
+    return rowptr, colidx, diag
+
+
+def _strongly_connected(rowptr, colidx):
+    """ Strongly connected components (Tarjan's algorithm) of the graph of a sparsity pattern.
+
+    Each component is a block of mutually coupled variables, the blocks are sorted
+    by their smallest index.
+    """
+    n = len(rowptr) - 1
+    index, low, onstack = [None]*n, [0]*n, [False]*n
+    stack, blocks, counter = [], [], 0
+    for root in range(n):
+        if index[root] is not None:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        onstack[root] = True
+        work = [(root, rowptr[root])]
+        while work:
+            node, k = work[-1]
+            if k < rowptr[node+1]:
+                work[-1] = (node, k + 1)
+                succ = colidx[k]
+                if index[succ] is None:
+                    index[succ] = low[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    onstack[succ] = True
+                    work.append((succ, rowptr[succ]))
+                elif onstack[succ]:
+                    low[node] = min(low[node], index[succ])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                block = []
+                while True:
+                    member = stack.pop()
+                    onstack[member] = False
+                    block.append(member)
+                    if member == node:
+                        break
+                blocks.append(sorted(block))
+    return sorted(blocks)
+
+
+def _c_printer(backend, printer):
+    """ Returns a callback printing expressions as C code. """
+    from sym import Backend
+    be = Backend(backend)
+    if printer == 'symengine':
+        try:
+            import symengine
+        except ImportError:
+            return be.ccode
+
+        def _ccode(expr):
+            try:
+                return symengine.ccode(symengine.sympify(expr))
+            except Exception:  # e.g. functions unknown to symengine
+                return be.ccode(expr)
+        return _ccode
+    elif printer == 'backend':
+        return be.ccode
+    else:
+        raise ValueError("Unknown printer: %s" % printer)
+
+
+def _print_group(backend, printer, cses, exprs, renames):
+    """ Prints common subexpressions & expressions of one group (e.g. the jacobian).
+
+    Tokens in ``renames`` (e.g. ``'cse3'``) are replaced in the printed code (e.g. by ``'m_p_cse[0]'``).
+    Module level function (picklable) for use with process pools.
+
+    Returns
+    -------
+    Length 3 tuple: ``[(name, code), ...], [code, ...], dict(ncse=..., ops=..., time=...)``
+    """
+    time_start = time.time()
+    ccode = _c_printer(backend, printer)
+    if renames:
+        def _code(expr):
+            return _cse_token_regex.sub(lambda m: renames.get(m.group(0), m.group(0)), ccode(expr))
+    else:
+        _code = ccode
+    cses_code = [(str(symb), _code(expr)) for symb, expr in cses]
+    exprs_code = [_code(expr) for expr in exprs]
+    from sym import Backend
+    count_ops = getattr(Backend(backend), 'count_ops', None)
+    if count_ops is None:
+        ops = -1
+    else:
+        ops = sum(count_ops(expr) for expr in [expr for _, expr in cses] + list(exprs))
+    return cses_code, exprs_code, {'ncse': len(cses), 'ops': int(ops), 'time': time.time() - time_start}
+
+
+def _module_cache_dir():
+    return os.environ.get('PYODESYS_NATIVE_CACHE_DIR', None) or os.path.join(cachedir, 'modules')
+
+
+def _evict_module_cache(root, maxsize):
+    """ Removes the least recently used modules in ``root`` keeping at most ``maxsize``. """
+    try:
+        entries = [os.path.join(root, name) for name in os.listdir(root)]
+    except OSError:
+        return
+    entries = [path for path in entries if os.path.isdir(path)]
+    if len(entries) <= maxsize:
+        return
+
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:  # removed by another process
+            return 0.0
+
+    for path in sorted(entries, key=_mtime)[:len(entries) - maxsize]:
+        logger.info("Evicting cached native module: %s" % path)
+        shutil.rmtree(path, ignore_errors=True)
+
 
 class _NativeCodeBase(Cpp_Code):
     """ Base class for generated code.
@@ -60,19 +252,23 @@ class _NativeCodeBase(Cpp_Code):
     wrapper_name = None
     basedir = os.path.dirname(__file__)
     templates = ('sources/odesys_anyode_template.cpp',)
+    translation_units = ('main', 'rhs', 'jac_cmaj', 'jac_rmaj', 'jac_banded', 'jtimes', 'prec')
     _written_files = ()
     build_files = ()
-    source_files = ('odesys_anyode.cpp',)
-    obj_files = ('odesys_anyode.o',)
+    source_files = tuple('odesys_anyode%s.cpp' % ('' if tu == 'main' else '_' + tu) for tu in translation_units)
+    obj_files = tuple('odesys_anyode%s.o' % ('' if tu == 'main' else '_' + tu) for tu in translation_units)
     _save_temp = False
 
-    namespace_default = {'p_anon': None}
+    namespace_default = {'p_anon': None, 'p_tu': None, 'p_support_jtimes': False, 'p_support_prec': False,
+                         'p_prec_blocks': None}
     namespace = {
         'p_includes': ['"odesys_anyode.hpp"'],
         'p_support_recoverable_error': False,
         'p_jacobian_set_to_zero_by_solver': False,
     }
     _support_roots = False
+    _cached_binary_path = None
+    codegen_info = None
     # `namespace_override` is set in init
     # `namespace_extend` is set in init
 
@@ -114,83 +310,186 @@ class _NativeCodeBase(Cpp_Code):
                     raise OSError("Failed to place prebuilt file at: %s" % _dest)
         super(_NativeCodeBase, self).__init__(*args, logger=logger, **kwargs)
 
+    def _dependency_versions(self):
+        """ Versions (and configuration) of the libraries the extension module is built against. """
+        return [np.__version__]
+
+    def _module_hash(self):
+        """ Content hash of everything which goes into the compiled extension module. """
+        parts = [__version__, sys.version, self.wrapper_name, sorted(self.compile_kwargs.items()),
+                 [os.environ.get(k, None) for k in ('CXX', 'CXXFLAGS', 'LDFLAGS')],  # compiler & flags
+                 self._dependency_versions()]
+        srcdir = pkg_resources.resource_filename(__name__, 'sources')
+        for incdir in [srcdir] + [d for d in self.compile_kwargs.get('include_dirs', []) if d != srcdir]:
+            for root, _, files in sorted(os.walk(incdir)):  # e.g. headers of pycvodes & AnyODE
+                for name in sorted(files):
+                    if os.path.splitext(name)[1] in ('.h', '.hpp', '.pxd', '.pyx'):
+                        with open(os.path.join(root, name), 'rb') as ifh:
+                            parts.append(ifh.read())
+        for name in self.source_files:
+            with open(os.path.join(self._tempdir, name), 'rt') as ifh:  # time stamp of rendering is not significant
+                parts.append(''.join(line for line in ifh if _generated_line not in line))
+        return _content_hash(*parts)
+
+    def compile_and_import_binary(self):
+        """ Compiles (unless already cached) and imports the extension module.
+
+        Compiled modules are stored in a directory named by :meth:`_module_hash` under
+        ``PYODESYS_NATIVE_CACHE_DIR`` (default: a subdirectory of the user's cache directory),
+        hence an unchanged system is not recompiled (e.g. after a restart of the interpreter).
+        At most ``PYODESYS_NATIVE_CACHE_SIZE`` modules are kept (default: 64, least recently
+        used are evicted first, 0 disables the cache).
+        """
+        maxsize = int(os.environ.get('PYODESYS_NATIVE_CACHE_SIZE', '64'))
+        if maxsize <= 0:
+            return super(_NativeCodeBase, self).compile_and_import_binary()
+        root = _module_cache_dir()
+        dest_dir = os.path.join(root, self._module_hash())
+        dest = os.path.join(dest_dir, self.so_file)
+        if os.path.exists(dest):
+            logger.info("Using cached native module: %s" % dest)
+            os.utime(dest_dir, None)
+        else:
+            self._compile()
+            if not os.path.isdir(dest_dir):
+                try:
+                    os.makedirs(dest_dir)
+                except OSError:  # created concurrently by another process
+                    if not os.path.isdir(dest_dir):
+                        raise
+            fd, tmp = tempfile.mkstemp(dir=dest_dir)
+            os.close(fd)
+            shutil.copy(os.path.join(self._tempdir, self.so_file), tmp)
+            getattr(os, 'replace', os.rename)(tmp, dest)
+            _evict_module_cache(root, maxsize)
+        self._cached_binary_path = dest
+        return Interceptor(dest)
+
+    @property
+    def binary_path(self):
+        if self._cached_binary_path is not None:
+            return self._cached_binary_path
+        return os.path.join(self._tempdir, self.so_file)
+
     def variables(self):
+        """ Namespace for rendering the template.
+
+        All expressions (rhs, jacobian, invariants, first step & roots) go through a single
+        common subexpression elimination (disabled by ``PYODESYS_NATIVE_CSE=0``). Subexpressions
+        depending only on parameters are evaluated once in the constructor (``m_p_cse``), the
+        others are distributed to the groups (functions) needing them. Printing of the groups
+        is done in ``PYODESYS_NATIVE_CODEGEN_JOBS`` processes (default: 1) using the printer of
+        symengine when available (``PYODESYS_NATIVE_PRINTER='backend'`` uses the printer of the
+        backend of the system). Timings and operation counts are stored in :attr:`codegen_info`.
+        """
         ny = self.odesys.ny
-        if self.odesys.band is not None:
-            raise NotImplementedError("Banded jacobian not yet implemented.")
-
-        subsd = {k: self.odesys.be.Symbol('y[%d]' % idx) for
-                 idx, k in enumerate(self.odesys.dep)}
-        subsd[self.odesys.indep] = self.odesys.be.Symbol('x')
-        subsd.update({k: self.odesys.be.Symbol('m_p[%d]' % idx) for
-                      idx, k in enumerate(self.odesys.params)})
-
-        def _ccode(expr):
-            return self.odesys.be.ccode(expr.xreplace(subsd))
-
-        all_invar = tuple(self.odesys.all_invariants())
+        if self.odesys.sparse:
+            raise NotImplementedError("Sparse jacobian not supported by the AnyODE interface.")
+        be = self.odesys.be
+        info = {'groups': {}}
+        time_start = time.time()
+
+        subsd = {k: be.Symbol('y[%d]' % idx) for idx, k in enumerate(self.odesys.dep)}
+        if self.odesys.indep is not None:
+            subsd[self.odesys.indep] = be.Symbol('x')
+        subsd.update({k: be.Symbol('m_p[%d]' % idx) for idx, k in enumerate(self.odesys.params)})
+
+        jtimes = self.odesys.get_jtimes() if self.namespace.get('p_support_jtimes', False) else False
+        if jtimes is not False:
+            subsd.update({vi: be.Symbol('vec[%d]' % idx) for idx, vi in enumerate(jtimes[0])})
         jac = self.odesys.get_jac()
-        if jac is False:
-            all_exprs = self.odesys.exprs + all_invar
-        else:
-            jac_dfdx = list(reduce(add, jac.tolist() + self.odesys.get_dfdx().tolist()))
-            all_exprs = self.odesys.exprs + tuple(jac_dfdx) + all_invar
-
-        def common_cse_symbols():
-            idx = 0
-            while True:
-                yield self.odesys.be.Symbol('m_p_cse[%d]' % idx)
-                idx += 1
-
+        njac = 0 if jac is False else len(jac)  # (1 + ml + mu)*ny when banded, otherwise ny*ny
+        first_step = self.odesys.first_step_expr
+        groups = [
+            ('rhs', list(self.odesys.exprs)),
+            ('jac', [] if jac is False else list(reduce(add, jac.tolist() + self.odesys.get_dfdx().tolist()))),
+            ('invariants', list(self.odesys.all_invariants())),
+            ('first_step', [] if first_step is None else [first_step]),
+            ('roots', list(self.odesys.roots or ())),
+            ('jtimes', [] if jtimes is False else list(jtimes[1])),
+        ]
+        all_exprs = [expr.xreplace(subsd) for _, exprs in groups for expr in exprs]
+        info['time_substitute'] = time.time() - time_start
+
+        time_cse = time.time()
         if os.getenv('PYODESYS_NATIVE_CSE', '1') == '1':
-            cse_cb = self.odesys.be.cse
+            cses, all_exprs = be.cse(all_exprs, symbols=be.numbered_symbols('cse'))
         else:
             logger.info("Not using common subexpression elimination (disabled by PYODESYS_NATIVE_CSE)")
-            cse_cb = lambda exprs, **kwargs: ([], exprs)
-
-        try:
-            common_cses, common_exprs = cse_cb(
-                all_exprs, symbols=self.odesys.be('cse'),
-                ignore=(self.odesys.indep,) + self.odesys.dep)
-        except TypeError:  # old version of SymPy does not support ``ignore``
-            common_cses, common_exprs = [], all_exprs
-        common_cse_subs = {}
-        comm_cse_symbs = common_cse_symbols()
-        for symb, subexpr in common_cses:
-            for expr in common_exprs:
-                if symb in expr.free_symbols:
-                    common_cse_subs[symb] = next(comm_cse_symbs)
-                    break
-        common_cses = [(x.xreplace(common_cse_subs), expr.xreplace(common_cse_subs))
-                       for x, expr in common_cses]
-        common_exprs = [expr.xreplace(common_cse_subs) for expr in common_exprs]
-
-        rhs_cses, rhs_exprs = cse_cb(
-            common_exprs[:len(self.odesys.exprs)],
-            symbols=self.odesys.be.numbered_symbols('cse'))
-
-        if jac is not False:
-            jac_cses, jac_exprs = cse_cb(
-                common_exprs[len(self.odesys.exprs):
-                             len(self.odesys.exprs)+len(jac_dfdx)],
-                symbols=self.odesys.be.numbered_symbols('cse'))
-
-        first_step = self.odesys.first_step_expr
-        if first_step is not None:
-            first_step_cses, first_step_exprs = cse_cb(
-                [first_step],
-                symbols=self.odesys.be.numbered_symbols('cse'))
-
-        if self.odesys.roots is not None:
-            roots_cses, roots_exprs = cse_cb(
-                self.odesys.roots,
-                symbols=self.odesys.be.numbered_symbols('cse'))
-        if all_invar:
-            invar_cses, invar_exprs = cse_cb(
-                common_exprs[len(self.odesys.exprs)+len(jac_dfdx):
-                             len(self.odesys.exprs)+len(jac_dfdx)+len(all_invar)],
-                symbols=self.odesys.be.numbered_symbols('cse')
-            )
+            cses = []
+        info['time_cse'] = time.time() - time_cse
+
+        time_partition = time.time()
+        param_symbs = set(subsd[k] for k in self.odesys.params)
+        cse_symbs = set(symb for symb, _ in cses)
+        cse_deps, hoisted = {}, set()
+        for symb, expr in cses:
+            free = set(expr.free_symbols)
+            cse_deps[symb] = free & cse_symbs
+            if free <= (param_symbs | hoisted):
+                hoisted.add(symb)  # only depends on parameters: evaluated in the constructor
+
+        group_args, offset, referenced = [], 0, set()
+        for name, exprs in groups:
+            group_exprs = all_exprs[offset:offset+len(exprs)]
+            offset += len(exprs)
+            needed = set()
+            for expr in group_exprs:
+                needed.update(set(expr.free_symbols) & cse_symbs)
+            for symb, _ in reversed(cses):
+                if symb in needed and symb not in hoisted:
+                    needed.update(cse_deps[symb])
+            referenced.update(needed & hoisted)
+            group_args.append((name, [(symb, expr) for symb, expr in cses
+                                      if symb in needed and symb not in hoisted], group_exprs))
+        common_cses = [(symb, expr) for symb, expr in cses if symb in hoisted]
+        renames = {}
+        for symb, _ in common_cses:
+            if symb in referenced:
+                renames[str(symb)] = 'm_p_cse[%d]' % len(renames)
+        info['time_partition'] = time.time() - time_partition
+
+        time_groups = time.time()
+        printer = os.environ.get('PYODESYS_NATIVE_PRINTER', 'symengine')
+        backend = self.odesys._backend_name()
+        work = [(backend, printer, cses_, exprs, renames) for _, cses_, exprs in group_args]
+        work.append((backend, printer, common_cses, [], renames))
+        njobs = int(os.environ.get('PYODESYS_NATIVE_CODEGEN_JOBS', '1'))
+        if njobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=min(njobs, len(work))) as pool:
+                printed = list(pool.map(_print_group, *zip(*work)))
+        else:
+            printed = [_print_group(*args) for args in work]
+        info['time_groups'] = time.time() - time_groups
+
+        code = {}
+        for (name, _, _), (cses_code, exprs_code, group_info) in zip(group_args, printed[:-1]):
+            code[name] = {'cses': cses_code, 'exprs': exprs_code}
+            info['groups'][name] = group_info
+        common_code, _, info['groups']['common'] = printed[-1]
+        info['nsubs'] = len(renames)
+        info['ops'] = sum(group_info['ops'] for group_info in info['groups'].values())
+        info['time_total'] = time.time() - time_start
+        self.codegen_info = info
+        logger.info("Generated code for %d expressions (%d operations, %d common subexpressions) in %.3g s" % (
+            len(all_exprs), info['ops'], len(cses), info['time_total']))
+
+        jac_code = code['jac']['exprs']
+        if jac is False:
+            jac_dense, jac_banded = None, None
+        elif self.odesys.band is None:
+            jac_banded = None
+            jac_dense = {(idx//ny, idx % ny): c for idx, c in enumerate(jac_code[:njac])}
+        else:
+            # Packed (LAPACK style) storage: row ``mu + ri - ci`` holds element (ri, ci)
+            ml, mu = self.odesys.band
+            jac_banded = {(idx//ny, idx % ny): c for idx, c in enumerate(jac_code[:njac])}
+            jac_dense = {(ri, ci): '0' for ri in range(ny) for ci in range(ny)}
+            for (bi, ci), c in jac_banded.items():
+                ri = bi - mu + ci
+                if 0 <= ri < ny:
+                    jac_dense[ri, ci] = c
 
         ns = dict(
             _message_for_rendered=[
@@ -200,31 +499,23 @@ class _NativeCodeBase(Cpp_Code):
             ],
             p_odesys=self.odesys,
             p_common={
-                'cses': [(symb.name, _ccode(expr)) for symb, expr in common_cses],
-                'nsubs': len(common_cse_subs)
-            },
-            p_rhs={
-                'cses': [(symb.name, _ccode(expr)) for symb, expr in rhs_cses],
-                'exprs': list(map(_ccode, rhs_exprs))
+                'cses': [(renames.get(name, name), c) for name, c in common_code],
+                'nsubs': len(renames)
             },
+            p_rhs=code['rhs'],
             p_jac=None if jac is False else {
-                'cses': [(symb.name, _ccode(expr)) for symb, expr in jac_cses],
-                'exprs': {(idx//ny, idx % ny): _ccode(expr)
-                          for idx, expr in enumerate(jac_exprs[:ny*ny])},
-                'dfdt_exprs': list(map(_ccode, jac_exprs[ny*ny:]))
+                'cses': code['jac']['cses'],
+                'exprs': jac_dense,
+                'banded': jac_banded,
+                'dfdt_exprs': jac_code[njac:]
             },
             p_first_step=None if first_step is None else {
-                'cses': first_step_cses,
-                'expr': _ccode(first_step_exprs[0]),
-            },
-            p_roots=None if self.odesys.roots is None else {
-                'cses': [(symb.name, _ccode(expr)) for symb, expr in roots_cses],
-                'exprs': list(map(_ccode, roots_exprs))
-            },
-            p_invariants=None if all_invar == () else {
-                'cses': [(symb.name, _ccode(expr)) for symb, expr in invar_cses],
-                'exprs': list(map(_ccode, invar_exprs))
+                'cses': code['first_step']['cses'],
+                'expr': code['first_step']['exprs'][0],
             },
+            p_roots=None if self.odesys.roots is None else code['roots'],
+            p_invariants=None if not code['invariants']['exprs'] else code['invariants'],
+            p_jtimes=None if jtimes is False else code['jtimes'],
             p_nroots=self.odesys.nroots,
             p_constructor=[],
             p_get_dx_max=False,
@@ -234,43 +525,231 @@ class _NativeCodeBase(Cpp_Code):
         ns.update(self.namespace_override)
         for k, v in self.namespace_extend.items():
             ns[k].extend(v)
+        self._prec_namespace(ns)
+        self._chunk_namespace(ns)
         return ns
 
+    def _prec_namespace(self, ns):
+        """ Adds ``p_prec``: the sparsity pattern of the jacobian (compressed sparse rows) & its
+        non-zero elements, used by the generated preconditioners (diagonal, block-Jacobi & ILU(0)).
+
+        The blocks of the block-Jacobi preconditioner are given by ``p_prec_blocks`` (list of
+        lists of indices), by default the strongly coupled blocks of the jacobian are used.
+        """
+        p_jac = ns['p_jac']
+        if not ns['p_support_prec'] or not isinstance(p_jac, dict) or 'p_prec' in ns:
+            ns.setdefault('p_prec', None)
+            return
+        ny = self.odesys.ny
+        rowptr, colidx, diag = _csr_pattern(p_jac['exprs'], ny)
+        blocks = ns['p_prec_blocks']
+        if blocks is None:
+            blocks = _strongly_connected(rowptr, colidx)
+        elif sorted(idx for block in blocks for idx in block) != list(range(ny)):
+            raise ValueError("p_prec_blocks needs to partition range(%d)" % ny)
+        exprs = [p_jac['exprs'][ri, colidx[k]] for ri in range(ny) for k in range(rowptr[ri], rowptr[ri+1])]
+        cse_deps = {token: set(_cse_token_regex.findall(code)) for token, code in p_jac['cses']}
+        ns['p_prec'] = {
+            'cses': _needed_cses(p_jac['cses'], cse_deps, exprs),
+            'exprs': exprs,
+            'rowptr': rowptr,
+            'colidx': colidx,
+            'diag': diag,
+            'blocks': [list(block) for block in blocks],
+        }
+
+    def _chunk_namespace(self, ns):
+        """ Adds ``chunks`` to ``p_rhs``, ``p_jac``, ``p_jtimes`` & ``p_prec`` for function bodies longer than
+        ``PYODESYS_NATIVE_CHUNK_SIZE`` (default: 500) assignments (0 disables chunking). """
+        chunk_size = int(os.environ.get('PYODESYS_NATIVE_CHUNK_SIZE', '500'))
+        p_jac = ns['p_jac']
+        for key in ('p_rhs', 'p_jtimes', 'p_prec'):
+            if isinstance(ns.get(key, None), dict) and 'chunks' not in ns[key]:
+                ns[key] = dict(ns[key], chunks=_chunks(ns[key]['cses'], list(enumerate(ns[key]['exprs'])), chunk_size))
+        if isinstance(p_jac, dict) and 'chunks' not in p_jac:
+            skip_zero = ns['p_jacobian_set_to_zero_by_solver']
+            entries = [(k, v) for k, v in sorted(p_jac['exprs'].items()) if not (skip_zero and v == '0')]
+            p_jac = dict(p_jac, chunks=_chunks(p_jac['cses'], entries, chunk_size), banded_chunks=None)
+            if p_jac['chunks'] is not None:
+                cse_deps = {token: set(_cse_token_regex.findall(code)) for token, code in p_jac['cses']}
+                p_jac['dfdt_cses'] = _needed_cses(p_jac['cses'], cse_deps, p_jac['dfdt_exprs'])
+            if p_jac.get('banded', None) is not None:
+                ml, mu = self.odesys.band
+                entries = [((bi, ci), v) for (bi, ci), v in sorted(p_jac['banded'].items())
+                           if 0 <= bi - mu + ci < self.odesys.ny and not (skip_zero and v == '0')]
+                p_jac['banded_chunks'] = _chunks(p_jac['cses'], entries, chunk_size)
+            ns['p_jac'] = p_jac
+
+    def write_code(self):
+        """ Renders one source file per translation unit (see ``translation_units``). """
+        for path in self._cached_files:
+            rel_path = os.path.join(self._tempdir, path)
+            if os.path.exists(rel_path):
+                os.unlink(rel_path)
+        for path in self.build_files:
+            dstpath = os.path.join(self._tempdir, os.path.basename(path))
+            shutil.copy(os.path.join(self.basedir, path), dstpath)
+            self._written_files.append(dstpath)
+
+        subs = self.variables()
+        for path in self.templates:
+            stem, ext = os.path.splitext(os.path.basename(path).replace('_template', ''))
+            for tu in self.translation_units:
+                outpath = os.path.join(self._tempdir, '%s%s%s' % (stem, '' if tu == 'main' else '_' + tu, ext))
+                render_mako_template_to(os.path.join(self.basedir, path), outpath, dict(subs, p_tu=tu))
+                self._written_files.append(outpath)
+
+    def _compile_obj(self, sources=None):
+        """ Compiles the translation units in parallel
+        (``PYODESYS_NATIVE_COMPILE_JOBS`` processes, default: number of cpus). """
+        sources = sources or self.source_files
+        njobs = int(os.environ.get('PYODESYS_NATIVE_COMPILE_JOBS', '0')) or multiprocessing.cpu_count()
+        if njobs == 1 or len(sources) == 1:
+            return super(_NativeCodeBase, self)._compile_obj(sources)
+
+        def _compile_one(src):
+            return compile_sources([src], self.CompilerRunner, cwd=self._tempdir,
+                                   logger=self.logger, **self.compile_kwargs)
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(njobs, len(sources))) as pool:
+            return list(pool.map(_compile_one, sources))
+
 
 class _NativeSysBase(SymbolicSys):
+    """ Base class for symbolic systems integrated by generated native code.
+
+    Parameters
+    ----------
+    \*args :
+        See :class:`SymbolicSys`.
+    namespace_override : dict
+        Variables overriding those used when rendering the template.
+    namespace_extend : dict
+        Lists of values to append to those used when rendering the template.
+    async_compile : bool (default: False)
+        Render and compile the native code in a background thread. Until the extension
+        module has been built, :meth:`integrate` uses the callbacks of :class:`SymbolicSys`
+        with the corresponding Python integrator (``_native_name``, e.g. ``'cvode'``).
+        Errors from the build are raised by the first call to :meth:`integrate` after
+        the build finished (see also :meth:`wait_for_native`).
+    \*\*kwargs :
+        See :class:`SymbolicSys`.
+
+    """
 
     _NativeCode = None
     _native_name = None
+    _native_only_kwargs = ('get_dx_max_factor', 'error_outside_bounds', 'max_invariant_violation',
+                           'special_settings')
 
     def __init__(self, *args, **kwargs):
-        namespace_override = kwargs.pop('namespace_override', {})
-        namespace_extend = kwargs.pop('namespace_extend', {})
+        native_kwargs = dict(namespace_override=kwargs.pop('namespace_override', {}),
+                             namespace_extend=kwargs.pop('namespace_extend', {}))
+        async_compile = kwargs.pop('async_compile', False)
         if 'init_indep' not in kwargs:  # we need to trigger append_iv for when invariants are used
             kwargs['init_indep'] = True
             kwargs['init_dep'] = True
         super(_NativeSysBase, self).__init__(*args, **kwargs)
-        self._native = self._NativeCode(self,
-                                        namespace_override=namespace_override,
-                                        namespace_extend=namespace_extend)
+        if async_compile:
+            from concurrent.futures import ThreadPoolExecutor
+            self._native = None
+            # derive the lazily built expressions here: both the build and the fallback
+            # integration (Python callbacks) in this thread would otherwise assign them.
+            self.get_jac()
+            self.get_dfdx()
+            self.get_jtimes()
+            executor = ThreadPoolExecutor(max_workers=1)
+            self._native_future = executor.submit(self._build_native, native_kwargs)
+            executor.shutdown(wait=False)
+        else:
+            self._native_future = None
+            self._native = self._NativeCode(self, **native_kwargs)
+
+    def _build_native(self, native_kwargs):
+        native = self._NativeCode(self, **native_kwargs)
+        native.mod  # compiles and imports the extension module
+        self._native = native
+        return native
+
+    def _native_ready(self):
+        future = self._native_future
+        if future is None:
+            return True
+        if not future.done():
+            return False
+        future.result()  # raises exceptions from the build
+        return True
+
+    def wait_for_native(self, timeout=None):
+        """ Blocks until the native code (see ``async_compile``) is built.
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait at most (``None``: no limit).
+
+        Returns
+        -------
+        bool : whether the extension module is ready.
+        """
+        if self._native_future is not None:
+            from concurrent.futures import TimeoutError
+            try:
+                self._native_future.result(timeout=timeout)  # raises exceptions from the build
+            except TimeoutError:
+                return False
+        return True
+
+    def __getstate__(self):
+        self.wait_for_native()
+        state = super(_NativeSysBase, self).__getstate__()
+        state.pop('_native_future')
+        native = state.pop('_native')
+        state['_native_kwargs'] = dict(namespace_override=native.namespace_override,
+                                       namespace_extend=native.namespace_extend)
+        state['_native_binary_path'] = native.binary_path if native._mod is not None else None
+        return state
+
+    def __setstate__(self, state):
+        native_kwargs = state.pop('_native_kwargs')
+        binary_path = state.pop('_native_binary_path')
+        super(_NativeSysBase, self).__setstate__(state)
+        self._native_future = None
+        self._native = self._NativeCode(self, **native_kwargs)
+        if binary_path is not None and os.path.exists(binary_path):
+            self._native._mod = Interceptor(binary_path)  # reuse the already compiled module
 
     def integrate(self, *args, **kwargs):
         integrator = kwargs.pop('integrator', 'native')
         if integrator not in ('native', self._native_name):
             raise ValueError("Got incompatible kwargs integrator=%s" % integrator)
-        else:
+        elif self._native_ready():
             kwargs['integrator'] = 'native'
+        else:
+            logger.info("Native code not yet compiled, integrating using integrator=%s" % self._native_name)
+            for key in self._native_only_kwargs:
+                kwargs.pop(key, None)
+            kwargs['integrator'] = self._native_name
 
         return super(_NativeSysBase, self).integrate(*args, **kwargs)
 
     def _integrate_native(self, intern_x, intern_y0, intern_p, force_predefined=False,
-                          atol=1e-8, rtol=1e-8, nsteps=500, first_step=0.0, **kwargs):
+                          atol=1e-8, rtol=1e-8, nsteps=500, first_step=0.0, offsets=None, **kwargs):
         atol = np.atleast_1d(atol)
         y0 = np.ascontiguousarray(intern_y0, dtype=np.float64)
         params = np.ascontiguousarray(intern_p, dtype=np.float64)
         if atol.size != 1 and atol.size != self.ny:
             raise ValueError("atol needs to be of length 1 or %d" % self.ny)
 
-        if intern_x.shape[-1] == 2 and not force_predefined:
+        if offsets is not None:  # ragged predefined (flat intern_x)
+            yout, info = self._native.mod.integrate_predefined(
+                y0=y0, xout=np.ascontiguousarray(intern_x, dtype=np.float64), offsets=offsets,
+                params=params, atol=atol, rtol=rtol,
+                mxsteps=nsteps, dx0=first_step, **kwargs)
+            intern_xout = [intern_x[offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1)]
+            yout = [yout[offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1)]
+        elif intern_x.shape[-1] == 2 and not force_predefined:
             intern_xout, yout, info = self._native.mod.integrate_adaptive(
                 y0=y0,
                 x0=np.ascontiguousarray(intern_x[:, 0], dtype=np.float64),
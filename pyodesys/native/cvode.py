@@ -4,9 +4,14 @@ from __future__ import (absolute_import, division, print_function)
 import copy
 import os
 
+import numpy as np
+
+from ..results import BatchResult
+from ..symbolic import ForwardSensitivitySystem, AdjointSystem
 from ..util import import_
 from ._base import _NativeCodeBase, _NativeSysBase, _compile_kwargs
 
+pycvodes = import_('pycvodes')
 _config, get_include = import_('pycvodes', '_config', 'get_include')
 
 
@@ -16,7 +21,9 @@ class NativeCvodeCode(_NativeCodeBase):
     namespace = {
         'p_includes': ['"odesys_anyode_iterative.hpp"'],
         'p_support_recoverable_error': True,
-        'p_jacobian_set_to_zero_by_solver': True
+        'p_jacobian_set_to_zero_by_solver': True,
+        'p_support_jtimes': True,
+        'p_support_prec': True
     }
     _support_roots = True
 
@@ -28,16 +35,109 @@ class NativeCvodeCode(_NativeCodeBase):
             'PYODESYS_LAPACK', _config.env['LAPACK']).split(','))
         super(NativeCvodeCode, self).__init__(*args, **kwargs)
 
+    def _dependency_versions(self):
+        return super(NativeCvodeCode, self)._dependency_versions() + [
+            pycvodes.__version__, getattr(pycvodes, 'sundials_version', None), getattr(pycvodes, 'config', None)]
+
 
 class NativeCvodeSys(_NativeSysBase):
+    """ Symbolic system integrated by generated code using cvode (from pycvodes).
+
+    The iterative (Krylov) linear solvers (e.g. ``linear_solver=10`` with ``iter_type='newton'``)
+    are preconditioned using ``I - gamma*J`` where ``preconditioner`` (passed to :meth:`integrate`)
+    is one of:
+
+        - ``'dense'`` (default): singular value decomposition of the dense matrix.
+        - ``'diagonal'``: the diagonal only.
+        - ``'block_jacobi'``: LU factorization of the diagonal blocks (by default the strongly coupled
+          blocks of the jacobian, override with e.g. ``namespace_override={'p_prec_blocks': [[0, 1], [2]]}``).
+        - ``'ilu0'``: incomplete LU factorization (no fill-in) of the sparse matrix.
+
+    Multiple instances are distributed over OpenMP threads, :meth:`integrate` accepts:
+
+        - ``nthreads``: number of threads (default: environment variable ``ANYODE_NUM_THREADS``, or 1).
+        - ``schedule``: one of ``'dynamic'`` (default), ``'static'``, ``'guided'`` or ``'auto'``.
+        - ``chunk``: chunk size of the schedule (default: 0, i.e. that of the OpenMP runtime).
+
+    The thread which integrated an instance is reported as ``info['thread_id']`` and the wall time
+    spent by each thread (in seconds) as ``info['time_threads']``.
+
+    """
     _NativeCode = NativeCvodeCode
     _native_name = 'cvode'
+    _native_only_kwargs = _NativeSysBase._native_only_kwargs + ('preconditioner', 'schedule', 'chunk')
+    _nderiv_integrators = ('cvode', 'native')
+
+    def _integrate_native(self, *args, **kwargs):
+        if 'lband' in kwargs or 'uband' in kwargs or 'band' in kwargs:
+            raise ValueError("lband and uband set locally (set `band` at initialization instead)")
+        if self.band is not None:
+            kwargs['lband'], kwargs['uband'] = self.band
+        if self.jtimes:
+            kwargs.setdefault('with_jtimes', True)
+        if kwargs.get('preconditioner', 'dense') != 'dense' and self.get_jac() is False:
+            raise ValueError("Sparse preconditioners need the jacobian (jac=False)")
+        return super(NativeCvodeSys, self)._integrate_native(*args, **kwargs)
+
+    def integrate_ragged(self, xout, offsets, y0, params=(), atol=1e-8, rtol=1e-8, **kwargs):
+        """ Integrates several instances reporting at different numbers of points (predefined mode).
+
+        All instances are integrated in one (OpenMP parallel) call to the native module, without padding.
+
+        Parameters
+        ----------
+        xout : array_like
+            Output points of all instances (concatenated).
+        offsets : array_like of ints
+            Length ``n + 1``: instance ``i`` reports at ``xout[offsets[i]:offsets[i+1]]``.
+        y0 : sequence of length ``n``
+            Initial values of each instance (see :meth:`integrate`).
+        params : array_like or dict
+            Shared by all instances, or a sequence of length ``n``.
+        \\*\\*kwargs :
+            See :meth:`integrate`.
+
+        Returns
+        -------
+        :class:`pyodesys.results.BatchResult` with ``offsets`` (ragged layout).
+
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        xout = np.asarray(xout)
+        if offsets.ndim != 1 or offsets[0] != 0 or offsets[-1] != xout.size or np.any(np.diff(offsets) < 2):
+            raise ValueError("Incorrect ragged layout (every instance needs at least 2 points)")
+        n = offsets.size - 1
+        if len(y0) != n:
+            raise ValueError("Need one y0 per instance")
+        shared = isinstance(params, dict) or np.ndim(params) < 2 and not (
+            len(params) > 0 and isinstance(params[0], dict))
+        arrs = [self.pre_process(*self.to_arrays(xout[offsets[i]:offsets[i+1]], y0[i],
+                                                 params if shared else params[i])) for i in range(n)]
+        intern_x, intern_y0, intern_p = [np.concatenate([a[0] for a in arrs])] + [
+            np.array([a[k] for a in arrs]) for k in (1, 2)]
+        if self.append_iv:
+            intern_p = np.concatenate((intern_p, intern_y0), axis=-1)
+        if isinstance(atol, dict):
+            atol = [atol[k] for k in self.names]
+        self.wait_for_native()
+        intern_offsets = np.cumsum([0] + [a[0].size for a in arrs])
+        infos = self._integrate_native(intern_x, intern_y0, intern_p, atol=atol, rtol=rtol,
+                                       offsets=intern_offsets, **kwargs)
+        youts = [info.pop('internal_yout') for info in infos]
+        for info in infos:
+            del info['internal_xout'], info['internal_params']
+        return BatchResult(intern_x, np.concatenate(youts), intern_p, infos, self, intern_offsets)
 
     def as_standalone(self, out_file=None, compile_kwargs=None):
         from pycompilation.compilation import src2obj, link
         from pycodeexport.util import render_mako_template_to
         compile_kwargs = compile_kwargs or {}
-        impl_src = open([f for f in self._native._written_files if f.endswith('.cpp')][0], 'rt').read()
+        self.wait_for_native()
+        impl_path = render_mako_template_to(  # all translation units in one file
+            os.path.join(self._native.basedir, self._native.templates[0]),
+            os.path.join(self._native._tempdir, 'odesys_anyode_standalone_impl.cpp'),
+            self._native.variables())
+        impl_src = open(impl_path, 'rt').read()
         f = render_mako_template_to(
             os.path.join(os.path.dirname(__file__), 'sources/standalone_template.cpp'),
             '%s.cpp' % out_file, {'p_odesys': self, 'p_odesys_impl': impl_src})
@@ -46,3 +146,42 @@ class NativeCvodeSys(_NativeSysBase):
         objf = src2obj(f, **kw)
         kw['libraries'].append('boost_program_options')
         return link([objf], out_file, **kw)
+
+
+class NativeCvodeSensSys(ForwardSensitivitySystem, NativeCvodeSys):
+    """ Forward sensitivities (see :class:`pyodesys.symbolic.ForwardSensitivitySystem`)
+    integrated by generated code using cvode.
+
+    Examples
+    --------
+    >>> from pyodesys.symbolic import SymbolicSys
+    >>> odesys = SymbolicSys.from_callback(lambda x, y, p: [-p[0]*y[0]], 1, 1)
+    >>> native = NativeCvodeSensSys(odesys)  # doctest: +SKIP
+    >>> res = native.integrate(1.0, [2.0], [3.0])  # doctest: +SKIP
+    >>> res.sens.shape[1:]  # doctest: +SKIP
+    (1, 1)
+
+    """
+
+
+class NativeCvodeAdjointSys(AdjointSystem, NativeCvodeSys):
+    """ Adjoint system (see :class:`pyodesys.symbolic.AdjointSystem`) whose backward
+    integration is performed by generated code using cvode.
+
+    Examples
+    --------
+    >>> from pyodesys.symbolic import SymbolicSys
+    >>> odesys = SymbolicSys.from_callback(lambda x, y, p: [-p[0]*y[0]], 1, 1)
+    >>> native = NativeCvodeAdjointSys(odesys, final=odesys.dep[0])  # doctest: +SKIP
+    >>> G, grad_p, grad_y0, res = native.gradient(1.0, [2.0], [3.0], forward_kwargs=dict(
+    ...     integrator='cvode'))  # doctest: +SKIP
+
+    """
+
+    def _integrate_backward(self, tout, table, state, **kwargs):
+        for idx, par in enumerate(table):  # the generated code takes a single set of parameters
+            res = self.integrate([0, tout[idx+1] - tout[idx]], state, par, **kwargs)
+            if not res.info['success']:
+                raise RuntimeError("Backward integration failed (segment %d)" % idx)
+            state = res.yout[-1, :]
+        return state
@@ -6,6 +6,7 @@ import os
 from ..util import import_
 from ._base import _NativeCodeBase, _NativeSysBase, _compile_kwargs
 
+pygslodeiv2 = import_('pygslodeiv2')
 _config, get_include = import_('pygslodeiv2', '_config', 'get_include')
 
 
@@ -20,6 +21,9 @@ class NativeGSLCode(_NativeCodeBase):
         self.compile_kwargs['libraries'].extend(os.environ.get('PYODESYS_BLAS', _config.env['BLAS']).split(','))
         super(NativeGSLCode, self).__init__(*args, **kwargs)
 
+    def _dependency_versions(self):
+        return super(NativeGSLCode, self)._dependency_versions() + [pygslodeiv2.__version__]
+
 
 class NativeGSLSys(_NativeSysBase):
     _NativeCode = NativeGSLCode
@@ -18,6 +18,9 @@ class NativeOdeintCode(_NativeCodeBase):
         self.compile_kwargs['libraries'].extend(['m'])
         super(NativeOdeintCode, self).__init__(*args, **kwargs)
 
+    def _dependency_versions(self):
+        return super(NativeOdeintCode, self)._dependency_versions() + [pyodeint.__version__]
+
 
 class NativeOdeintSys(_NativeSysBase):
     _NativeCode = NativeOdeintCode
@@ -15,7 +15,7 @@ from libcpp.string cimport string
 cimport numpy as cnp
 from odesys_anyode_iterative cimport OdeSys
 from cvodes_cxx cimport lmm_from_name, iter_type_from_name
-from cvodes_anyode_parallel cimport multi_predefined, multi_adaptive
+from odesys_parallel cimport Schedule, multi_predefined, multi_adaptive
 
 import numpy as np
 
@@ -24,6 +24,9 @@ cdef extern from "numpy/arrayobject.h":
 
 cnp.import_array()  # Numpy C-API initialization
 
+_prec_kinds = {'dense': 0, 'diagonal': 1, 'block_jacobi': 2, 'ilu0': 3}
+_schedule_kinds = {'static': 1, 'dynamic': 2, 'guided': 3, 'auto': 4}  # cf. omp_sched_t
+
 
 from odesys_util cimport adaptive_return
 
@@ -64,7 +67,9 @@ def integrate_adaptive(cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] y0,
                        bool record_order=False, bool record_fpe=False,
                        double get_dx_max_factor=-1.0, bool error_outside_bounds=False,
                        double max_invariant_violation=0.0, vector[double] special_settings=[],
-                       bool autonomous_exprs=False, int nprealloc=500):
+                       bool autonomous_exprs=False, int nprealloc=500, int lband=-1, int uband=-1,
+                       str preconditioner='dense', unsigned int nderiv=0,
+                       int nthreads=0, str schedule='dynamic', int chunk=0):
     cdef:
         double ** xyout_arr = <double **>malloc(y0.shape[0]*sizeof(double*))
         int * td_arr = <int *>malloc(y0.shape[0]*sizeof(int))
@@ -75,9 +80,10 @@ def integrate_adaptive(cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] y0,
         string _lmm = method.lower().encode('UTF-8')
         string _iter_t = iter_type.lower().encode('UTF-8')
         vector[pair[int, vector[int]]] result
+        Schedule sched
         int maxl=0
         double eps_lin=0.0
-        unsigned nderiv=0,
+        int stride = 1 + y0.shape[1]*(nderiv + 1)
         cnp.ndarray[cnp.float64_t, ndim=1, mode='c'] _dx0
         cnp.ndarray[cnp.float64_t, ndim=1, mode='c'] _dx_min
         cnp.ndarray[cnp.float64_t, ndim=1, mode='c'] _dx_max
@@ -86,6 +92,13 @@ def integrate_adaptive(cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] y0,
     if np.isnan(y0).any():
         raise ValueError("NaN found in y0")
 
+    if preconditioner not in _prec_kinds:
+        raise ValueError("Unknown preconditioner: %s" % preconditioner)
+
+    if schedule not in _schedule_kinds:
+        raise ValueError("Unknown schedule: %s" % schedule)
+    sched.nthreads, sched.kind, sched.chunk = nthreads, _schedule_kinds[schedule], chunk
+
     if atol.size() == 1:
         atol.resize(y0.shape[y0.ndim-1], atol[0])
 
@@ -125,27 +138,41 @@ def integrate_adaptive(cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] y0,
         systems[idx].record_jac_xvals = record_jac_xvals
         systems[idx].record_order = record_order
         systems[idx].record_fpe = record_fpe
+        systems[idx].m_prec_kind = _prec_kinds[preconditioner]
+        if idx == 0 and (systems[0].get_mlower() != lband or systems[0].get_mupper() != uband):
+            msg = "Got lband=%d, uband=%d but the system was compiled for (%d, %d)" % (
+                lband, uband, systems[0].get_mlower(), systems[0].get_mupper())
+            del systems[0]
+            free(td_arr)
+            free(xyout_arr)
+            raise ValueError(msg)
         td_arr[idx] = nprealloc
-        xyout_arr[idx] = <double *>malloc(nprealloc*(y0.shape[1]+1)*sizeof(double))
+        xyout_arr[idx] = <double *>malloc(nprealloc*stride*sizeof(double))
         xyout_arr[idx][0] = x0[idx]
         for yi in range(y0.shape[1]):
             xyout_arr[idx][yi+1] = y0[idx, yi]
+        for yi in range(y0.shape[1] + 1, stride):
+            xyout_arr[idx][yi] = 0.0
 
     try:
         result = multi_adaptive[OdeSys](
             xyout_arr, td_arr,
             systems, atol, rtol, lmm_from_name(_lmm), <double *>xend.data, mxsteps,
-            &_dx0[0], &_dx_min[0], &_dx_max[0], with_jacobian, iter_type_from_name(_iter_t), linear_solver,
+            &_dx0[0], &_dx_min[0], &_dx_max[0], sched, with_jacobian, iter_type_from_name(_iter_t), linear_solver,
             maxl, eps_lin, nderiv, return_on_root, autorestart, return_on_error, with_jtimes
         )
+        time_threads = np.array(sched.thread_times)
         xout, yout = [], []
         for idx in range(y0.shape[0]):
             dims[0] = result[idx].first + 1
-            dims[1] = y0.shape[1] + 1
+            dims[1] = stride
             xyout_np = cnp.PyArray_SimpleNewFromData(2, dims, cnp.NPY_DOUBLE, <void *>xyout_arr[idx])
             PyArray_ENABLEFLAGS(xyout_np, cnp.NPY_OWNDATA)
             xout.append(xyout_np[:, 0])
-            yout.append(xyout_np[:, 1:])
+            if nderiv == 0:
+                yout.append(xyout_np[:, 1:])
+            else:  # derivatives from cvode's interpolating polynomial (CVodeGetDky)
+                yout.append(xyout_np[:, 1:].reshape((dims[0], nderiv + 1, y0.shape[1])))
             root_indices.push_back(result[idx].second)
             if return_on_error:
                 if return_on_root and result[idx].second[result[idx].second.size() - 1] == result[idx].first:
@@ -161,6 +188,8 @@ def integrate_adaptive(cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] y0,
                                  systems[idx].last_integration_info_vecint,
                                  root_indices[idx], root_out=None, mode='adaptive',
                                  success=success))
+            nfos[idx]['thread_id'] = sched.thread_ids[idx]
+            nfos[idx]['time_threads'] = time_threads
 
             del systems[idx]
     finally:
@@ -170,7 +199,7 @@ def integrate_adaptive(cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] y0,
 
 
 def integrate_predefined(cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] y0,
-                         cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] xout,
+                         cnp.ndarray xout,
                          cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] params,
                          vector[double] atol,
                          double rtol,
@@ -185,26 +214,51 @@ def integrate_predefined(cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] y0,
                          bool record_order=False, bool record_fpe=False,
                          double get_dx_max_factor=0.0, bool error_outside_bounds=False,
                          double max_invariant_violation=0.0, vector[double] special_settings=[],
-                         bool autonomous_exprs=False):
+                         bool autonomous_exprs=False, int lband=-1, int uband=-1,
+                         str preconditioner='dense', unsigned int nderiv=0, offsets=None,
+                         int nthreads=0, str schedule='dynamic', int chunk=0):
+    """ xout: shape (nsys, nout), or ragged: shape (offsets[nsys],) when offsets (length nsys + 1) are given. """
     cdef:
         vector[OdeSys *] systems
         list nfos = []
-        cnp.ndarray[cnp.float64_t, ndim=3, mode='c'] yout
+        cnp.ndarray[cnp.float64_t, ndim=4, mode='c'] yout
+        cnp.ndarray[int, ndim=1, mode='c'] _offsets
+        int idx
         string _lmm = method.lower().encode('UTF-8')
         string _iter_t = iter_type.lower().encode('UTF-8')
         vector[pair[int, pair[vector[int], vector[double]]]] result
+        Schedule sched
         cnp.ndarray[cnp.float64_t, ndim=1, mode='c'] _dx0
         cnp.ndarray[cnp.float64_t, ndim=1, mode='c'] _dx_min
         cnp.ndarray[cnp.float64_t, ndim=1, mode='c'] _dx_max
         int maxl = 0
         double eps_lin = 0.0
-        unsigned nderiv = 0
         int nreached
         bool success
 
     if np.isnan(y0).any():
         raise ValueError("NaN found in y0")
 
+    if preconditioner not in _prec_kinds:
+        raise ValueError("Unknown preconditioner: %s" % preconditioner)
+
+    if schedule not in _schedule_kinds:
+        raise ValueError("Unknown schedule: %s" % schedule)
+    sched.nthreads, sched.kind, sched.chunk = nthreads, _schedule_kinds[schedule], chunk
+
+    if xout.dtype != np.float64 or not xout.flags['C_CONTIGUOUS']:
+        raise ValueError("xout needs to be a contiguous array of float64")
+    if offsets is None:
+        if xout.ndim != 2 or xout.shape[0] != y0.shape[0]:
+            raise ValueError("xout of incorrect shape")
+        _offsets = np.arange(y0.shape[0] + 1, dtype=np.intc)*xout.shape[1]
+    else:
+        _offsets = np.ascontiguousarray(offsets, dtype=np.intc)
+        if xout.ndim != 1 or _offsets.size != y0.shape[0] + 1 or _offsets[0] != 0 or _offsets[-1] != xout.size:
+            raise ValueError("Incorrect ragged layout (xout & offsets)")
+        if np.any(np.diff(_offsets) < 1):
+            raise ValueError("offsets need to be strictly increasing")
+
     if atol.size() == 1:
         atol.resize(y0.shape[y0.ndim-1], atol[0])
 
@@ -244,18 +298,25 @@ def integrate_predefined(cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] y0,
         systems[idx].record_jac_xvals = record_jac_xvals
         systems[idx].record_order = record_order
         systems[idx].record_fpe = record_fpe
+        systems[idx].m_prec_kind = _prec_kinds[preconditioner]
+        if idx == 0 and (systems[0].get_mlower() != lband or systems[0].get_mupper() != uband):
+            msg = "Got lband=%d, uband=%d but the system was compiled for (%d, %d)" % (
+                lband, uband, systems[0].get_mlower(), systems[0].get_mupper())
+            del systems[0]
+            raise ValueError(msg)
 
 
-    yout = np.empty((y0.shape[0], xout.shape[1], y0.shape[1]))
+    yout = np.empty((1, xout.size, nderiv + 1, y0.shape[1]))
     result = multi_predefined[OdeSys](
-        systems, atol, rtol, lmm_from_name(_lmm), <double *>y0.data, xout.shape[1], <double *>xout.data,
-        <double *>yout.data, mxsteps, &_dx0[0], &_dx_min[0], &_dx_max[0], with_jacobian,
+        systems, atol, rtol, lmm_from_name(_lmm), <double *>y0.data, &_offsets[0], <double *>xout.data,
+        <double *>yout.data, mxsteps, &_dx0[0], &_dx_min[0], &_dx_max[0], sched, with_jacobian,
         iter_type_from_name(_iter_t), linear_solver, maxl, eps_lin, nderiv, autorestart,
         return_on_error, with_jtimes)
+    time_threads = np.array(sched.thread_times)
 
     for idx in range(y0.shape[0]):
         nreached = result[idx].first
-        success = False if return_on_error and nreached < xout.shape[1] else True
+        success = False if return_on_error and nreached < _offsets[idx + 1] - _offsets[idx] else True
         nfos.append(_as_dict(systems[idx].last_integration_info,
                              systems[idx].last_integration_info_dbl,
                              systems[idx].last_integration_info_vecdbl,
@@ -263,7 +324,15 @@ def integrate_predefined(cnp.ndarray[cnp.float64_t, ndim=2, mode='c'] y0,
                              root_indices=result[idx].second.first,
                              root_out=result[idx].second.second, mode='predefined',
                              success=success, nreached=nreached))
+        nfos[idx]['thread_id'] = sched.thread_ids[idx]
+        nfos[idx]['time_threads'] = time_threads
         del systems[idx]
 
-    yout_arr = np.asarray(yout)
-    return yout, nfos
+    if offsets is None:
+        yout_arr = yout.reshape((y0.shape[0], xout.shape[1], nderiv + 1, y0.shape[1]))
+    else:  # ragged: shape (offsets[-1], [nderiv + 1,] ny)
+        yout_arr = yout[0]
+    if nderiv == 0:
+        return yout_arr.reshape(yout_arr.shape[:-2] + (y0.shape[1],)), nfos
+    else:
+        return yout_arr, nfos
@@ -18,6 +18,8 @@ namespace odesys_anyode {
                bool, double, std::vector<double>);
         int nrev=0;  // number of calls to roots
         int get_ny() const override;
+        int get_mlower() const override;
+        int get_mupper() const override;
         int get_nquads() const override;
         int get_nroots() const override;
         double get_dx0(double, const double * const) override;
@@ -37,6 +39,11 @@ namespace odesys_anyode {
                                       double * const __restrict__ jac,
                                       long int ldim,
                                       double * const __restrict__ dfdt=nullptr) override;
+        AnyODE::Status banded_jac_cmaj(double x,
+                                       const double * const __restrict__ y,
+                                       const double * const __restrict__ fy,
+                                       double * const __restrict__ jac,
+                                       long int ldim) override;
         AnyODE::Status roots(double x, const double * const y, double * const out) override;
     };
 }
@@ -14,10 +14,16 @@ namespace odesys_anyode {
         bool m_error_outside_bounds;
         double m_max_invariant_violation;
         std::vector<double> m_special_settings;
+        int m_prec_kind = 0;  // 0: dense, 1: diagonal, 2: block-Jacobi, 3: ILU(0)
+        std::vector<double> m_prec_jac;  // non-zero elements of the jacobian (compressed sparse rows)
+        std::vector<double> m_prec_data;  // factorized preconditioner
+        std::vector<int> m_prec_piv;
         OdeSys(const double * const, std::vector<double>, double, double,
                bool, double, std::vector<double>);
         int nrev=0;  // number of calls to roots
         int get_ny() const override;
+        int get_mlower() const override;
+        int get_mupper() const override;
         int get_nquads() const override;
         int get_nroots() const override;
         double get_dx0(double, const double * const) override;
@@ -38,6 +44,33 @@ namespace odesys_anyode {
                                       double * const __restrict__ jac,
                                       long int ldim,
                                       double * const __restrict__ dfdt=nullptr) override;
+        AnyODE::Status banded_jac_cmaj(double t,
+                                       const double * const __restrict__ y,
+                                       const double * const __restrict__ fy,
+                                       double * const __restrict__ jac,
+                                       long int ldim) override;
+        AnyODE::Status jac_times_vec(const double * const __restrict__ vec,
+                                     double * const __restrict__ out,
+                                     double t,
+                                     const double * const __restrict__ y,
+                                     const double * const __restrict__ fy) override;
+        AnyODE::Status sparse_jac_csr(double t,
+                                      const double * const __restrict__ y,
+                                      double * const __restrict__ data);
+        AnyODE::Status prec_setup(double t,
+                                  const double * const __restrict__ y,
+                                  const double * const __restrict__ fy,
+                                  bool jac_ok,
+                                  bool& jac_recomputed,
+                                  double gamma) override;
+        AnyODE::Status prec_solve_left(const double t,
+                                       const double * const __restrict__ y,
+                                       const double * const __restrict__ fy,
+                                       const double * const __restrict__ r,
+                                       double * const __restrict__ z,
+                                       double gamma,
+                                       double delta,
+                                       const double * const __restrict__ ewt) override;
         AnyODE::Status roots(double t, const double * const y, double * const out) override;
     };
 }
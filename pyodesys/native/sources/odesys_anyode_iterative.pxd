@@ -10,6 +10,8 @@ cdef extern from "odesys_anyode_iterative.hpp" namespace "odesys_anyode":
     cdef cppclass OdeSys:
         OdeSys(const double * const, vector[double], double, double,
                bool, double, vector[double]) nogil except +
+        int get_mlower() nogil
+        int get_mupper() nogil
         unordered_map[string, int] last_integration_info
         unordered_map[string, double] last_integration_info_dbl
         unordered_map[string, vector[double]] last_integration_info_vecdbl
@@ -19,3 +21,4 @@ cdef extern from "odesys_anyode_iterative.hpp" namespace "odesys_anyode":
         bool record_jac_xvals
         bool record_order
         bool record_fpe
+        int m_prec_kind
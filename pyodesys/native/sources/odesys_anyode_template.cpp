@@ -2,7 +2,30 @@
 // -*- coding: utf-8 -*-
 <%doc>
 This is file is a mako template for a C++ source file defining the ODE system.
+
+The template is rendered once per translation unit (selected by ``p_tu``), when
+``p_tu`` is None all of the translation units are rendered into a single file.
+Long function bodies (see ``chunks`` in ``p_rhs``, ``p_jac`` & ``p_prec``) are split into
+helper functions (in the anonymous namespace).
 </%doc>
+<%def name="chunk_functions(name, chunks, out_args, out_expr)">
+namespace {
+  %for ichunk, chunk in enumerate(chunks):
+    void ${name}_${ichunk}(double x, const double * const __restrict__ y,
+                          const double * const __restrict__ m_p,
+                          const double * const __restrict__ m_p_cse,
+                          ${out_args}) {
+        AnyODE::ignore(x); AnyODE::ignore(y); AnyODE::ignore(m_p); AnyODE::ignore(m_p_cse);
+    %for cse_token, cse_expr in chunk['cses']:
+        const auto ${cse_token} = ${cse_expr};
+    %endfor
+    %for key, expr in chunk['exprs']:
+        ${out_expr(key)} = ${expr};
+    %endfor
+    }
+  %endfor
+}
+</%def>
 // User provided system description: ${p_odesys.description}
 // Names of dependent variables: ${p_odesys.names}
 // Names of parameters: ${p_odesys.param_names}
@@ -23,6 +46,7 @@ namespace {  // anonymous namespace for user-defined helper functions
 %endif
 }
 using odesys_anyode::OdeSys;
+%if p_tu in (None, 'main'):
 
 OdeSys::OdeSys(const double * const params, std::vector<double> atol, double rtol,
                double get_dx_max_factor, bool error_outside_bounds,
@@ -57,6 +81,12 @@ OdeSys::OdeSys(const double * const params, std::vector<double> atol, double rto
 int OdeSys::get_ny() const {
     return ${p_odesys.ny};
 }
+int OdeSys::get_mlower() const {
+    return ${-1 if p_odesys.band is None else p_odesys.band[0]};
+}
+int OdeSys::get_mupper() const {
+    return ${-1 if p_odesys.band is None else p_odesys.band[1]};
+}
 int OdeSys::get_nquads() const {
     return 0;  // Not implemeneted yet (cvodes from Sundials supports this)
 }
@@ -67,20 +97,32 @@ int OdeSys::get_nroots() const {
     return ${p_nroots};
 %endif
 }
+%endif
+%if p_tu in (None, 'rhs'):
+%if not isinstance(p_rhs, str) and p_rhs.get('chunks', None):
+${chunk_functions('rhs_chunk', p_rhs['chunks'], 'double * const __restrict__ f', lambda i: 'f[%d]' % i)}
+%endif
+
 AnyODE::Status OdeSys::rhs(double x,
                            const double * const __restrict__ y,
                            double * const __restrict__ f) {
 %if isinstance(p_rhs, str):
     ${p_rhs}
 %else:
+  %if p_rhs.get('chunks', None):
+   %for ichunk in range(len(p_rhs['chunks'])):
+    rhs_chunk_${ichunk}(x, y, m_p.data(), m_p_cse.data(), f);
+   %endfor
+  %else:
     ${'AnyODE::ignore(x);' if p_odesys.autonomous_exprs else ''}
-  %for cse_token, cse_expr in p_rhs['cses']:
+   %for cse_token, cse_expr in p_rhs['cses']:
     const auto ${cse_token} = ${cse_expr};
-  %endfor
+   %endfor
 
-  %for i, expr in enumerate(p_rhs['exprs']):
+   %for i, expr in enumerate(p_rhs['exprs']):
     f[${i}] = ${expr};
-  %endfor
+   %endfor
+  %endif
     this->nfev++;
   %if p_support_recoverable_error:
     if (m_error_outside_bounds){
@@ -125,9 +167,15 @@ AnyODE::Status OdeSys::rhs(double x,
     return AnyODE::Status::success;
 %endif
 }
+%endif
 
 %if p_jac is not None:
 %for order in ('cmaj', 'rmaj'):
+%if p_tu in (None, 'jac_' + order):
+<% jac_idx = (lambda ri, ci: 'jac[ldim*%d + %d]' % ((ci, ri) if order == 'cmaj' else (ri, ci))) %>
+%if order not in p_jac and p_jac.get('chunks', None):
+${chunk_functions('jac_%s_chunk' % order, p_jac['chunks'], 'double * const __restrict__ jac, long int ldim', lambda k: jac_idx(*k))}
+%endif
 
 AnyODE::Status OdeSys::dense_jac_${order}(double x,
                                       const double * const __restrict__ y,
@@ -137,6 +185,21 @@ AnyODE::Status OdeSys::dense_jac_${order}(double x,
                                       double * const __restrict__ dfdt) {
 %if order in p_jac:
     ${p_jac[order]}
+%elif p_jac.get('chunks', None):
+    AnyODE::ignore(fy);
+  %for ichunk in range(len(p_jac['chunks'])):
+    jac_${order}_chunk_${ichunk}(x, y, m_p.data(), m_p_cse.data(), jac, ldim);
+  %endfor
+    if (dfdt){
+      %for cse_token, cse_expr in p_jac['dfdt_cses']:
+        const auto ${cse_token} = ${cse_expr};
+      %endfor
+      %for idx, expr in enumerate(p_jac['dfdt_exprs']):
+        dfdt[${idx}] = ${expr};
+      %endfor
+    }
+    this->njev++;
+    return AnyODE::Status::success;
 %else:
     // The AnyODE::ignore(...) calls below are used to generate code free from false compiler warnings.
     AnyODE::ignore(fy);  // Currently we are not using fy (could be done through extensive pattern matching)
@@ -167,9 +230,338 @@ AnyODE::Status OdeSys::dense_jac_${order}(double x,
     return AnyODE::Status::success;
 %endif
 }
+%endif
 %endfor
+%else:
+%for order in ('cmaj', 'rmaj'):
+%if p_tu in (None, 'jac_' + order):
+
+AnyODE::Status OdeSys::dense_jac_${order}(double x,
+                                      const double * const __restrict__ y,
+                                      const double * const __restrict__ fy,
+                                      double * const __restrict__ jac,
+                                      long int ldim,
+                                      double * const __restrict__ dfdt) {
+    AnyODE::ignore(x); AnyODE::ignore(y); AnyODE::ignore(fy); AnyODE::ignore(jac); AnyODE::ignore(ldim); AnyODE::ignore(dfdt);
+    return AnyODE::Status::unrecoverable_error;  // jac=False
+}
+%endif
+%endfor
+%endif
+%if p_tu in (None, 'jac_banded'):
+%if p_jac is not None and 'banded_cmaj' not in p_jac and p_jac.get('banded_chunks', None):
+${chunk_functions('jac_banded_chunk', p_jac['banded_chunks'], 'double * const __restrict__ jac, long int ldim', lambda k: 'jac[ldim*%d + %d]' % (k[1], k[0]))}
+%endif
+
+AnyODE::Status OdeSys::banded_jac_cmaj(double x,
+                                       const double * const __restrict__ y,
+                                       const double * const __restrict__ fy,
+                                       double * const __restrict__ jac,
+                                       long int ldim) {
+%if p_jac is not None and 'banded_cmaj' in p_jac:
+    ${p_jac['banded_cmaj']}
+%elif p_jac is None or p_jac.get('banded', None) is None:
+    AnyODE::ignore(x); AnyODE::ignore(y); AnyODE::ignore(fy); AnyODE::ignore(jac); AnyODE::ignore(ldim);
+    return AnyODE::Status::unrecoverable_error;  // system was not declared banded (see ``get_mlower``)
+%elif p_jac.get('banded_chunks', None):
+    AnyODE::ignore(fy);
+  %for ichunk in range(len(p_jac['banded_chunks'])):
+    jac_banded_chunk_${ichunk}(x, y, m_p.data(), m_p_cse.data(), jac, ldim);
+  %endfor
+    this->njev++;
+    return AnyODE::Status::success;
+%else:
+    AnyODE::ignore(fy);
+    ${'AnyODE::ignore(x);' if p_odesys.autonomous_exprs else ''}
+    ${'AnyODE::ignore(y);' if not any([yi in p_odesys.get_jac().free_symbols for yi in p_odesys.dep]) else ''}
+
+  %for cse_token, cse_expr in p_jac['cses']:
+    const auto ${cse_token} = ${cse_expr};
+  %endfor
+
+  %for i_col in range(p_odesys.ny):
+   %for i_band in range(1 + p_odesys.band[0] + p_odesys.band[1]):
+<%
+      i_row = i_band - p_odesys.band[1] + i_col
+      curr_expr = p_jac['banded'][i_band, i_col]
+      if i_row < 0 or i_row >= p_odesys.ny or (curr_expr == '0' and p_jacobian_set_to_zero_by_solver):
+          continue
+%>    jac[ldim*${i_col} + ${i_band}] = ${curr_expr};
+   %endfor
+
+  %endfor
+    this->njev++;
+    return AnyODE::Status::success;
+%endif
+}
+%endif
+%if p_tu in (None, 'jtimes') and p_support_jtimes:
+%if not isinstance(p_jtimes, (str, type(None))) and p_jtimes.get('chunks', None):
+${chunk_functions('jtimes_chunk', p_jtimes['chunks'], 'const double * const __restrict__ vec, double * const __restrict__ out', lambda i: 'out[%d]' % i)}
 %endif
 
+AnyODE::Status OdeSys::jac_times_vec(const double * const __restrict__ vec,
+                                     double * const __restrict__ out,
+                                     double x,
+                                     const double * const __restrict__ y,
+                                     const double * const __restrict__ fy) {
+%if p_jtimes is None:
+    return AnyODE::OdeSysIterativeBase<double>::jac_times_vec(vec, out, x, y, fy);  // using dense_jac_cmaj
+%elif isinstance(p_jtimes, str):
+    ${p_jtimes}
+%else:
+    AnyODE::ignore(x); AnyODE::ignore(y); AnyODE::ignore(fy);
+  %if p_jtimes.get('chunks', None):
+   %for ichunk in range(len(p_jtimes['chunks'])):
+    jtimes_chunk_${ichunk}(x, y, m_p.data(), m_p_cse.data(), vec, out);
+   %endfor
+  %else:
+   %for cse_token, cse_expr in p_jtimes['cses']:
+    const auto ${cse_token} = ${cse_expr};
+   %endfor
+
+   %for i, expr in enumerate(p_jtimes['exprs']):
+    out[${i}] = ${expr};
+   %endfor
+  %endif
+    this->m_njacvec_dot++;
+    return AnyODE::Status::success;
+%endif
+}
+%endif
+%if p_tu in (None, 'prec') and p_support_prec:
+%if p_prec is not None:
+<%
+  ny = p_odesys.ny
+  block_of, block_loc, block_ptr, block_off, block_idx = [0]*ny, [0]*ny, [0], [0], []
+  for ib, block in enumerate(p_prec['blocks']):
+      for loc, idx in enumerate(block):
+          block_of[idx], block_loc[idx] = ib, loc
+      block_idx.extend(block)
+      block_ptr.append(len(block_idx))
+      block_off.append(block_off[-1] + len(block)**2)
+  _arr = lambda values: ', '.join(map(str, values))
+%>
+%if p_prec.get('chunks', None):
+${chunk_functions('prec_chunk', p_prec['chunks'], 'double * const __restrict__ data', lambda k: 'data[%d]' % k)}
+%endif
+namespace {
+    // Sparsity pattern of the jacobian (compressed sparse rows, diagonal included)
+    const int prec_rowptr[${ny + 1}] = {${_arr(p_prec['rowptr'])}};
+    const int prec_colidx[${len(p_prec['colidx'])}] = {${_arr(p_prec['colidx'])}};
+    const int prec_diag[${ny}] = {${_arr(p_prec['diag'])}};
+    // Blocks of the block-Jacobi preconditioner
+    const int prec_block_of[${ny}] = {${_arr(block_of)}};
+    const int prec_block_loc[${ny}] = {${_arr(block_loc)}};
+    const int prec_block_ptr[${len(block_ptr)}] = {${_arr(block_ptr)}};
+    const int prec_block_off[${len(block_off)}] = {${_arr(block_off)}};
+    const int prec_block_idx[${ny}] = {${_arr(block_idx)}};
+
+    int lu_factorize(double * const __restrict__ a, int * const __restrict__ piv, const int n) {
+        // LU factorization with partial pivoting of a (row major) n x n matrix
+        for (int k=0; k < n; ++k) {
+            int p = k;
+            for (int i=k+1; i < n; ++i)
+                if (fabs(a[i*n + k]) > fabs(a[p*n + k]))
+                    p = i;
+            piv[k] = p;
+            if (a[p*n + k] == 0)
+                return k + 1;
+            if (p != k)
+                for (int j=0; j < n; ++j)
+                    std::swap(a[k*n + j], a[p*n + j]);
+            for (int i=k+1; i < n; ++i) {
+                a[i*n + k] /= a[k*n + k];
+                for (int j=k+1; j < n; ++j)
+                    a[i*n + j] -= a[i*n + k]*a[k*n + j];
+            }
+        }
+        return 0;
+    }
+
+    void lu_solve(const double * const __restrict__ a, const int * const __restrict__ piv, const int n,
+                  double * const __restrict__ b) {
+        for (int k=0; k < n; ++k)
+            std::swap(b[k], b[piv[k]]);
+        for (int i=1; i < n; ++i)
+            for (int j=0; j < i; ++j)
+                b[i] -= a[i*n + j]*b[j];
+        for (int i=n-1; i >= 0; --i) {
+            for (int j=i+1; j < n; ++j)
+                b[i] -= a[i*n + j]*b[j];
+            b[i] /= a[i*n + i];
+        }
+    }
+}
+
+AnyODE::Status OdeSys::sparse_jac_csr(double x,
+                                      const double * const __restrict__ y,
+                                      double * const __restrict__ data) {
+%if p_prec.get('chunks', None):
+  %for ichunk in range(len(p_prec['chunks'])):
+    prec_chunk_${ichunk}(x, y, m_p.data(), m_p_cse.data(), data);
+  %endfor
+%else:
+    AnyODE::ignore(x); AnyODE::ignore(y);
+  %for cse_token, cse_expr in p_prec['cses']:
+    const auto ${cse_token} = ${cse_expr};
+  %endfor
+
+  %for k, expr in enumerate(p_prec['exprs']):
+    data[${k}] = ${expr};
+  %endfor
+%endif
+    this->njev++;
+    return AnyODE::Status::success;
+}
+
+AnyODE::Status OdeSys::prec_setup(double x,
+                                  const double * const __restrict__ y,
+                                  const double * const __restrict__ fy,
+                                  bool jac_ok,
+                                  bool& jac_recomputed,
+                                  double gamma) {
+    if (m_prec_kind == 0)
+        return AnyODE::OdeSysIterativeBase<double>::prec_setup(x, y, fy, jac_ok, jac_recomputed, gamma);
+    auto status = AnyODE::Status::success;
+    const int nnz = ${len(p_prec['colidx'])};
+    if (jac_ok && m_prec_jac.size()) {
+        jac_recomputed = false;
+    } else {
+        m_prec_jac.resize(nnz);
+        status = sparse_jac_csr(x, y, m_prec_jac.data());
+        jac_recomputed = true;
+    }
+    if (m_prec_kind == 2) {  // block-Jacobi: LU factorization of the diagonal blocks of I - gamma*J
+        m_prec_data.assign(${block_off[-1]}, 0.0);
+        m_prec_piv.resize(${ny});
+        for (int ri=0; ri < ${ny}; ++ri) {
+            const int ib = prec_block_of[ri], nb = prec_block_ptr[ib+1] - prec_block_ptr[ib];
+            for (int k=prec_rowptr[ri]; k < prec_rowptr[ri+1]; ++k) {
+                const int ci = prec_colidx[k];
+                if (prec_block_of[ci] == ib)
+                    m_prec_data[prec_block_off[ib] + prec_block_loc[ri]*nb + prec_block_loc[ci]] = (
+                        ((ri == ci) ? 1.0 : 0.0) - gamma*m_prec_jac[k]);
+            }
+        }
+        for (int ib=0; ib < ${len(block_ptr) - 1}; ++ib) {
+            if (lu_factorize(&m_prec_data[prec_block_off[ib]], &m_prec_piv[prec_block_ptr[ib]],
+                             prec_block_ptr[ib+1] - prec_block_ptr[ib]))
+                return AnyODE::Status::recoverable_error;
+        }
+    } else if (m_prec_kind == 1 || m_prec_kind == 3) {  // diagonal or ILU(0) of I - gamma*J
+        m_prec_data.resize(nnz);
+        for (int k=0; k < nnz; ++k)
+            m_prec_data[k] = -gamma*m_prec_jac[k];
+        for (int ri=0; ri < ${ny}; ++ri)
+            m_prec_data[prec_diag[ri]] += 1.0;
+        if (m_prec_kind == 3) {
+            double * const a = m_prec_data.data();
+            std::vector<int> iw(${ny}, -1);
+            for (int ri=0; ri < ${ny}; ++ri) {
+                for (int k=prec_rowptr[ri]; k < prec_rowptr[ri+1]; ++k)
+                    iw[prec_colidx[k]] = k;
+                for (int k=prec_rowptr[ri]; k < prec_diag[ri]; ++k) {
+                    const int ci = prec_colidx[k];
+                    a[k] /= a[prec_diag[ci]];
+                    for (int kk=prec_diag[ci]+1; kk < prec_rowptr[ci+1]; ++kk)
+                        if (iw[prec_colidx[kk]] >= 0)
+                            a[iw[prec_colidx[kk]]] -= a[k]*a[kk];
+                }
+                for (int k=prec_rowptr[ri]; k < prec_rowptr[ri+1]; ++k)
+                    iw[prec_colidx[k]] = -1;
+                if (a[prec_diag[ri]] == 0)
+                    return AnyODE::Status::recoverable_error;
+            }
+        } else {
+            for (int ri=0; ri < ${ny}; ++ri)
+                if (m_prec_data[prec_diag[ri]] == 0)
+                    return AnyODE::Status::recoverable_error;
+        }
+    } else {
+        return AnyODE::Status::unrecoverable_error;
+    }
+    this->m_nprec_setup++;
+    return status;
+}
+
+AnyODE::Status OdeSys::prec_solve_left(const double x,
+                                       const double * const __restrict__ y,
+                                       const double * const __restrict__ fy,
+                                       const double * const __restrict__ r,
+                                       double * const __restrict__ z,
+                                       double gamma,
+                                       double delta,
+                                       const double * const __restrict__ ewt) {
+    // Solves P*z = r, where P ~= I - gamma*J
+    if (m_prec_kind == 0)
+        return AnyODE::OdeSysIterativeBase<double>::prec_solve_left(x, y, fy, r, z, gamma, delta, ewt);
+    AnyODE::ignore(ewt);
+    const double * const a = m_prec_data.data();
+    if (m_prec_kind == 1) {
+        for (int ri=0; ri < ${ny}; ++ri)
+            z[ri] = r[ri]/a[prec_diag[ri]];
+    } else if (m_prec_kind == 2) {
+        double work[${max(len(block) for block in p_prec['blocks'])}];
+        for (int ib=0; ib < ${len(block_ptr) - 1}; ++ib) {
+            const int nb = prec_block_ptr[ib+1] - prec_block_ptr[ib];
+            for (int loc=0; loc < nb; ++loc)
+                work[loc] = r[prec_block_idx[prec_block_ptr[ib] + loc]];
+            lu_solve(a + prec_block_off[ib], &m_prec_piv[prec_block_ptr[ib]], nb, work);
+            for (int loc=0; loc < nb; ++loc)
+                z[prec_block_idx[prec_block_ptr[ib] + loc]] = work[loc];
+        }
+    } else {
+        for (int ri=0; ri < ${ny}; ++ri) {  // forward substitution (L has unit diagonal)
+            double s = r[ri];
+            for (int k=prec_rowptr[ri]; k < prec_diag[ri]; ++k)
+                s -= a[k]*z[prec_colidx[k]];
+            z[ri] = s;
+        }
+        for (int ri=${ny - 1}; ri >= 0; --ri) {  // backward substitution
+            double s = z[ri];
+            for (int k=prec_diag[ri]+1; k < prec_rowptr[ri+1]; ++k)
+                s -= a[k]*z[prec_colidx[k]];
+            z[ri] = s/a[prec_diag[ri]];
+        }
+    }
+    this->m_nprec_solve++;
+    return AnyODE::Status::success;
+}
+%else:
+
+AnyODE::Status OdeSys::sparse_jac_csr(double x,
+                                      const double * const __restrict__ y,
+                                      double * const __restrict__ data) {
+    AnyODE::ignore(x); AnyODE::ignore(y); AnyODE::ignore(data);
+    return AnyODE::Status::unrecoverable_error;  // jac=False
+}
+
+AnyODE::Status OdeSys::prec_setup(double x,
+                                  const double * const __restrict__ y,
+                                  const double * const __restrict__ fy,
+                                  bool jac_ok,
+                                  bool& jac_recomputed,
+                                  double gamma) {
+    if (m_prec_kind != 0)
+        return AnyODE::Status::unrecoverable_error;  // only the dense preconditioner is available
+    return AnyODE::OdeSysIterativeBase<double>::prec_setup(x, y, fy, jac_ok, jac_recomputed, gamma);
+}
+
+AnyODE::Status OdeSys::prec_solve_left(const double x,
+                                       const double * const __restrict__ y,
+                                       const double * const __restrict__ fy,
+                                       const double * const __restrict__ r,
+                                       double * const __restrict__ z,
+                                       double gamma,
+                                       double delta,
+                                       const double * const __restrict__ ewt) {
+    return AnyODE::OdeSysIterativeBase<double>::prec_solve_left(x, y, fy, r, z, gamma, delta, ewt);
+}
+%endif
+%endif
+%if p_tu in (None, 'main'):
+
 double OdeSys::get_dx0(double x, const double * const y) {
 %if p_first_step is None:
     AnyODE::ignore(x); AnyODE::ignore(y);  // avoid compiler warning about unused parameter.
@@ -237,3 +629,4 @@ AnyODE::Status OdeSys::roots(double x, const double * const y, double * const ou
     return AnyODE::Status::success;
 %endif
 }
+%endif
@@ -0,0 +1,149 @@
+#pragma once
+
+#include <chrono>
+#include <cstdlib>
+#include <utility>
+#include <vector>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+#include "cvodes_anyode_parallel.hpp"
+
+namespace odesys_parallel {
+
+    using cvodes_cxx::LMM;
+    using cvodes_cxx::IterType;
+    using cvodes_cxx::LinSol;
+
+    // Scheduling of the loop over instances (cf. cvodes_anyode_parallel where it is fixed).
+    struct Schedule {
+        int nthreads = 0;  // 0: environment variable ANYODE_NUM_THREADS (default: 1)
+        int kind = 2;  // as omp_sched_t: 1 static, 2 dynamic, 3 guided, 4 auto
+        int chunk = 0;  // 0: implementation default
+        std::vector<int> thread_ids;  // out: thread which integrated each instance
+        std::vector<double> thread_times;  // out: wall time spent integrating by each thread
+    };
+
+    inline int resolve_nthreads(const Schedule& sched){
+        int nt = sched.nthreads;
+        if (nt <= 0) {
+            char * num_threads_var = std::getenv("ANYODE_NUM_THREADS");
+            nt = (num_threads_var) ? std::atoi(num_threads_var) : 1;
+        }
+        return (nt < 1) ? 1 : nt;
+    }
+
+    // Calls cb(idx) for every instance in a (scheduled) OpenMP loop
+    template <class Callback>
+    void parallel_for(const int nsys, Schedule& sched, Callback cb){
+        const int nt = resolve_nthreads(sched);
+        sched.thread_ids.assign(nsys, 0);
+        sched.thread_times.assign(nt, 0.0);
+#ifdef _OPENMP
+        omp_set_schedule(static_cast<omp_sched_t>(sched.kind), sched.chunk);
+#endif
+        #pragma omp parallel for num_threads(nt) schedule(runtime)
+        for (int idx=0; idx<nsys; ++idx){
+            int tid = 0;
+#ifdef _OPENMP
+            tid = omp_get_thread_num();
+#endif
+            const auto t_start = std::chrono::high_resolution_clock::now();
+            cb(idx);
+            sched.thread_ids[idx] = tid;
+            sched.thread_times[tid] += std::chrono::duration<double>(
+                std::chrono::high_resolution_clock::now() - t_start).count();
+        }
+    }
+
+    template <class OdeSys>
+    std::vector<std::pair<int, std::vector<int>>>
+    multi_adaptive(realtype ** xyout_arr, // vectorized
+                   int * td_arr, // vectorized
+                   std::vector<OdeSys *> odesys, // vectorized
+                   std::vector<realtype> atol,
+                   const realtype rtol,
+                   const LMM lmm,
+                   const realtype * tend,  // vectorized
+                   const long int mxsteps,
+                   const realtype * dx0,  // vectorized
+                   const realtype * dx_min,  // vectorized
+                   const realtype * dx_max,  // vectorized
+                   Schedule& sched,
+                   const bool with_jacobian=false,
+                   IterType iter_type=IterType::Undecided,
+                   LinSol linear_solver=LinSol::DEFAULT,
+                   const int maxl=0,
+                   const realtype eps_lin=0.0,
+                   const unsigned nderiv=0,
+                   const bool return_on_root=false,
+                   const int autorestart=0,
+                   const bool return_on_error=false,
+                   const int with_jtimes=0
+                   ){
+        const int nsys = odesys.size();
+        auto results = std::vector<std::pair<int, std::vector<int>>>(nsys);
+        anyode_parallel::ThreadException te;
+        parallel_for(nsys, sched, [&](int idx){
+            te.run([&]{
+                results[idx].first = cvodes_anyode::simple_adaptive<OdeSys>(
+                    xyout_arr + idx, td_arr + idx,
+                    odesys[idx], atol, rtol, lmm, tend[idx],
+                    results[idx].second, mxsteps, dx0[idx], dx_min[idx], dx_max[idx],
+                    with_jacobian, iter_type, linear_solver, maxl, eps_lin, nderiv,
+                    return_on_root, autorestart, return_on_error, with_jtimes);
+            });
+        });
+        te.rethrow();
+        return results;
+    }
+
+    // Instance ``idx`` reports at tout[offsets[idx]:offsets[idx+1]] and writes
+    // yout[offsets[idx]*ny*(nderiv+1):...], i.e. a ragged layout (uniform offsets: rectangular).
+    template <class OdeSys>
+    std::vector<std::pair<int, std::pair<std::vector<int>, std::vector<realtype>>>>
+    multi_predefined(std::vector<OdeSys *> odesys,  // vectorized
+                     std::vector<realtype> atol,
+                     const realtype rtol,
+                     const LMM lmm,
+                     realtype * y0,  // vectorized
+                     const int * offsets,  // length odesys.size() + 1
+                     realtype * tout,  // ragged
+                     realtype * yout,  // ragged
+                     const long int mxsteps,
+                     const realtype * dx0,  // vectorized
+                     const realtype * dx_min,  // vectorized
+                     const realtype * dx_max,  // vectorized
+                     Schedule& sched,
+                     const bool with_jacobian=false,
+                     IterType iter_type=IterType::Undecided,
+                     LinSol linear_solver=LinSol::DEFAULT,
+                     const int maxl=0,
+                     const realtype eps_lin=0.0,
+                     const unsigned nderiv=0,
+                     const int autorestart=0,
+                     const bool return_on_error=false,
+                     const int with_jtimes=0
+                     ){
+        const int ny = odesys[0]->get_ny();
+        const int nsys = odesys.size();
+        auto nreached_roots = std::vector<std::pair<int, std::pair<std::vector<int>, std::vector<realtype>>>>(nsys);
+        anyode_parallel::ThreadException te;
+        parallel_for(nsys, sched, [&](int idx){
+            te.run([&]{
+                    nreached_roots[idx].first = cvodes_anyode::simple_predefined<OdeSys>(
+                        odesys[idx], atol, rtol, lmm, y0 + idx*ny,
+                        offsets[idx+1] - offsets[idx], tout + offsets[idx], yout + offsets[idx]*ny*(nderiv+1),
+                        nreached_roots[idx].second.first, nreached_roots[idx].second.second,
+                        mxsteps, dx0[idx], dx_min[idx], dx_max[idx], with_jacobian,
+                        iter_type, linear_solver, maxl, eps_lin, nderiv,
+                        autorestart, return_on_error, with_jtimes);
+            });
+        });
+        if (!return_on_error)
+            te.rethrow();
+
+        return nreached_roots;
+    }
+
+}
@@ -0,0 +1,65 @@
+# -*- mode: cython -*-
+# -*- coding: utf-8 -*-
+
+from libcpp cimport bool
+from libcpp.vector cimport vector
+from libcpp.utility cimport pair
+from cvodes_cxx cimport LMM, IterType, LinSol, realtype
+
+cdef extern from "odesys_parallel.hpp" namespace "odesys_parallel":
+    cdef cppclass Schedule:
+        int nthreads
+        int kind
+        int chunk
+        vector[int] thread_ids
+        vector[double] thread_times
+
+    cdef vector[pair[int, vector[int]]] multi_adaptive[U](
+        realtype **,
+        int *,
+        vector[U*],
+        vector[realtype],
+        const realtype,
+        const LMM,
+        const realtype *,
+        const long int,
+        const realtype *,
+        const realtype *,
+        const realtype *,
+        Schedule&,
+        const bool,
+        IterType,
+        LinSol,
+        const int,
+        const realtype,
+        const unsigned,
+        const bool,
+        const int,
+        const bool,
+        const int
+    ) except +
+
+    cdef vector[pair[int, pair[vector[int], vector[realtype]]]] multi_predefined[U](
+        vector[U*],
+        vector[realtype],
+        const realtype,
+        const LMM,
+        realtype *,
+        const int *,
+        realtype *,
+        realtype *,
+        const long int,
+        const realtype *,
+        const realtype *,
+        const realtype *,
+        Schedule&,
+        const bool,
+        IterType,
+        LinSol,
+        const int,
+        const realtype,
+        const unsigned,
+        const int,
+        const bool,
+        const int
+    ) except +
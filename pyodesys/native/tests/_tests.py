@@ -3,10 +3,14 @@
 from __future__ import print_function, absolute_import, division
 
 import numpy as np
+import pytest
 
 from pyodesys.util import import_
 from pyodesys.core import integrate_chained
-from pyodesys.symbolic import ScaledSys, TransformedSys, symmetricsys, PartiallySolvedSystem, get_logexp
+from pyodesys.symbolic import (
+    ScaledSys, TransformedSys, symmetricsys, PartiallySolvedSystem, ForwardSensitivitySystem, AdjointSystem,
+    get_logexp
+)
 from pyodesys.tests.test_core import (
     vdp_f, _test_integrate_multiple_adaptive, _test_integrate_multiple_predefined, sine, decay
 )
@@ -337,3 +341,208 @@ def _test_return_on_error_success(NativeSys):
     ref = np.array(bateman_full(y0, k+[0], result.xout[:nreached] - xout[0], exp=np.exp)).T
     assert result.info['success'] is False
     assert np.allclose(result.yout[:nreached, :], ref, rtol=1e-8, atol=1e-8)
+
+
+def _test_NativeSys__module_cache(NativeSys, tmpdir, **kwargs):
+    import os
+    os.environ['PYODESYS_NATIVE_CACHE_DIR'] = str(tmpdir)
+    try:
+        odesys1 = NativeSys.from_callback(vdp_f, 2, 1)
+        xout1, yout1, info1 = odesys1.integrate([0, 1, 2], [1, 0], params=[2.0], **kwargs)
+        odesys2 = NativeSys.from_callback(vdp_f, 2, 1)
+        assert odesys2._native._module_hash() == odesys1._native._module_hash()
+        xout2, yout2, info2 = odesys2.integrate([0, 1, 2], [1, 0], params=[2.0], **kwargs)
+        assert odesys2._native.binary_path == odesys1._native.binary_path
+        assert odesys1._native.binary_path.startswith(str(tmpdir))
+        assert not os.path.exists(os.path.join(odesys2._native._tempdir, odesys2._native.so_file))
+        assert np.allclose(yout1, yout2)
+
+        odesys3 = NativeSys.from_callback(vdp_f, 2, 1, namespace_override={'p_anon': '// changed'})
+        assert odesys3._native._module_hash() != odesys1._native._module_hash()
+
+        hash1, cxxflags = odesys1._native._module_hash(), os.environ.get('CXXFLAGS', None)
+        os.environ['CXXFLAGS'] = (cxxflags or '') + ' -DPYODESYS_MODULE_CACHE_TEST'
+        try:
+            assert odesys1._native._module_hash() != hash1
+        finally:
+            if cxxflags is None:
+                del os.environ['CXXFLAGS']
+            else:
+                os.environ['CXXFLAGS'] = cxxflags
+        odesys1._native._dependency_versions = lambda: ['upgraded']  # e.g. new version of pycvodes
+        assert odesys1._native._module_hash() != hash1
+    finally:
+        del os.environ['PYODESYS_NATIVE_CACHE_DIR']
+
+
+def _test_NativeSys__chunked(NativeSys, **kwargs):
+    import os
+    tend, k, y0 = 2, [4, 3, 2, 1.5], (5, 4, 2, 1, 0.5)
+    y = sp.symarray('y', len(k)+1)
+    f = decay_dydt_factory(k)(0, y)
+    ref_sys = NativeSys(zip(y, f))
+    xout, yout_ref, info_ref = ref_sys.integrate(np.linspace(0, tend), y0, integrator='native', **kwargs)
+    os.environ['PYODESYS_NATIVE_CHUNK_SIZE'] = '2'
+    try:
+        odesys = NativeSys(zip(y, f))
+        for name in odesys._native.source_files:
+            assert os.path.exists(os.path.join(odesys._native._tempdir, name))
+        with open(os.path.join(odesys._native._tempdir, 'odesys_anyode_rhs.cpp'), 'rt') as ifh:
+            assert 'rhs_chunk_2(' in ifh.read()
+        xout, yout, info = odesys.integrate(np.linspace(0, tend), y0, integrator='native', **kwargs)
+    finally:
+        del os.environ['PYODESYS_NATIVE_CHUNK_SIZE']
+    assert np.allclose(yout, yout_ref)
+
+
+def _test_NativeSys__async_compile(NativeSys, **kwargs):
+    native = NativeSys.from_callback(vdp_f, 2, 1, async_compile=True)
+    assert native.is_materialized('jac') and native.is_materialized('dfdx')
+    ref = [[1, 0], [0.44449086, -1.32847148], [-1.89021896, -0.71633577]]
+    xout, yout, info = native.integrate([0, 1, 2], [1, 0], params=[2.0], **kwargs)  # possibly not native
+    assert np.allclose(yout, ref)
+    assert native.wait_for_native()
+    assert native._native._mod is not None
+    xout, yout, info = native.integrate([0, 1, 2], [1, 0], params=[2.0], **kwargs)
+    assert np.allclose(yout, ref)
+
+
+def _test_NativeSys__codegen_info(NativeSys):
+    native = NativeSys.from_callback(vdp_f, 2, 1)
+    info = native._native.codegen_info
+    assert set(info['groups']) == {'rhs', 'jac', 'invariants', 'first_step', 'roots', 'jtimes', 'common'}
+    assert info['groups']['rhs']['ops'] > 0
+    assert info['ops'] == sum(group['ops'] for group in info['groups'].values())
+    for key in ('time_substitute', 'time_cse', 'time_partition', 'time_groups', 'time_total'):
+        assert info[key] >= 0
+
+
+def _test_NativeSys__jtimes(NativeSys, **kwargs):
+    tend, k, y0 = 2, [4, 3], (5, 4, 2)
+    y = sp.symarray('y', len(k)+1)
+    dydt = decay_dydt_factory(k)
+    f = dydt(0, y)
+    ref_native = NativeSys(zip(y, f))
+    ref = ref_native.integrate(tend, y0, integrator='native', nsteps=5000, **kwargs)
+    odesys = NativeSys(zip(y, f), jtimes=True)
+    assert odesys._native.codegen_info['groups']['jtimes']['ops'] > 0
+    for with_jacobian in (False, True):
+        res = odesys.integrate(ref.xout, y0, integrator='native', iter_type='newton', linear_solver=10,
+                               with_jacobian=with_jacobian, nsteps=5000, **kwargs)
+        assert res.info['success']
+        assert np.allclose(res.yout, ref.yout, rtol=1e-5, atol=1e-5)
+
+
+def _test_NativeSys__preconditioners(NativeSys, **kwargs):
+    tend, k, y0 = 2, [4, 3, 2], (5, 4, 2, 1)
+    y = sp.symarray('y', len(k)+1)
+    f = decay_dydt_factory(k)(0, y)
+    f[0] += y[1]  # (y0, y1) strongly coupled
+    native = NativeSys(zip(y, f))
+    assert native._native.variables()['p_prec']['blocks'] == [[0, 1], [2], [3]]
+    ref = native.integrate(tend, y0, integrator='native', nsteps=5000, **kwargs)
+    assert ref.info['success']
+    for preconditioner in ('dense', 'diagonal', 'block_jacobi', 'ilu0'):
+        res = native.integrate(ref.xout, y0, integrator='native', iter_type='newton', linear_solver=10,
+                               preconditioner=preconditioner, nsteps=5000, **kwargs)
+        assert res.info['success']
+        assert np.allclose(res.yout, ref.yout, rtol=1e-5, atol=1e-5)
+    with pytest.raises(ValueError):
+        native.integrate(tend, y0, integrator='native', preconditioner='foobar')
+
+
+def _test_NativeSys__forward_sensitivities(NativeSensSys, **kwargs):
+    odesys = _get_decay3()
+    native = NativeSensSys(odesys, sens_params=odesys.params[:2])
+    xout, y0, k = np.linspace(0, 2, 17), (5, 4, 2), [4, 3, 2]
+    res = native.integrate(xout, y0, k, integrator='native', **kwargs)
+    assert res.info['success']
+    assert res.odesys is odesys and res.sens.shape == (xout.size, 3, 2)
+    ref = ForwardSensitivitySystem(odesys, sens_params=odesys.params[:2]).integrate(
+        xout, y0, k, integrator='cvode')
+    assert np.allclose(res.yout, ref.yout, rtol=1e-6, atol=1e-6)
+    assert np.allclose(res.sens, ref.sens, rtol=1e-6, atol=1e-6)
+
+
+def _test_NativeSys__adjoint_gradient(NativeAdjointSys, **kwargs):
+    odesys = _get_decay3()
+    y, p = odesys.dep, odesys.params
+    objective = dict(final=y[2]**2*p[2], integrand=(y[0] - 1)**2)
+    native = NativeAdjointSys(odesys, **objective)
+    xout, y0, k = np.linspace(0, 2, 41), (5, 4, 2), [4, 3, 2]
+    G, grad_p, grad_y0, res = native.gradient(xout, y0, k, integrator='native',
+                                              forward_kwargs=dict(integrator='cvode'), **kwargs)
+    assert res.info['success']
+    refG, ref_grad_p, ref_grad_y0, _ = AdjointSystem(odesys, **objective).gradient(xout, y0, k, integrator='cvode')
+    assert np.allclose([G], [refG])
+    assert np.allclose(grad_p, ref_grad_p, rtol=1e-6, atol=1e-8)
+    assert np.allclose(grad_y0, ref_grad_y0, rtol=1e-6, atol=1e-8)
+
+
+def _test_NativeSys__dense_output(NativeSys, **kwargs):
+    odesys = NativeSys.from_other(_get_decay3())
+    y0, k = (5, 4, 2), [4, 3, 2]
+    ref = _get_decay3().integrate(np.linspace(0, 2, 1001), y0, k, integrator='cvode', atol=1e-12, rtol=1e-12)
+    for x in ((0, 2), np.linspace(0, 2, 33)):
+        res = odesys.integrate(x, y0, k, integrator='native', dense_output=True, atol=1e-10, rtol=1e-10,
+                               nsteps=5000, **kwargs)
+        assert res.info['success']
+        assert res.info['dense_output'].shape == (res.xout.size, 3, 3)  # nderiv=2
+        assert res.yout.shape == (res.xout.size, 3)
+        dydx = [odesys.f_cb(xv, yv, k) for xv, yv in zip(res.xout[1:], res.yout[1:])]
+        assert np.allclose(res.info['dense_output'][1:, 1, :], dydx, rtol=1e-6, atol=1e-8)
+        est, err = res.at(ref.xout)
+        assert err is None
+        assert np.allclose(est, ref.yout, rtol=1e-6, atol=1e-8)
+
+
+def _test_NativeSys__iter_integrate(NativeSys, **kwargs):
+    odesys = NativeSys.from_other(_get_decay3())
+    y0, k = (5, 4, 2), [4, 3, 2]
+    ref = odesys.integrate(2, y0, k, integrator='native', **kwargs)
+    chunks = list(odesys.iter_integrate(2, y0, k, chunks=4, integrator='native', **kwargs))
+    assert len(chunks) == 4
+    assert [x[-1] for x, _ in chunks] == [.5, 1, 1.5, 2]
+    assert np.all(np.diff(np.concatenate([x for x, _ in chunks])) > 0)
+    assert np.allclose(chunks[-1][1][-1], ref.yout[-1], rtol=1e-6, atol=1e-8)
+    xout = np.linspace(0, 2, 21)
+    ref = odesys.integrate(xout, y0, k, integrator='native', **kwargs)
+    yout = np.concatenate([y for _, y in odesys.iter_integrate(xout, y0, k, chunks=3, integrator='native',
+                                                               **kwargs)])
+    assert np.allclose(yout, ref.yout, rtol=1e-6, atol=1e-8)
+
+
+def _test_NativeSys__integrate_ragged(NativeSys, **kwargs):
+    odesys = NativeSys.from_other(_get_decay3())
+    xouts = [np.linspace(0, 1, 5), np.linspace(0, 2, 11), np.array([0, .1, 3])]
+    y0s, ks = [(5, 4, 2), (1, 0, 0), (2, 2, 2)], [[4, 3, 2], [1, 2, 3], [.5, .5, .5]]
+    offsets = np.cumsum([0] + [x.size for x in xouts])
+    res = odesys.integrate_ragged(np.concatenate(xouts), offsets, y0s, ks, **kwargs)
+    assert len(res) == 3 and np.all(res.offsets == offsets)
+    assert res.yout.shape == (offsets[-1], 3)
+    for idx, (x, y0, k) in enumerate(zip(xouts, y0s, ks)):
+        ref = odesys.integrate(x, y0, k, integrator='native', **kwargs)
+        assert res[idx].info['success'] and res[idx].info['mode'] == 'predefined'
+        assert np.all(res[idx].xout == x)
+        assert np.allclose(res[idx].yout, ref.yout)
+    shared = odesys.integrate_ragged(np.concatenate(xouts), offsets, y0s, ks[0], **kwargs)
+    assert np.allclose(shared[0].yout, res[0].yout)
+
+
+def _test_NativeSys__openmp_schedule(NativeSys, **kwargs):
+    odesys = NativeSys.from_other(_get_decay3())
+    y0s, ks = [(5, 4, 2), (1, 0, 0), (2, 2, 2), (3, 1, 0)], [[4, 3, 2], [1, 2, 3], [.5, .5, .5], [1, 1, 1]]
+    ref = odesys.integrate(1, y0s, ks, integrator='native', nthreads=1, **kwargs)
+    for idx in range(len(y0s)):
+        assert ref[idx].info['thread_id'] == 0
+        assert ref[idx].info['time_threads'].shape == (1,)
+    for schedule in ('static', 'dynamic', 'guided'):
+        res = odesys.integrate(1, y0s, ks, integrator='native', nthreads=2, schedule=schedule, chunk=1, **kwargs)
+        for idx in range(len(y0s)):
+            assert res[idx].info['thread_id'] in (0, 1)
+            assert np.allclose(res[idx].yout[-1, :], ref[idx].yout[-1, :])
+        res = odesys.integrate(np.linspace(0, 1, 7), y0s, ks, integrator='native', nthreads=2,
+                               schedule=schedule, **kwargs)
+        assert all(np.allclose(r.yout[-1, :], rr.yout[-1, :]) for r, rr in zip(res, ref))
+    with pytest.raises(ValueError):
+        odesys.integrate(1, y0s, ks, integrator='native', schedule='fair', **kwargs)
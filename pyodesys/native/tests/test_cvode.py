@@ -14,10 +14,15 @@ from ._tests import (
     _test_Decay_nonnegative, _test_NativeSys__first_step_cb, _test_NativeSys__first_step_cb_source_code,
     _test_NativeSys__roots, _test_NativeSys__get_dx_max_source_code, _test_NativeSys__band,
     _test_NativeSys__dep_by_name__single_varied, _test_PartiallySolvedSystem_Native,
-    _test_return_on_error_success
+    _test_return_on_error_success, _test_NativeSys__module_cache,
+    _test_NativeSys__chunked, _test_NativeSys__async_compile,
+    _test_NativeSys__codegen_info, _test_NativeSys__jtimes, _test_NativeSys__preconditioners,
+    _test_NativeSys__forward_sensitivities, _test_NativeSys__adjoint_gradient, _test_NativeSys__dense_output,
+    _test_NativeSys__iter_integrate, _test_NativeSys__integrate_ragged,
+    _test_NativeSys__openmp_schedule
 )
 from ._test_robertson_native import _test_chained_multi_native
-from ..cvode import NativeCvodeSys as NativeSys
+from ..cvode import NativeCvodeSys as NativeSys, NativeCvodeSensSys, NativeCvodeAdjointSys
 from pyodesys.tests.test_symbolic import _test_chained_parameter_variation
 
 
@@ -137,11 +142,81 @@ def test_NativeSys_get_dx_max_source_code():
 
 
 @requires('pycvodes')
-@pytest.mark.xfail  # not yet implemented
 def test_NativeSys__band():
     _test_NativeSys__band(NativeSys)
 
 
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__module_cache(tmpdir):
+    _test_NativeSys__module_cache(NativeSys, tmpdir, integrator='cvode')
+
+
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__chunked():
+    _test_NativeSys__chunked(NativeSys)
+
+
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__async_compile():
+    _test_NativeSys__async_compile(NativeSys, integrator='cvode')
+
+
+@requires('pycvodes')
+def test_NativeSys__codegen_info():
+    _test_NativeSys__codegen_info(NativeSys)
+
+
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__jtimes():
+    _test_NativeSys__jtimes(NativeSys)
+
+
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__preconditioners():
+    _test_NativeSys__preconditioners(NativeSys)
+
+
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__forward_sensitivities():
+    _test_NativeSys__forward_sensitivities(NativeCvodeSensSys)
+
+
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__adjoint_gradient():
+    _test_NativeSys__adjoint_gradient(NativeCvodeAdjointSys)
+
+
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__dense_output():
+    _test_NativeSys__dense_output(NativeSys)
+
+
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__iter_integrate():
+    _test_NativeSys__iter_integrate(NativeSys)
+
+
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__integrate_ragged():
+    _test_NativeSys__integrate_ragged(NativeSys)
+
+
+@pytest.mark.slow
+@requires('pycvodes')
+def test_NativeSys__openmp_schedule():
+    _test_NativeSys__openmp_schedule(NativeSys)
+
+
 @pytest.mark.slow
 @requires('pycvodes')
 def test_NativeSys__dep_by_name__single_varied():
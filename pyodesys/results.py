@@ -1,31 +1,184 @@
 # -*- coding: utf-8 -*-
 from __future__ import (absolute_import, division, print_function)
 
+import json
+import os
+import warnings
+
 import numpy as np
 
 from .plotting import plot_result, plot_phase_plane, info_vlines
-from .util import import_
+from .util import import_, _last_step
 
-CubicSpline = import_('scipy.interpolate', 'CubicSpline')
+BPoly = import_('scipy.interpolate', 'BPoly')
+PPoly = import_('scipy.interpolate', 'PPoly')
 interp1d = import_('scipy.interpolate', 'interp1d')
+comb = import_('scipy.special', 'comb')
+
+
+def _hermite_bpoly(x, derivs):
+    """ Piecewise two-point Hermite interpolant in Bernstein form.
+
+    Parameters
+    ----------
+    x : array of shape ``(nx,)``
+        Strictly increasing breakpoints.
+    derivs : array of shape ``(nx, m + 1, ny)``
+        Values and the first ``m`` derivatives at each breakpoint.
+
+    Returns
+    -------
+    Instance of ``scipy.interpolate.BPoly`` (degree ``2*m + 1``, matching all
+    derivatives at both ends of every interval), constructed without any
+    per-interval Python loop.
+
+    """
+    x = np.asarray(x, dtype=np.float64)
+    derivs = np.asarray(derivs, dtype=np.float64)
+    m = derivs.shape[1] - 1
+    n = 2*m + 1
+    h = np.diff(x).reshape((-1,) + (1,)*(derivs.ndim - 2))
+    c = np.empty((n + 1, x.size - 1) + derivs.shape[2:])
+    fact = 1.0  # (n - i)!/n!
+    for i in range(m + 1):
+        left, right = derivs[:-1, i, ...]*h**i*fact, derivs[1:, i, ...]*h**i*fact
+        for j in range(i):
+            left = left - (-1)**(i - j)*comb(i, j)*c[j]
+            right = right - (-1)**j*comb(i, j)*c[n - j]
+        c[i], c[n - i] = left, (-1)**i*right
+        fact /= n - i
+    return BPoly(c, x)
 
 
 class Result(object):
 
-    def __init__(self, xout, yout, params, info, odesys):
+    def __init__(self, xout, yout, params, info, odesys, sens=None):
         self.xout = xout
         self.yout = yout
         self.params = params
         self.info = info
         self.odesys = odesys
+        self.sens = sens  # dy/dp, shape: (len(xout), ny, nsens), see symbolic.ForwardSensitivitySystem
+
+    def _reset_interpolants(self):
+        self._dense_interpolant = None
+        self._spline_interpolants = {}  # use_deriv -> (interpolant, reference)
+
+    # The interpolants used by :meth:`at` are cached, reassigning the data discards them:
+
+    @property
+    def xout(self):
+        return self._xout
+
+    @xout.setter
+    def xout(self, value):
+        self._xout = value
+        self._reset_interpolants()
+
+    @property
+    def yout(self):
+        return self._yout
+
+    @yout.setter
+    def yout(self, value):
+        self._yout = value
+        self._reset_interpolants()
+
+    @property
+    def info(self):
+        return self._info
+
+    @info.setter
+    def info(self, value):
+        self._info = value
+        self._reset_interpolants()
 
     def copy(self):
         return Result(self.xout.copy(), self.yout.copy(), self.params.copy(),
-                      self.info.copy(), self.odesys)
+                      self.info.copy(), self.odesys, None if self.sens is None else self.sens.copy())
 
     def __len__(self):
         return 3
 
+    _array_attrs = ('xout', 'yout', 'params', 'sens')
+
+    def save(self, path):
+        """ Stores the result in the directory ``path`` (see :meth:`load`).
+
+        Arrays (``xout``, ``yout``, ``params``, ``sens`` and array valued entries of ``info``)
+        are stored as ``.npy`` files (arrays shared between them only once), the remaining
+        entries of ``info`` together with :meth:`ODESys.fingerprint` in ``result.json``.
+        The system itself is not stored.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        fingerprint = None if self.odesys is None else self.odesys.fingerprint()
+        arrays, meta = [], {'format': 1, 'fingerprint': fingerprint, 'aliases': {}, 'info': {}}
+
+        def _store(key, arr):
+            for other_key, other in arrays:
+                if other is arr:
+                    meta['aliases'][key] = other_key
+                    return
+            arrays.append((key, arr))
+            np.save(os.path.join(path, key + '.npy'), getattr(arr, 'magnitude', arr))
+
+        for attr in self._array_attrs:
+            if getattr(self, attr) is not None:
+                _store(attr, getattr(self, attr))
+        for key, val in self.info.items():
+            if isinstance(val, np.ndarray):
+                _store('info.' + key, val)
+                continue
+            if isinstance(val, np.generic):
+                val = val.item()
+            try:
+                json.dumps(val)
+            except TypeError:
+                warnings.warn("Skipping info entry not serializable to JSON: %s" % key)
+            else:
+                meta['info'][key] = val
+        meta['arrays'] = [key for key, _ in arrays]
+        with open(os.path.join(path, 'result.json'), 'wt') as ofh:
+            json.dump(meta, ofh)
+
+    @classmethod
+    def load(cls, path, odesys=None, mmap_mode='r'):
+        """ Loads a result stored by :meth:`save`.
+
+        Parameters
+        ----------
+        path : str
+            Directory passed to :meth:`save`.
+        odesys : ODESys instance or iterable of such (optional)
+            The system matching the stored fingerprint is attached to the result (systems
+            without a fingerprint, see :meth:`ODESys.fingerprint`, never match).
+        mmap_mode : str or None
+            Passed to ``numpy.load``: by default the arrays are memory-mapped (read-only)
+            and read lazily.
+
+        Raises
+        ------
+        ValueError
+            If ``odesys`` is given but no system matches the stored fingerprint.
+        """
+        with open(os.path.join(path, 'result.json'), 'rt') as ifh:
+            meta = json.load(ifh)
+        if odesys is not None:
+            candidates = [odesys] if hasattr(odesys, 'fingerprint') else list(odesys)
+            matching = [c for c in candidates if meta['fingerprint'] is not None and
+                        c.fingerprint() == meta['fingerprint']]
+            if not matching:
+                raise ValueError("No system matching fingerprint %s" % meta['fingerprint'])
+            odesys = matching[0]
+        arrays = {key: np.load(os.path.join(path, key + '.npy'), mmap_mode=mmap_mode) for key in meta['arrays']}
+        for key, other_key in meta['aliases'].items():
+            arrays[key] = arrays[other_key]
+        info = dict(meta['info'])
+        info.update({key[len('info.'):]: arr for key, arr in arrays.items() if key.startswith('info.')})
+        return cls(*[arrays.get(attr) for attr in cls._array_attrs[:3]], info=info, odesys=odesys,
+                   sens=arrays.get('sens'))
+
     def __getitem__(self, key):
         if key == 0:
             return self.xout
@@ -58,7 +211,13 @@ class Result(object):
     def at(self, x, use_deriv=False, xdata=None, ydata=None, linear=False):
         """ Returns interpolated result at a given time and an interpolation error-estimate
 
-        By default interpolation is performed using cubic splines.
+        By default interpolation is performed using cubic splines (local: through two
+        points on each side of the interval). The piecewise polynomials are constructed
+        once (and cached) and evaluated vectorized over ``x``. If the integration
+        was performed with ``dense_output=True`` (see :meth:`ODESys.integrate`) the
+        (vectorized) Hermite interpolant through the stored derivatives is evaluated
+        instead (unless any of ``xdata``, ``ydata`` or ``linear`` is given), in which
+        case the error estimate is ``None``.
 
         Parameters
         ----------
@@ -74,9 +233,16 @@ class Result(object):
         Returns
         -------
         interpolated_y : array
+            Shape ``(ny,)`` for scalar ``x``, ``(len(x), ny)`` otherwise.
         error_estim_y : array
 
+        .. versionchanged:: 0.12.0
+            For an array ``x`` a pair of arrays is returned (previously a list of pairs).
+
         """
+        if 'dense_output' in self.info and xdata is None and ydata is None and not linear:
+            return self._dense_at(x), None
+        cacheable = xdata is None and ydata is None
         if xdata is None:
             xdata = self.xout
         if ydata is None:
@@ -86,47 +252,61 @@ class Result(object):
 
         if linear:
             return interp1d(xdata, ydata, axis=0)(x)*yunit, None
+
+        if cacheable:
+            if use_deriv not in self._spline_interpolants:
+                self._spline_interpolants[use_deriv] = self._piecewise_cubics(xdata, ydata, use_deriv)
+            interp, ref = self._spline_interpolants[use_deriv]
         else:
-            try:
-                len(x)
-            except TypeError:
-                pass
-            else:
-                return [self.at(_, use_deriv, xdata, ydata, linear) for _ in x]
-
-        if x == xdata[0]:
-            res = ydata[0, :]
-            err = res*0
-        elif x == xdata[-1]:
-            res = ydata[-1, :]
-            err = res*0
+            interp, ref = self._piecewise_cubics(xdata, ydata, use_deriv)
+
+        x = np.asarray(x)
+        xv = x.reshape(-1)
+        if np.any(xv < xdata[0]) or np.any(xv > xdata[-1]):
+            raise ValueError("x outside bounds")
+        res = interp(xv)
+        err = np.abs(res - ref(xv))
+        knot = np.clip(np.searchsorted(xdata, xv), 0, xdata.size - 1)
+        hit = xdata[knot] == xv
+        res[hit], err[hit] = ydata[knot[hit]], 0
+        shape = x.shape + ydata.shape[1:]
+        return res.reshape(shape)*yunit, err.reshape(shape)*yunit
+
+    def _piecewise_cubics(self, xdata, ydata, use_deriv):
+        """ Returns a pair of piecewise polynomials: interpolant & reference (for error estimate). """
+        h = np.diff(xdata)[:, None]
+        y0, y1 = ydata[:-1, :], ydata[1:, :]
+        # local cubic through (up to) two points on each side of every interval:
+        n = xdata.size
+        lo = np.maximum(0, np.arange(n - 1) - 1)
+        valid = np.arange(4) < (np.minimum(n, lo + 4) - lo)[:, None]
+        idx = np.minimum(lo[:, None] + np.arange(4), n - 1)
+        s = (xdata[idx] - xdata[:-1, None])/h
+        vander = np.where(valid[..., None], s[..., None]**np.arange(4), np.eye(4))  # padding: zero coeff.
+        coeffs = np.linalg.solve(vander, np.where(valid[..., None], ydata[idx], 0))
+        cub = PPoly(coeffs[:, ::-1, :].transpose(1, 0, 2)/h**np.arange(3, -1, -1)[:, None, None], xdata)
+        if use_deriv:
+            # y = a + b*x + c*x**2 + d*x**3
+            # dydx = b + 2*c*x + 3*d*x**2
+            args = (self.params,) if len(self.params) > 0 else ()
+            dydx = np.array([np.asarray(self.odesys.f_cb(xv, yv, *args)) for xv, yv in zip(xdata, ydata)])
+            y0p, y1p = dydx[:-1, :]*h, dydx[1:, :]*h
+            d = y0p + y1p + 2*y0 - 2*y1
+            c = -2*y0p - y1p - 3*y0 + 3*y1
+            b, a = y0p, y0
+            hermite = PPoly(np.array([d/h**3, c/h**2, b/h, a]), xdata)
+            return hermite, cub
         else:
-            idx = np.argmax(xdata > x)
-            if idx == 0:
-                raise ValueError("x outside bounds")
-            idx_l = max(0, idx - 2)
-            idx_u = min(xdata.size, idx_l + 4)
-            slc = slice(idx_l, idx_u)
-            res_cub = CubicSpline(xdata[slc], ydata[slc, :])(x)
-            x0, x1 = xdata[idx - 1], xdata[idx]
-            y0, y1 = ydata[idx - 1, :], ydata[idx, :]
-            xspan, yspan = x1 - x0, y1 - y0
-            avgx, avgy = .5*(x0 + x1), .5*(y0 + y1)
-            if use_deriv:
-                # y = a + b*x + c*x**2 + d*x**3
-                # dydx = b + 2*c*x + 3*d*x**2
-                y0p, y1p = [np.asarray(self.odesys.f_cb(x, y, self.params))*xspan for y in (y0, y1)]
-                lsx = (x - x0)/xspan
-                d = y0p + y1p + 2*y0 - 2*y1
-                c = -2*y0p - y1p - 3*y0 + 3*y1
-                b, a = y0p, y0
-                res_poly = a + b*lsx + c*lsx**2 + d*lsx**3
-                res, err = res_poly, np.abs(res_poly - res_cub)
-            else:
-                res_lin = avgy + yspan/xspan*(x - avgx)
-                res, err = res_cub, np.abs(res_cub - np.asarray(res_lin))
+            return cub, PPoly(np.array([(y1 - y0)/h, y0]), xdata)
 
-        return res*yunit, err*yunit
+    def _dense_at(self, x):
+        xout = self.info['internal_xout']
+        x = np.asarray(x)
+        if np.any(x < xout[0]) or np.any(x > xout[-1]):
+            raise ValueError("x outside bounds")
+        if self._dense_interpolant is None:
+            self._dense_interpolant = _hermite_bpoly(xout, self.info['dense_output'])
+        return self._dense_interpolant(x)*getattr(self.yout, 'units', 1)
 
     def _internal(self, key, override=None):
         if override is None:
@@ -279,6 +459,10 @@ class Result(object):
             autonomous = odesys.autonomous_interface
         x0 = self.xout[-1]
         nx0 = self.xout.size
+        if odesys is self.odesys and 'first_step' not in kwargs:
+            last_step = _last_step(self.info)
+            if last_step is not None:  # avoid the startup transient of the restarted integrator
+                kwargs['first_step'] = last_step
         res = odesys.integrate(
             (
                 self.odesys.numpy.linspace((xend - x0)*0, (xend - x0), npoints+1) if autonomous
@@ -309,3 +493,176 @@ class Result(object):
                 new_info[k] += v
         self.info = new_info
         return self
+
+
+def _consecutive(arrs, stack):
+    """ The array of which ``arrs`` are consecutive parts (``None`` if there is no such array).
+
+    With ``stack`` the parts are the rows of the returned array, otherwise they are
+    concatenated along the first axis.
+    """
+    first = arrs[0]
+    addr = first.__array_interface__['data'][0]
+    for arr in arrs:
+        if (not arr.flags['C_CONTIGUOUS'] or arr.dtype != first.dtype or arr.size == 0 or
+                arr.shape[0 if stack else 1:] != first.shape[0 if stack else 1:] or
+                arr.__array_interface__['data'][0] != addr):
+            return None
+        addr += arr.nbytes
+    if stack:
+        shape, strides = (len(arrs),) + first.shape, (first.nbytes,) + first.strides
+    else:
+        shape, strides = (sum(arr.shape[0] for arr in arrs),) + first.shape[1:], first.strides
+    return np.lib.stride_tricks.as_strided(first, shape=shape, strides=strides)
+
+
+def _gather(infos, key, offsets):
+    """ Moves ``key`` out of the info dicts into one contiguous array (instance by instance). """
+    arrs = [np.asarray(d[key]) for d in infos]
+    out = _consecutive(arrs, offsets is None)
+    if out is None:
+        if offsets is None:
+            shape = (len(arrs),) + arrs[0].shape
+        else:
+            shape = (offsets[-1],) + arrs[0].shape[1:]
+        out = np.empty(shape, dtype=np.result_type(*arrs))
+        del arrs
+        for idx, d in enumerate(infos):  # releasing the arrays of the instances as we go
+            if offsets is None:
+                out[idx, ...] = d.pop(key)
+            else:
+                out[offsets[idx]:offsets[idx+1], ...] = d.pop(key)
+    else:
+        for d in infos:
+            d.pop(key)
+    return out
+
+
+class BatchResult(object):
+    """ Results from integrating several instances of an ODE system.
+
+    The output of all instances is stored contiguously: in predefined mode as arrays of
+    shape ``(n, nx)`` and ``(n, nx, ny)``, in adaptive mode (where the number of points
+    differ between instances) concatenated along the first axis with :attr:`offsets`
+    delimiting the instances (cf. the CSR format for sparse matrices).
+    :class:`Result` instances for individual instances are created upon request
+    (indexing or iteration), which makes :class:`BatchResult` a drop-in replacement
+    for a list of :class:`Result` instances.
+
+    Parameters
+    ----------
+    internal_xout : array
+        Shape ``(n, nx)`` or (adaptive mode) ``(offsets[-1],)``.
+    internal_yout : array
+        Shape ``(n, nx, ny)`` or (adaptive mode) ``(offsets[-1], ny)``.
+    internal_params : array
+        Shape ``(n, nparams)``.
+    infos : list of dicts
+        Info dicts (without the ``internal_*`` entries).
+    odesys : ODESys instance
+    offsets : array of ints or None
+        Length ``n + 1``, ``None`` indicates predefined mode.
+
+    Attributes
+    ----------
+    xout : array
+        Post-processed values of the independent variable (same layout as ``internal_xout``).
+    yout : array
+        Post-processed values of the dependent variables (same layout as ``internal_yout``).
+    params : array
+        Post-processed parameters.
+    infos : list of dicts
+    offsets : array of ints or None
+
+    """
+
+    def __init__(self, internal_xout, internal_yout, internal_params, infos, odesys, offsets=None):
+        self.internal_xout = internal_xout
+        self.internal_yout = internal_yout
+        self.internal_params = internal_params
+        self.infos = infos
+        self.odesys = odesys
+        self.offsets = None if offsets is None else np.asarray(offsets, dtype=np.int64)
+        self._processed = None
+        self._results = [None]*len(infos)
+
+    @classmethod
+    def from_infos(cls, infos, odesys):
+        """ Creates an instance from info dicts as returned by ``_integrate_*`` methods.
+
+        The ``internal_*`` entries are moved out of the info dicts (which are modified) into
+        preallocated arrays. When the output of the instances already are consecutive parts
+        of one array (the drivers of predefined mode write into a buffer for all instances)
+        that array is used without copying.
+        """
+        sizes = [np.size(d['internal_xout']) for d in infos]
+        if all(size == sizes[0] for size in sizes) and all(d.get('mode') == 'predefined' for d in infos):
+            offsets = None
+        else:
+            offsets = np.cumsum([0] + sizes)
+        params = np.array([d.pop('internal_params') for d in infos])
+        xout, yout = [_gather(infos, key, offsets) for key in ('internal_xout', 'internal_yout')]
+        return cls(xout, yout, params, infos, odesys, offsets)
+
+    def __len__(self):
+        return len(self.infos)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[idx] for idx in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("BatchResult index out of range")
+        if self._results[key] is None:
+            self._results[key] = self._get_result(key)
+        return self._results[key]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def _slice(self, arr, idx):
+        if self.offsets is None:
+            return arr[idx]
+        else:
+            return arr[self.offsets[idx]:self.offsets[idx+1]]
+
+    def internal(self, idx):
+        """ Internal (xout, yout, params) of instance ``idx`` (views). """
+        return (self._slice(self.internal_xout, idx), self._slice(self.internal_yout, idx),
+                self.internal_params[idx])
+
+    def _get_result(self, idx):
+        info = dict(self.infos[idx])
+        info['internal_xout'], info['internal_yout'], info['internal_params'] = self.internal(idx)
+        if self._processed is None and self.odesys.post_processors:
+            xout, yout, params = self.odesys.post_process(*self.internal(idx))
+        else:
+            xout, yout, params = [self._slice(arr, idx) if i < 2 else arr[idx]
+                                  for i, arr in enumerate(self._post_processed())]
+        return Result(xout, yout, params, info, self.odesys)
+
+    def _post_processed(self):
+        if not self.odesys.post_processors:
+            return self.internal_xout, self.internal_yout, self.internal_params
+        if self._processed is None:
+            processed = [self.odesys.post_process(*self.internal(idx)) for idx in range(len(self))]
+            if self.offsets is None:
+                self._processed = tuple(np.array(arrs) for arrs in zip(*processed))
+            else:
+                xouts, youts, params = zip(*processed)
+                self._processed = np.concatenate(xouts), np.concatenate(youts), np.array(params)
+        return self._processed
+
+    @property
+    def xout(self):
+        return self._post_processed()[0]
+
+    @property
+    def yout(self):
+        return self._post_processed()[1]
+
+    @property
+    def params(self):
+        return self._post_processed()[2]
@@ -16,6 +16,7 @@ import numpy as np
 
 from .util import import_
 from .core import ODESys, RecoverableError
+from .results import Result
 from .util import (
     transform_exprs_dep, transform_exprs_indep, _ensure_4args, _Callback
 )
@@ -167,6 +168,13 @@ class SymbolicSys(ODESys):
         When ``True`` construct using ``be.Symbol``. See also :attr:`init_indep`.
     init_dep : tuple of Symbols, ``True`` or ``None``
         When ``True`` construct using ``be.Symbol``. See also :attr:`init_dep`.
+    sparse : bool (default: False)
+        Use a sparse (CSC) jacobian with integrators supporting it (cvode with
+        ``linear_solver='klu'`` & scipy's ``solve_ivp``). See :meth:`get_jac_sparse`.
+    jtimes : bool (default: False)
+        Derive the jacobian-vector product (see :meth:`get_jtimes`), used by the native
+        code for the Krylov (iterative) linear solvers of cvode. Also with ``jac=False``
+        (the jacobian matrix is then never formed).
     \*\*kwargs:
         See :py:class:`ODESys`
 
@@ -206,6 +214,65 @@ class SymbolicSys(ODESys):
                       'taken_names', 'numpy')
     append_iv = True
 
+    @property
+    def j_cb(self):
+        """ Callback for the jacobian (derived and compiled upon first access). """
+        if '_j_cb' not in self.__dict__:
+            self.__dict__['_j_cb'] = self.get_j_ty_callback()
+        return self.__dict__['_j_cb']
+
+    @j_cb.setter
+    def j_cb(self, value):
+        self.__dict__['_j_cb'] = value
+
+    @j_cb.deleter
+    def j_cb(self):
+        self.__dict__.pop('_j_cb', None)
+
+    @property
+    def sparse_j_cb(self):
+        """ Callback for the non-zero entries of the jacobian in CSC order (see :meth:`get_jac_sparse`),
+        built upon first access. """
+        if '_sparse_j_cb' not in self.__dict__:
+            self.__dict__['_sparse_j_cb'] = self.get_sparse_j_ty_callback()
+        return self.__dict__['_sparse_j_cb']
+
+    @property
+    def dfdx_cb(self):
+        """ Callback for the derivatives of :attr:`exprs` with respect to :attr:`indep`
+        (derived and compiled upon first access). """
+        if '_dfdx_cb' not in self.__dict__:
+            self.__dict__['_dfdx_cb'] = self.get_dfdx_callback()
+        return self.__dict__['_dfdx_cb']
+
+    @dfdx_cb.setter
+    def dfdx_cb(self, value):
+        self.__dict__['_dfdx_cb'] = value
+
+    @dfdx_cb.deleter
+    def dfdx_cb(self):
+        self.__dict__.pop('_dfdx_cb', None)
+
+    def is_materialized(self, attr):
+        """ Whether a lazily built attribute has been built.
+
+        Parameters
+        ----------
+        attr : str
+            One of 'j_cb', 'dfdx_cb', 'sparse_j_cb', 'jac' (symbolic jacobian) & 'dfdx'
+            (symbolic derivatives with respect to the independent variable).
+
+        """
+        if attr in ('j_cb', 'dfdx_cb', 'sparse_j_cb'):
+            return '_' + attr in self.__dict__
+        elif attr in ('jac', 'dfdx'):
+            return getattr(self, '_' + attr) is not True
+        else:
+            raise ValueError("Unknown attribute: %s" % attr)
+
+    def _has_jacobian(self):
+        return self._jac is not False
+
     @property
     def linear_invariants(self):
         return getattr(self, '_linear_invariants', None)
@@ -218,7 +285,7 @@ class SymbolicSys(ODESys):
                  roots=None, backend=None, lower_bounds=None, upper_bounds=None,
                  linear_invariants=None, nonlinear_invariants=None,
                  linear_invariant_names=None, nonlinear_invariant_names=None, steady_state_root=False,
-                 init_indep=None, init_dep=None, **kwargs):
+                 init_indep=None, init_dep=None, sparse=False, jtimes=False, **kwargs):
         self.dep, self.exprs = zip(*dep_exprs.items()) if isinstance(dep_exprs, dict) else zip(*dep_exprs)
         self.indep = indep
         if params is True or params is None:
@@ -267,19 +334,25 @@ class SymbolicSys(ODESys):
             kwargs['param_names'] = [p.name for p in self.params]
 
         self.band = kwargs.get('band', None)  # needed by get_j_ty_callback
+        if sparse and self.band is not None:
+            raise ValueError("A jacobian cannot be both banded and sparse")
+        self.sparse = sparse
+        self.jtimes = jtimes
+        self._jtimes = jtimes
         # bounds needed by get_f_ty_callback:
         self.lower_bounds = None if lower_bounds is None else np.array(lower_bounds)*np.ones(self.ny)
         self.upper_bounds = None if upper_bounds is None else np.array(upper_bounds)*np.ones(self.ny)
 
         super(SymbolicSys, self).__init__(
             self.get_f_ty_callback(),
-            self.get_j_ty_callback(),
-            self.get_dfdx_callback(),
+            None,  # j_cb & dfdx_cb are built upon first access
+            None,
             self.get_first_step_callback(),
             self.get_roots_callback(),
             nroots=None if roots is None else len(roots),
             autonomous_exprs=_is_autonomous(self.indep, self.exprs),
             **kwargs)
+        del self.j_cb, self.dfdx_cb
 
         self.linear_invariants = linear_invariants
         self.nonlinear_invariants = nonlinear_invariants
@@ -297,6 +370,29 @@ class SymbolicSys(ODESys):
         if self.autonomous_interface is None:
             self.autonomous_interface = self.autonomous_exprs
 
+    def _fingerprint_parts(self):
+        bounds = [None if b is None else list(b) for b in (self.lower_bounds, self.upper_bounds)]
+        return [self.names, self.param_names, self.indep_name, self.band, self.nroots, self.append_iv,
+                self.autonomous_interface, self.dep, self.indep, self.params, self.exprs, self.roots,
+                self.linear_invariants, self.nonlinear_invariants] + bounds
+
+    def __getstate__(self):
+        state = super(SymbolicSys, self).__getstate__()
+        state['be'] = self._backend_name()
+        if self.lower_bounds is not None or self.upper_bounds is not None:
+            state['f_cb'] = None  # closure, regenerated when unpickled
+        return state
+
+    def __setstate__(self, state):
+        state['be'] = Backend(state['be'])
+        super(SymbolicSys, self).__setstate__(state)
+        if self.f_cb is None:
+            self.f_cb = self.get_f_ty_callback()
+
+    def _backend_name(self):
+        """ Name of the backend (as accepted by ``sym.Backend``). """
+        return next(k for k, v in Backend.backends.items() if type(self.be) is v)
+
     def _Symbol(self, name, be=None):
         be = be or self.be
         try:
@@ -627,6 +723,55 @@ class SymbolicSys(ODESys):
 
         return self._jac
 
+    def get_jac_sparse(self):
+        """ Derives the non-zero entries of the jacobian in CSC format.
+
+        The sparsity pattern is taken from the symbolic expressions (entries which
+        are identically zero are not stored).
+
+        Returns
+        -------
+        Length 3 tuple: (data, colptrs, rowvals)
+            data : Matrix of shape ``(1, nnz)`` with expressions for the non-zero entries.
+            colptrs : array of ints (length ``ny + 1``).
+            rowvals : array of ints (length ``nnz``).
+
+        """
+        if getattr(self, '_jac_sparse', None) is None:
+            if self._jac is False:
+                return False
+            elif self._jac is True:  # avoid building the dense matrix
+                self._jac_sparse = self.be.sparse_jacobian_csc(self.exprs, self.dep)
+            else:
+                jac = self.get_jac()
+                if self.band is not None:
+                    raise NotImplementedError("Sparse jacobian from banded jacobian")
+                data, colptrs, rowvals = [], [0], []
+                for ci in range(self.ny):
+                    for ri in range(self.ny):
+                        if jac[ri, ci] != 0:
+                            data.append(jac[ri, ci])
+                            rowvals.append(ri)
+                    colptrs.append(len(data))
+                self._jac_sparse = (self.be.Matrix(1, len(data), data), np.asarray(colptrs, dtype=int),
+                                    np.asarray(rowvals, dtype=int))
+        return self._jac_sparse
+
+    @property
+    def nnz(self):
+        """ Number of (structurally) non-zero entries in the jacobian (-1 if not :attr:`sparse`). """
+        if not self.sparse:
+            return -1
+        return self.get_jac_sparse()[0].shape[1]
+
+    @property
+    def colptrs(self):
+        return self.get_jac_sparse()[1]
+
+    @property
+    def rowvals(self):
+        return self.get_jac_sparse()[2]
+
     def jacobian_singular(self):
         """ Returns True if Jacobian is singular, else False. """
         cses, (jac_in_cses,) = self.be.cse(self.get_jac())
@@ -635,6 +780,35 @@ class SymbolicSys(ODESys):
         else:
             return False
 
+    def get_jtimes(self):
+        """ Derives the jacobian-vector product from ``self.exprs`` and ``self.dep``.
+
+        Only the (structurally) non-zero elements of the jacobian are formed.
+
+        Returns
+        -------
+        Length 2 tuple: (v, jtimes)
+            v : tuple of symbols (the vector)
+            jtimes : tuple of expressions (the product)
+        False if :attr:`jtimes` is False.
+        """
+        if self._jtimes is True:
+            v = tuple(self.be.Dummy('v_%d' % idx) for idx in range(self.ny))
+            zero = 0*self.be.Dummy()**0
+            if self.band is None and self._jac not in (True, False):  # user provided jacobian
+                jac = self.get_jac()
+                jtimes = [sum([jac[ri, ci]*v[ci] for ci in range(self.ny) if jac[ri, ci] != 0], zero)
+                          for ri in range(self.ny)]
+            else:
+                jtimes = []
+                for expr in self.exprs:
+                    free = expr.free_symbols
+                    jtimes.append(sum([expr.diff(dep)*vi for dep, vi in zip(self.dep, v) if dep in free], zero))
+            self._jtimes = v, tuple(jtimes)
+        elif self._jtimes is False:
+            return False
+        return self._jtimes
+
     def get_dfdx(self):
         """ Calculates 2nd derivatives of ``self.exprs`` """
         if self._dfdx is True:
@@ -679,6 +853,14 @@ class SymbolicSys(ODESys):
             return None
         return self._callback_factory(j_exprs)
 
+    def get_sparse_j_ty_callback(self):
+        """ Generates a callback for evaluating the non-zero entries of the jacobian (CSC order). """
+        jac_sparse = self.get_jac_sparse()
+        if jac_sparse is False:
+            return None
+        data = jac_sparse[0]
+        return self._callback_factory([data[0, idx] for idx in range(data.shape[1])])
+
     def get_dfdx_callback(self):
         """ Generate a callback for evaluating derivative of ``self.exprs`` """
         dfdx_exprs = self.get_dfdx()
@@ -1303,6 +1485,271 @@ class PartiallySolvedSystem(SymbolicSys):
         return super(PartiallySolvedSystem, self).integrate(*args, **kwargs)
 
 
+class ForwardSensitivitySystem(SymbolicSys):
+    """ Augments a system with its forward sensitivity equations.
+
+    The sensitivities ``s[i, j] = dy[i]/dp[j]`` are integrated together with the original
+    system (``ds[i, j]/dx = sum_k df[i]/dy[k]*s[k, j] + df[i]/dp[j]``, where
+    only structurally non-zero terms are formed), i.e. one integration gives the
+    derivatives with respect to all parameters. The initial values of the sensitivities
+    are zero. :meth:`integrate` returns results of ``original_system`` with the
+    attribute ``sens`` (array of shape ``(nx, ny, nsens)``).
+
+    Note that the augmented system has ``ny*(1 + nsens)`` dependent variables: a dense
+    jacobian makes every factorization in implicit steppers cost ``O((ny*(1 + nsens))**3)``.
+    The jacobian is block lower triangular (with the jacobian of ``original_system`` repeated
+    along the diagonal), hence for larger systems pass ``sparse=True`` (e.g. scipy's 'BDF'
+    and 'Radau' or cvode with KLU) or, with generated code, ``jtimes=True`` together with an
+    iterative linear solver. Both default to the corresponding setting of ``original_system``.
+
+    Integration by generated code is obtained by combining with a native class, e.g.
+    ``NativeCvodeSensSys`` in :mod:`pyodesys.native.cvode`.
+
+    Parameters
+    ----------
+    original_system : SymbolicSys
+    sens_params : iterable of symbols or names (optional)
+        Parameters of interest, default: all of ``original_system.params``.
+    \*\*kwargs : dict
+        Keyword arguments passed onto :class:`SymbolicSys`.
+
+    Attributes
+    ----------
+    sens_params : tuple of symbols
+    sens_dep : tuple of tuples of symbols (``ny`` tuples of length ``nsens``)
+
+    Examples
+    --------
+    >>> odesys = SymbolicSys.from_callback(lambda x, y, p: [-p[0]*y[0]], 1, 1)
+    >>> senssys = ForwardSensitivitySystem(odesys)
+    >>> res = senssys.integrate(np.linspace(0, 1, 5), [2.0], [3.0], integrator='scipy')
+    >>> res.yout.shape, res.sens.shape
+    ((5, 1), (5, 1, 1))
+    >>> print('%.5f' % res.sens[-1, 0, 0])  # -2*exp(-3)
+    -0.09957
+
+    """
+
+    def __init__(self, original_system, sens_params=None, **kwargs):
+        self._ori_sys = ori = original_system
+        if ori.pre_processors or ori.post_processors:
+            raise NotImplementedError("Systems with pre-/postprocessors are not supported")
+        if getattr(ori, 'init_dep', None) is not None:
+            raise NotImplementedError("Systems with init_indep/init_dep are not supported")
+        if sens_params is None:
+            sens_params = ori.params
+        self.sens_params = tuple(ori.params[ori.param_names.index(p)] if isinstance(p, str) else p
+                                 for p in sens_params)
+        for p in self.sens_params:
+            if p not in ori.params:
+                raise ValueError("Unknown parameter: %s" % p)
+        _be = ori.be
+        if 'backend' in kwargs and Backend(kwargs['backend']) != _be:
+            raise ValueError("Cannot mix backends.")
+        self.sens_dep = tuple(tuple(_be.Dummy('s_%d_%d' % (ri, pi)) for pi in range(len(self.sens_params)))
+                              for ri in range(ori.ny))
+        zero = 0*_be.Dummy()**0
+        sens_exprs = []
+        for pi, par in enumerate(self.sens_params):  # parameter major
+            for expr in ori.exprs:
+                free = expr.free_symbols
+                sens_exprs.append(sum([expr.diff(dep)*sens[pi] for dep, sens in zip(ori.dep, self.sens_dep)
+                                       if dep in free], expr.diff(par) if par in free else zero))
+        new_dep = tuple(ori.dep) + tuple(self.sens_dep[ri][pi] for pi in range(len(self.sens_params))
+                                         for ri in range(ori.ny))
+        nsens = ori.ny*len(self.sens_params)
+
+        new_kw = kwargs.copy()
+        for attr in ('first_step_expr', 'param_names', 'par_by_name', 'dep_by_name', 'latex_param_names',
+                     'description', 'nonlinear_invariants', 'nonlinear_invariant_names', 'numpy'):
+            if attr not in new_kw and getattr(ori, attr, None) is not None:
+                new_kw[attr] = getattr(ori, attr)
+        if 'names' not in new_kw and ori.names:
+            param_names = ori.param_names or [str(p) for p in ori.params]
+            sens_names = ['d(%s)/d(%s)' % (name, param_names[ori.params.index(par)])
+                          for par in self.sens_params for name in ori.names]
+            new_kw['names'] = tuple(ori.names) + tuple(sens_names)
+            new_kw['taken_names'] = tuple(ori.taken_names) + tuple(sens_names)  # y0 given for ori.dep only
+        if ori.linear_invariants is not None and 'linear_invariants' not in new_kw:
+            lin_invar = np.asarray(ori.linear_invariants)
+            new_kw['linear_invariants'] = np.concatenate((lin_invar, np.zeros((lin_invar.shape[0], nsens))), axis=1)
+            new_kw.setdefault('linear_invariant_names', ori.linear_invariant_names)
+        for attr, fill in [('lower_bounds', -np.inf), ('upper_bounds', np.inf)]:
+            if attr not in new_kw and getattr(ori, attr, None) is not None:
+                new_kw[attr] = np.concatenate((getattr(ori, attr), fill*np.ones(nsens)))
+        new_kw.setdefault('roots', ori.roots)
+        new_kw.setdefault('sparse', getattr(ori, 'sparse', False))
+        new_kw.setdefault('jtimes', getattr(ori, '_jtimes', False) is not False)
+
+        def forward_sensitivity_pre_processor(x, y, p):
+            return x, np.concatenate((y, np.zeros(y.shape[:-1] + (nsens,))), axis=-1), p
+
+        new_kw['pre_processors'] = [forward_sensitivity_pre_processor]
+        super(ForwardSensitivitySystem, self).__init__(
+            zip(new_dep, tuple(ori.exprs) + tuple(sens_exprs)), ori.indep, ori.params, backend=_be, **new_kw)
+
+    def integrate(self, *args, **kwargs):
+        if kwargs.get('batch_result', False):
+            raise NotImplementedError("batch_result not supported by ForwardSensitivitySystem")
+        result = super(ForwardSensitivitySystem, self).integrate(*args, **kwargs)
+        if isinstance(result, list):
+            return [self._split_result(res) for res in result]
+        return self._split_result(result)
+
+    def iter_integrate(self, *args, **kwargs):
+        raise NotImplementedError("iter_integrate would reset the sensitivities at the start of every chunk")
+
+    def _split_result(self, res):
+        ny, nsens = self._ori_sys.ny, len(self.sens_params)
+        nparams = len(self.params) + (ny if self.append_iv else 0)
+        sens = res.yout[..., ny:].reshape(res.yout.shape[:-1] + (nsens, ny))
+        return Result(res.xout, res.yout[..., :ny], res.params[..., :nparams], res.info, self._ori_sys,
+                      sens=np.swapaxes(sens, -1, -2))
+
+
+class AdjointSystem(SymbolicSys):
+    """ Adjoint system for the gradient of a scalar objective with respect to the parameters.
+
+    The objective reads ``G = final(x_end, y(x_end), p) + integral(integrand(x, y, p), x0, x_end)``.
+    The instance is the backward (adjoint) system: the multipliers ``lambda`` satisfy
+    ``dlambda/dx = -J^T*lambda - dg/dy`` (with ``lambda(x_end) = dfinal/dy``) and are
+    accompanied by the quadratures of ``dG/dp`` & ``G``. The expressions are formed from
+    ``original_system.exprs`` and the (structurally non-zero part of the) jacobian.
+
+    :meth:`gradient` performs one forward integration of ``original_system`` followed by one
+    backward integration over the whole interval, i.e. the cost is independent of the number
+    of parameters. The forward solution is represented by cubic Hermite interpolation between
+    its points: this system runs in the reversed local variable ``s = x[k+1] - x`` of segment
+    ``k`` with the end points of the segment as parameters, which are looked up from a table
+    (indexed by segment) during the backward integration. The points of the forward solution
+    need to resolve it: pass a dense enough ``x`` (or use adaptive mode with an integrator
+    reporting every step, e.g. cvode).
+
+    Integration of the backward pass by generated code is obtained by combining with a native
+    class, e.g. ``NativeCvodeAdjointSys`` in :mod:`pyodesys.native.cvode` (which integrates
+    segment by segment, since the generated code takes a fixed set of parameters).
+
+    Parameters
+    ----------
+    original_system : SymbolicSys
+    final : expression (optional)
+        In terms of ``original_system.indep``, ``.dep`` & ``.params``.
+    integrand : expression (optional)
+        In terms of ``original_system.indep``, ``.dep`` & ``.params``.
+    \*\*kwargs : dict
+        Keyword arguments passed onto :class:`SymbolicSys`.
+
+    Examples
+    --------
+    >>> odesys = SymbolicSys.from_callback(lambda x, y, p: [-p[0]*y[0]], 1, 1)
+    >>> adjsys = AdjointSystem(odesys, final=odesys.dep[0])  # G = y(x_end)
+    >>> G, grad_p, grad_y0, res = adjsys.gradient(np.linspace(0, 1, 11), [2.0], [3.0], integrator='scipy')
+    >>> print('%.5f %.5f %.5f' % (G, grad_p[0], grad_y0[0]))  # 2*exp(-3), -2*exp(-3), exp(-3)
+    0.09957 -0.09957 0.04979
+
+    """
+
+    def __init__(self, original_system, final=None, integrand=None, **kwargs):
+        self._ori_sys = ori = original_system
+        if final is None and integrand is None:
+            raise ValueError("Need final and/or integrand")
+        if ori.pre_processors or ori.post_processors:
+            raise NotImplementedError("Systems with pre-/postprocessors are not supported")
+        _be = ori.be
+        if 'backend' in kwargs and Backend(kwargs['backend']) != _be:
+            raise ValueError("Cannot mix backends.")
+        zero = 0*_be.Dummy()**0
+        self.final = zero if final is None else final
+        self.integrand = zero if integrand is None else integrand
+        ny, npar = ori.ny, len(ori.params)
+
+        s, x_k, h = _be.Dummy('s'), _be.Dummy('x_k'), _be.Dummy('h')
+        y_k, y_k1, f_k, f_k1 = [tuple(_be.Dummy('%s_%d' % (name, idx)) for idx in range(ny))
+                                for name in ('y_k', 'y_k1', 'f_k', 'f_k1')]
+        theta = 1 - s/h
+        hermite = [y0 + y0p*theta + (-2*y0p - y1p - 3*y0 + 3*y1)*theta**2 + (y0p + y1p + 2*y0 - 2*y1)*theta**3
+                   for y0, y1, y0p, y1p in zip(y_k, y_k1, f_k, f_k1)]
+        subsd = dict(zip(ori.dep, hermite))
+        if ori.indep is not None:
+            subsd[ori.indep] = x_k + h - s
+
+        lmbd = tuple(_be.Dummy('lambda_%d' % idx) for idx in range(ny))
+        quad = tuple(_be.Dummy('q_%d' % idx) for idx in range(npar))
+        value = _be.Dummy('G')
+        free = [expr.free_symbols for expr in ori.exprs]
+        g_free = self.integrand.free_symbols
+
+        def _sum_lambda(symb):
+            return sum([expr.diff(symb)*lmbd[idx] for idx, expr in enumerate(ori.exprs) if symb in free[idx]],
+                       self.integrand.diff(symb) if symb in g_free else zero)
+
+        exprs = [_sum_lambda(dep) for dep in ori.dep] + [_sum_lambda(par) for par in ori.params] + [self.integrand]
+        exprs = [expr.subs(subsd) for expr in exprs]
+        self._ori_f_cb = ori._callback_factory(ori.exprs)
+        self._final_cb = ori._callback_factory(
+            [self.final] + [self.final.diff(dep) for dep in ori.dep] + [self.final.diff(par) for par in ori.params])
+        super(AdjointSystem, self).__init__(
+            zip(lmbd + quad + (value,), exprs), s, _append(ori.params, (x_k, h), y_k, y_k1, f_k, f_k1),
+            backend=_be, **kwargs)
+
+    def gradient(self, x, y0, params=(), forward_kwargs=None, **kwargs):
+        """ Objective & its gradient from one forward & one backward (adjoint) integration.
+
+        Parameters
+        ----------
+        x, y0, params :
+            See :meth:`ODESys.integrate` (of ``original_system``), a single instance.
+        forward_kwargs : dict (optional)
+            Keyword arguments overriding ``kwargs`` for the forward integration.
+        \*\*kwargs :
+            Keyword arguments passed onto :meth:`integrate` (of both systems).
+
+        Returns
+        -------
+        Length 4 tuple: (value, grad_params, grad_y0, result)
+            value : float (the objective)
+            grad_params : array (gradient with respect to ``original_system.params``)
+            grad_y0 : array (gradient with respect to the initial values)
+            result : :class:`pyodesys.results.Result` of the forward integration
+        """
+        ori = self._ori_sys
+        ny, npar = ori.ny, len(ori.params)
+        fwd_kw = dict(kwargs, **(forward_kwargs or {}))
+        result = ori.integrate(x, y0, params, **fwd_kw)
+        if isinstance(result, list) or result.yout.ndim != 2:
+            raise NotImplementedError("Only a single instance is supported")
+        xout, yout = result.xout, result.yout
+        p = np.asarray(result.params, dtype=np.float64)[:npar]
+        fout = self._ori_f_cb(xout, yout, p)
+        fin = np.asarray(self._final_cb(xout[-1], yout[-1], p), dtype=np.float64)
+        state = np.concatenate((fin[1:1+ny], fin[1+ny:], fin[:1]))
+        h = np.diff(xout)
+        seg = [k for k in range(xout.size - 2, -1, -1) if h[k] != 0]  # in backward order
+        if seg:
+            table = np.array([np.concatenate((p, [xout[k], h[k]], yout[k], yout[k+1], fout[k]*h[k], fout[k+1]*h[k]))
+                              for k in seg])
+            tout = xout[-1] - np.array([xout[k+1] for k in seg] + [xout[0]])
+            state = self._integrate_backward(tout, table, state, **kwargs)
+        return state[-1], state[ny:ny+npar], state[:ny], result
+
+    def _integrate_backward(self, tout, table, state, **kwargs):
+        """ Integrates from ``tout[0]`` to ``tout[-1]`` (``t = x_end - x``) where segment ``i``
+        (``tout[i]`` to ``tout[i+1]``) uses the parameters ``table[i]``. """
+        def _segment(cb):
+            def _cb(t, y, p=(), be=None):
+                idx = min(max(np.searchsorted(tout, t, side='right') - 1, 0), len(table) - 1)
+                return cb(t - tout[idx], y, table[idx])
+            return _cb
+
+        jac = self._has_jacobian()
+        odesys = ODESys(_segment(self.f_cb), _segment(self.j_cb) if jac else None,
+                        _segment(self.dfdx_cb) if jac else None, names=self.names)
+        res = odesys.integrate(tout, state, force_predefined=True, **kwargs)
+        if not res.info['success']:
+            raise RuntimeError("Backward integration failed")
+        return res.yout[-1, :]
+
+
 def get_logexp(a=1, b=0, a2=None, b2=None, backend=None):
     """ Utility function for use with :func:symmetricsys.
 
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import (absolute_import, division, print_function)
 
+import copy
+import json
 import math
+import os
 from collections import OrderedDict
 
 import pytest
@@ -166,6 +169,28 @@ def test_custom_module():
     assert info['nfev'] == 4*149
 
 
+def test_custom_module__nthreads():
+    from concurrent.futures import ThreadPoolExecutor
+    from pyodesys.integrators import RK4_example_integrator
+    odes = ODESys(vdp_f, vdp_j)
+    y0 = [[1, 0], [.5, .2], [0, 1], [2, -1], [1, 1]]
+    params = [[2.0], [1.0], [0.5], [1.5], [3.0]]
+    kw = dict(integrator=RK4_example_integrator, first_step=1e-2)
+    ref = odes.integrate([0, 2], y0, params, **kw)
+    res1 = odes.integrate([0, 2], y0, params, nthreads=3, **kw)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        res2 = odes.integrate([0, 2], y0, params, executor=executor, **kw)
+    for r0, r1, r2 in zip(ref, res1, res2):
+        assert np.allclose(r0.yout, r1.yout)
+        assert np.allclose(r0.yout, r2.yout)
+    with pytest.raises(ValueError):
+        odes.integrate([0, 2], y0, params, nthreads=2, executor=executor, **kw)
+    copied = copy.deepcopy(odes)  # per-thread state is not copied
+    res3 = copied.integrate([0, 2], y0, params, nthreads=3, **kw)
+    for r0, r3 in zip(ref, res3):
+        assert np.allclose(r0.yout, r3.yout)
+
+
 def decay(t, y, p):
     return [-y[0]*p[0], y[0]*p[0]]
 
@@ -387,6 +412,89 @@ def test_zero_time_adaptive():
     assert yout.shape == (1, 2)
 
 
+@requires('scipy')
+def test_integrate__decimate():
+    odes = ODESys(sine, sine_jac)
+    kw = dict(integrator='scipy', name='vode', atol=1e-9, rtol=1e-9, first_step=1e-7, nsteps=10**5)
+    ref = odes.integrate((0, 10), [0, 6], [3], **kw)
+    every = odes.integrate((0, 10), [0, 6], [3], decimate=7, **kw)
+    assert every.xout.size == len(range(0, ref.xout.size, 7)) + (0 if (ref.xout.size - 1) % 7 == 0 else 1)
+    assert np.all(every.xout[:-1] == ref.xout[::7]) and every.xout[-1] == ref.xout[-1]
+    assert every.info['ndecimated'] == ref.xout.size - every.xout.size
+
+    tol = 1e7
+    compact = odes.integrate((0, 10), [0, 6], [3], decimate_tol=tol, yout_dtype=np.float32, **kw)
+    assert compact.yout.dtype == np.float32
+    assert 2 < compact.xout.size < ref.xout.size/2
+    yi = np.array([np.interp(ref.xout, compact.xout, compact.yout[:, i]) for i in range(2)]).T
+    assert np.all(np.abs(yi - ref.yout) <= tol*1e-9*(1 + np.abs(ref.yout)) + 1e-6)  # float32 round-off
+
+
+@requires('scipy')
+def test_integrate__decimate__while_integrating():
+    from pyodesys.core import _StepRecorder
+    odes = ODESys(sine, sine_jac)
+    kw = dict(integrator='scipy', name='vode', atol=1e-9, rtol=1e-9, first_step=1e-7, nsteps=10**5)
+    ref = odes.integrate((0, 10), [0, 6], [3], **kw)
+    res = odes.integrate((0, 10), [0, 6], [3], decimate=5, yout_dtype=np.float32, **kw)
+    assert res.yout.dtype == np.float32
+    assert np.all(res.xout[:-1] == ref.xout[::5]) and res.xout[-1] == ref.xout[-1]
+    assert np.allclose(res.yout[:-1], ref.yout[::5], rtol=1e-6, atol=1e-6)
+    assert res.info['ndecimated'] == ref.xout.size - res.xout.size
+
+    recorder = _StepRecorder(3, np.float32)
+    for x in range(8):
+        recorder(x, [x, -x])
+        assert len(recorder.ysteps) == x//3 + 1  # dropped steps are not stored
+    xout, yout, ndecimated = recorder.arrays()
+    assert xout.tolist() == [0, 3, 6, 7] and yout.dtype == np.float32 and ndecimated == 4
+
+
+@requires('scipy')
+def test_iter_integrate():
+    odes = ODESys(sine, sine_jac)
+    kw = dict(integrator='scipy', atol=1e-10, rtol=1e-10)
+    xout = np.linspace(0, 3, 31)
+    ref = odes.integrate(xout, [0, 6], [3], **kw)
+    chunks = list(odes.iter_integrate(xout, [0, 6], [3], chunks=4, **kw))
+    assert len(chunks) == 4
+    assert np.all(np.concatenate([x for x, _ in chunks]) == xout)
+    assert np.allclose(np.concatenate([y for _, y in chunks]), ref.yout, atol=1e-7)
+
+    adaptive = list(odes.iter_integrate(3, [0, 6], [3], chunks=[.5, 2], name='RK45', **kw))
+    assert adaptive[0][0][0] == 0 and [x[-1] for x, _ in adaptive] == [.5, 2, 3]
+    assert np.all(adaptive[1][0] > .5)  # chunk start not repeated
+    assert np.allclose(adaptive[-1][1][-1], [2*np.sin(9), 6*np.cos(9)], atol=1e-7)
+
+
+@requires('scipy')
+@requires('sym')
+def test_iter_integrate__checkpoint(tmpdir):
+    from ..symbolic import SymbolicSys
+    odes = SymbolicSys.from_callback(sine, 2, 1)
+    kw = dict(integrator='scipy', name='RK45', atol=1e-10, rtol=1e-10, chunks=4)
+    ref = list(odes.iter_integrate(3, [0, 6], [3], **kw))
+    checkpoint = os.path.join(str(tmpdir), 'chk.json')
+    chunks = []
+    for chunk in odes.iter_integrate(3, [0, 6], [3], checkpoint=checkpoint, **kw):
+        chunks.append(chunk)
+        if len(chunks) == 2:
+            break  # e.g. preempted while processing the second chunk
+    with open(checkpoint) as ifh:
+        assert json.load(ifh)['chunk'] == 1
+    chunks = chunks[:1] + list(odes.iter_integrate(3, [0, 6], [3], checkpoint=checkpoint, **kw))
+    assert len(chunks) == 4
+    for (x, y), (xref, yref) in zip(chunks, ref):
+        assert np.all(x == xref) and np.all(y == yref)  # bit-for-bit
+    with pytest.raises(ValueError):
+        next(SymbolicSys.from_callback(sine, 2, 1, names='ab').iter_integrate(
+            3, [0, 6], [3], checkpoint=checkpoint, **kw))
+    with pytest.raises(ValueError):
+        next(odes.iter_integrate(3, [0, 6], [3.5], checkpoint=checkpoint, **kw))
+    with pytest.raises(ValueError):  # cannot be verified
+        next(ODESys(sine, sine_jac).iter_integrate(3, [0, 6], [3], checkpoint=checkpoint, **kw))
+
+
 def _test_first_step_cb(integrator, atol=1e-8, rtol=1e-8, forgive=10):
     odesys = ODESys(decay, decay_jac, decay_dfdt, first_step_cb=lambda x, y, p, backend=None: y[0]*1e-30)
     _y0 = [.7, 0]
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import (absolute_import, division, print_function)
 
+import os
+
 import numpy as np
+import pytest
 
 from .. import ODESys
+from ..results import Result
 from ..util import requires
 from .test_core import sine, sine_jac
 
@@ -23,6 +27,14 @@ def _test_sine(use_deriv, atol=1e-8, rtol=1e-8, forgive=1e4):
     assert np.allclose(ref(x_probe), est, atol=atol*forgive, rtol=rtol*forgive)
 
     probes = np.linspace(0, 1, 11)
+    est_v, est_err_v = result.at(probes, use_deriv=use_deriv)
+    assert est_v.shape == est_err_v.shape == (11, 2)
+    for idx, x in enumerate(probes):
+        _est, _err = result.at(x, use_deriv=use_deriv)
+        assert np.allclose(_est, est_v[idx]) and np.allclose(_err, est_err_v[idx])
+    assert np.allclose(ref(probes), est_v, atol=atol*forgive, rtol=rtol*forgive)
+    assert np.all(est_err_v[[0, -1]] == 0)
+
     est2, est_err2 = result.at(probes, linear=True)
     assert est_err2 is None
     assert np.allclose(ref(probes), est2, atol=3e-2)
@@ -38,6 +50,68 @@ def test_Result_at__use_deriv():
     _test_sine(use_deriv=True)
 
 
+def _test_sine_dense_output(tol, **kwargs):
+    odesys = ODESys(sine, sine_jac)
+    A, k = 2, 3
+    result = odesys.integrate(np.linspace(0, 1, 17), [0, A*k], [k], atol=1e-10, rtol=1e-10,
+                              dense_output=True, **kwargs)
+    assert result.info['success']
+    assert result.yout.shape == (17, 2)
+    assert result.info['dense_output'].shape[::2] == (17, 2)
+    ref = lambda x: np.array([A*np.sin(k*x), A*np.cos(k*x)*k]).T
+    probes = np.linspace(0, 1, 1001)
+    est, est_err = result.at(probes)
+    assert est_err is None
+    assert est.shape == (1001, 2)
+    assert np.allclose(ref(probes), est, atol=tol, rtol=tol)
+    assert np.allclose(result.at(2**-0.5)[0], ref(2**-0.5), atol=tol, rtol=tol)
+    spline, _ = result.at(2**-0.5, xdata=result.xout)  # explicit data: spline refitting
+    assert np.allclose(spline, ref(2**-0.5), atol=1e-3)
+
+
+@requires('scipy')
+def test_Result_at__dense_output():
+    _test_sine_dense_output(1e-4, integrator='scipy')
+
+
+@requires('pycvodes')
+def test_Result_at__dense_output__cvode():
+    _test_sine_dense_output(1e-6, integrator='cvode')
+
+
+@requires('scipy', 'sym')
+def test_Result_save_load(tmpdir):
+    from ..symbolic import SymbolicSys
+    from .test_symbolic import _get_decay3
+    odesys = _get_decay3()
+    result = odesys.integrate(np.linspace(0, 2, 17), [5, 4, 2], [4, 3, 2], integrator='scipy', dense_output=True)
+    path = os.path.join(str(tmpdir), 'res')
+    result.save(path)
+    assert sorted(os.listdir(path)) == ['info.dense_output.npy', 'info.internal_params.npy', 'params.npy',
+                                        'result.json', 'xout.npy', 'yout.npy']  # internal_[xy]out: aliases
+    loaded = Result.load(path, odesys=[ODESys(sine, sine_jac), _get_decay3()])
+    assert loaded.odesys.fingerprint() == odesys.fingerprint()
+    assert isinstance(loaded.yout, np.memmap)
+    assert np.all(loaded.xout == result.xout) and np.all(loaded.yout == result.yout)
+    assert loaded.info['nfev'] == result.info['nfev'] and loaded.info['success']
+    assert np.allclose(loaded.at(np.linspace(0, 2, 7))[0], result.at(np.linspace(0, 2, 7))[0])
+    assert Result.load(path).odesys is None
+    with pytest.raises(ValueError):
+        Result.load(path, odesys=_get_decay3(lower_bounds=[0]*3))
+    with pytest.raises(ValueError):
+        Result.load(path, odesys=ODESys(sine, sine_jac))
+
+    k1, k2 = 0.3, 0.30000000000000004  # identical str()
+    sys1, sys2 = [SymbolicSys.from_callback((lambda k: lambda x, y, p: [-k*y[0]])(k), 1) for k in (k1, k2)]
+    assert sys1.fingerprint() != sys2.fingerprint()
+    assert ODESys(sine, sine_jac).fingerprint() is None
+    result = ODESys(sine, sine_jac).integrate([0, 1], [0, 1], [2], integrator='scipy')
+    path = os.path.join(str(tmpdir), 'res_callbacks')
+    result.save(path)
+    with pytest.raises(ValueError):
+        Result.load(path, odesys=ODESys(sine, sine_jac))
+
+
 @requires('pycvodes')
 def test_Result_extend_by_integration():
     atol, rtol = 1e-8, 1e-8
@@ -50,3 +124,63 @@ def test_Result_extend_by_integration():
     assert result.info['success']
     ref = np.array([A*np.sin(k*result.xout), A*np.cos(k*result.xout)*k])
     assert np.allclose(ref.T, result.yout)
+
+
+@requires('scipy')
+def test_Result_at__after_extend_by_integration():
+    odesys = ODESys(sine, sine_jac)
+    A, k = 2, 3
+    intkw = dict(integrator='scipy', atol=1e-10, rtol=1e-10)
+    result = odesys.integrate(np.linspace(0, 1, 33), [0, A*k], [k], **intkw)
+    result.at(.5)  # fits (and caches) the interpolant
+    result.extend_by_integration(2, npoints=32, **intkw)
+    assert np.allclose(result.at(1.95)[0], [A*np.sin(k*1.95), A*np.cos(k*1.95)*k], atol=1e-3)
+
+
+@requires('scipy')
+def test_BatchResult():
+    odesys = ODESys(sine, sine_jac, post_processors=[lambda x, y, p: (x, 2*y, p)])
+    y0 = [[0, 2*3], [0, 1*2], [0, .5*4]]
+    params = [[3], [2], [4]]
+    kw = dict(integrator='scipy', atol=1e-8, rtol=1e-8)
+    ref = odesys.integrate(np.linspace(0, 1, 17), y0, params, **kw)
+    res = odesys.integrate(np.linspace(0, 1, 17), y0, params, batch_result=True, **kw)
+    assert res.offsets is None
+    assert res.internal_yout.shape == (3, 17, 2)
+    assert res.yout.shape == (3, 17, 2)
+    assert len(res) == 3
+    for r0, r1 in zip(ref, res):
+        assert np.allclose(r0.yout, r1.yout)
+        assert np.allclose(r0.info['internal_yout'], r1.info['internal_yout'])
+    assert np.allclose(res.yout[1], ref[1].yout)
+    assert 'internal_yout' not in res.infos[0]
+    res_nopp = ODESys(sine, sine_jac).integrate(np.linspace(0, 1, 17), y0, params, batch_result=True, **kw)
+    assert res_nopp.internal_yout.flags['C_CONTIGUOUS'] and np.allclose(res_nopp.yout, res.internal_yout)
+    assert res[-1] is res[2]
+    assert len(res[:2]) == 2
+
+    ref_adapt = odesys.integrate([0, 1], y0, params, name='lsoda', **kw)
+    res_adapt = odesys.integrate([0, 1], y0, params, name='lsoda', batch_result=True, **kw)
+    assert res_adapt.offsets.size == 4
+    assert res_adapt.yout.shape == (res_adapt.offsets[-1], 2)
+    for idx, r0 in enumerate(ref_adapt):
+        assert np.allclose(r0.xout, res_adapt[idx].xout)
+        assert np.allclose(r0.yout, res_adapt.yout[res_adapt.offsets[idx]:res_adapt.offsets[idx+1]])
+
+
+def test_BatchResult_from_infos():
+    from ..results import BatchResult
+    buf = np.arange(24.).reshape((3, 4, 2))
+    infos = [dict(internal_xout=np.linspace(0, 1, 4), internal_yout=buf[idx], internal_params=np.array([idx]),
+                  mode='predefined') for idx in range(3)]
+    res = BatchResult.from_infos(infos, ODESys(sine, sine_jac))
+    assert np.shares_memory(res.internal_yout, buf) and np.all(res.internal_yout == buf)  # no copy
+    assert not any('internal_yout' in info for info in infos)
+
+    youts = [np.ones((2, 2)), np.zeros((3, 2))]  # not consecutive in memory: copied
+    infos = [dict(internal_xout=np.arange(y.shape[0], dtype=float), internal_yout=y, internal_params=np.array([]),
+                  mode='adaptive') for y in youts]
+    res = BatchResult.from_infos(infos, ODESys(sine, sine_jac))
+    assert res.offsets.tolist() == [0, 2, 5] and res.internal_yout.shape == (5, 2)
+    assert not any(np.shares_memory(res.internal_yout, y) for y in youts)
+    assert np.all(res.internal(1)[1] == 0) and np.all(res.internal(0)[1] == 1)
@@ -9,6 +9,7 @@ import math
 import numpy as np
 import pytest
 import time
+import warnings
 
 try:
     import sym
@@ -19,8 +20,11 @@ else:
     sym_backends = sym.Backend.backends.keys()
 
 from .. import ODESys
-from ..core import integrate_auto_switch, chained_parameter_variation
-from ..symbolic import SymbolicSys, ScaledSys, symmetricsys, PartiallySolvedSystem, get_logexp, _group_invariants
+from ..core import integrate_auto_switch, chained_parameter_variation, integrate_many
+from ..symbolic import (
+    SymbolicSys, ScaledSys, symmetricsys, PartiallySolvedSystem, ForwardSensitivitySystem, AdjointSystem,
+    get_logexp, _group_invariants
+)
 from ..util import requires
 from .bateman import bateman_full  # analytic, never mind the details
 from .test_core import vdp_f
@@ -1708,3 +1712,283 @@ def test_SymbolicSys_from_other_new_params_by_name():
     assert np.allclose(res1.yout, ref1)
     orip = extra['recalc_params'](res1.xout, res1.yout, res1.params)
     assert np.allclose(orip, np.atleast_2d(k))
+
+
+@requires('sym', 'scipy')
+@pytest.mark.parametrize('name,band', [('vode', None), ('lsoda', None), ('dopri5', None), ('vode', (1, 0))])
+def test_SymbolicSys__integrate_scipy_batched(name, band):
+    odesys = _get_decay3(band=band)
+    y0 = np.array([[1, 0, 0], [2, 3, 1], [.5, .7, .9], [4, 0, 1]])
+    params = np.array([[2, 3, 4], [.7, .2, 5], [1, 1.5, 2], [3, .5, .2]])
+    kw = dict(integrator='scipy', name=name, atol=1e-10, rtol=1e-10)
+    if name == 'vode':
+        kw['method'] = 'bdf'
+    xout = np.linspace(0, 1, 7)
+    results = odesys.integrate(np.tile(xout, (4, 1)), y0, params, batched=True, **kw)
+    assert len(results) == 4
+    for idx, res in enumerate(results):
+        assert res.info['success']
+        ref = np.array(bateman_full(y0[idx], params[idx], xout, exp=np.exp)).T
+        assert np.allclose(res.xout, xout)
+        assert np.allclose(res.yout, ref, atol=1e-7, rtol=1e-7)
+
+    with pytest.raises(ValueError):
+        odesys.integrate([[0, 1, 2], [0, 1, 3]], y0[:2], params[:2], batched=True, **kw)
+
+    if name == 'dopri5':
+        res_adapt = odesys.integrate(np.tile([0, 1], (4, 1)), y0, params, batched=True, **kw)
+        for idx, res in enumerate(res_adapt):
+            ref = np.array(bateman_full(y0[idx], params[idx], res.xout, exp=np.exp)).T
+            assert np.allclose(res.yout, ref, atol=1e-7, rtol=1e-7)
+    elif band is None:  # same warnings as when integrating instance by instance
+        messages = []
+        for batched in (False, True):
+            with warnings.catch_warnings(record=True) as wrngs:
+                warnings.simplefilter('always')
+                odesys.integrate(np.tile([0, 1], (4, 1)), y0, params, batched=batched, **kw)
+            messages.append(set(str(w.message) for w in wrngs if "'adaptive' mode" in str(w.message)))
+        assert len(messages[0]) == 2 and messages[0] == messages[1]
+
+
+@requires('sym', 'scipy')
+def test_SymbolicSys__pickle():
+    import pickle
+    odesys = _get_decay3(lower_bounds=[0, 0, 0])
+    unpickled = pickle.loads(pickle.dumps(odesys))
+    assert unpickled.exprs == odesys.exprs
+    kw = dict(integrator='scipy', atol=1e-10, rtol=1e-10)
+    ref = odesys.integrate([0, .5, 1], [1, 0, 0], [2, 3, 4], **kw)
+    res = unpickled.integrate([0, .5, 1], [1, 0, 0], [2, 3, 4], **kw)
+    assert np.allclose(ref.yout, res.yout)
+    assert np.allclose(odesys.j_cb(0, [1, 2, 3], [2, 3, 4]), unpickled.j_cb(0, [1, 2, 3], [2, 3, 4]))
+
+
+@requires('sym', 'scipy')
+@pytest.mark.parametrize('factory', [False, True])
+def test_integrate_many(factory):
+    y0 = np.array([[1, 0, 0], [2, 3, 1], [.5, .7, .9], [4, 0, 1], [1, 2, 3]])
+    params = np.array([[2, 3, 4], [.7, .2, 5], [1, 1.5, 2], [3, .5, .2], [1, 2, 3]])
+    xout = np.linspace(0, 1, 7)
+    kw = dict(integrator='scipy', atol=1e-10, rtol=1e-10)
+    odesys = _get_decay3()
+    ref = odesys.integrate(xout, y0, params, **kw)
+    results = integrate_many(_get_decay3 if factory else odesys, xout, y0, params, nprocs=2, chunksize=2, **kw)
+    assert len(results) == len(ref)
+    for r0, r1 in zip(ref, results):
+        assert np.allclose(r0.xout, r1.xout)
+        assert np.allclose(r0.yout, r1.yout)
+        assert np.allclose(r0.params, r1.params)
+        assert r1.info['success']
+
+    results = integrate_many(odesys, xout, iter(y0), iter(params), nprocs=2, **kw)
+    for r0, r1 in zip(ref, results):
+        assert np.allclose(r0.yout, r1.yout)
+
+    ref = odesys.integrate(2.0, y0, params, **kw)
+    results = integrate_many(odesys, 2.0, y0, params, nprocs=2, **kw)
+    assert len(results) == len(ref)
+    for r0, r1 in zip(ref, results):
+        assert r1.xout[-1] == 2.0
+        assert np.allclose(r0.yout[-1, :], r1.yout[-1, :])
+
+    byname = SymbolicSys.from_callback(lambda x, y, p: {'a': -p['k']*y['a']}, names=['a'], param_names=['k'],
+                                       dep_by_name=True, par_by_name=True)
+    ref = byname.integrate(xout, {'a': [1.0, 2.0, 3.0]}, {'k': 1.0}, **kw)
+    for _y0, _p in [([{'a': 1.0}, {'a': 2.0}, {'a': 3.0}], {'k': 1.0}),
+                    ({'a': [1.0, 2.0, 3.0]}, {'k': 1.0}),
+                    ({'a': 1.0}, {'k': [1.0, 2.0, 3.0]})]:
+        results = integrate_many(byname, xout, _y0, _p, nprocs=2, **kw)
+        assert len(results) == 3 and all(r.info['success'] for r in results)
+    results = integrate_many(byname, xout, [{'a': 1.0}, {'a': 2.0}, {'a': 3.0}], {'k': 1.0}, nprocs=2, **kw)
+    for r0, r1 in zip(ref, results):
+        assert np.allclose(r0.yout, r1.yout)
+
+
+@requires('sym', 'scipy')
+def test_SymbolicSys__lazy_jacobian():
+    odesys = _get_decay3()
+    assert not odesys.is_materialized('j_cb')
+    assert not odesys.is_materialized('jac')
+    res = odesys.integrate(np.linspace(0, 1, 5), [1, 0, 0], [2, 3, 4], integrator='scipy', name='dopri5')
+    assert res.info['success']
+    assert not odesys.is_materialized('j_cb')
+    assert not odesys.is_materialized('dfdx_cb')
+    res = odesys.integrate(np.linspace(0, 1, 5), [1, 0, 0], [2, 3, 4], integrator='scipy', name='vode', method='bdf')
+    assert res.info['success']
+    assert odesys.is_materialized('j_cb') and odesys.is_materialized('jac')
+    assert not odesys.is_materialized('dfdx_cb')
+    assert np.allclose(odesys.dfdx_cb(0, [1, 2, 3], [2, 3, 4]), 0)
+    assert odesys.is_materialized('dfdx_cb')
+    del odesys.j_cb
+    assert not odesys.is_materialized('j_cb')
+    assert odesys.j_cb is not None
+
+
+@requires('sym', 'scipy')
+def test_SymbolicSys__lazy_dfdx():
+    from pyodesys.integrators import RK4_example_integrator
+
+    class JacobianOnceIntegrator(RK4_example_integrator):
+        with_jacobian = True  # evaluates the jacobian (never dfdx) and then uses RK4
+
+        @staticmethod
+        def integrate_predefined(rhs, jac, y0, xout, **kwargs):
+            jac(xout[0], y0, np.empty((len(y0), len(y0))))
+            return RK4_example_integrator.integrate_predefined(rhs, None, y0, xout)
+
+    odesys = _get_decay3()
+    xout = np.linspace(0, 1, 101)
+    res = odesys.integrate(xout, [1, 0, 0], [2, 3, 4], integrator=JacobianOnceIntegrator)
+    ref = odesys.integrate(xout, [1, 0, 0], [2, 3, 4], integrator='scipy', name='dopri5')
+    assert np.allclose(res.yout, ref.yout, atol=1e-6)
+    assert odesys.is_materialized('j_cb')
+    assert not odesys.is_materialized('dfdx_cb')
+
+
+def _get_sparse_chain(n):
+    # A0 -> A1 -> ... -> A(n-1) with A(n-1) also decaying into A0 (not banded)
+    def f(x, y, p):
+        out = [-p[0]*y[0] + p[0]*y[n-1]]
+        for i in range(1, n - 1):
+            out.append(p[0]*y[i-1] - p[0]*y[i])
+        out.append(p[0]*y[n-2] - p[0]*y[n-1])
+        return out
+    return f
+
+
+@requires('sym', 'scipy')
+def test_SymbolicSys__sparse():
+    n = 7
+    odesys = SymbolicSys.from_callback(_get_sparse_chain(n), n, 1, sparse=True)
+    assert odesys.nnz == 2*n
+    assert not odesys.is_materialized('jac')
+    data, colptrs, rowvals = odesys.get_jac_sparse()
+    assert colptrs.tolist() == [2*i for i in range(n + 1)]
+    y, p = np.arange(1., n + 1), [3.0]
+    dense = SymbolicSys.from_callback(_get_sparse_chain(n), n, 1)
+    from scipy.sparse import csc_matrix
+    jmat = csc_matrix((odesys.sparse_j_cb(0, y, p), rowvals, colptrs), shape=(n, n)).toarray()
+    assert np.allclose(jmat, dense.j_cb(0, y, p))
+
+    y0 = np.zeros(n)
+    y0[0] = 1
+    xout = np.linspace(0, 1, 9)
+    kw = dict(integrator='scipy', atol=1e-10, rtol=1e-10)
+    ref = dense.integrate(xout, y0, p, **kw)
+    for name, with_jacobian in [(None, None), ('BDF', False), ('Radau', True)]:
+        res = odesys.integrate(xout, y0, p, name=name, with_jacobian=with_jacobian, **kw)
+        assert res.info['success']
+        assert res.info['name'] == (name or 'BDF')
+        assert np.allclose(res.yout, ref.yout, atol=1e-6, rtol=1e-6)
+    assert res.info['njev'] > 0
+
+    with pytest.raises(ValueError):
+        SymbolicSys.from_callback(_get_sparse_chain(n), n, 1, sparse=True, band=(1, 1))
+
+
+@requires('sym', 'pycvodes')
+def test_SymbolicSys__sparse__cvode():
+    import pycvodes
+    if not pycvodes.config.get('KLU', False):
+        pytest.skip("pycvodes built without KLU")
+    n = 7
+    odesys = SymbolicSys.from_callback(_get_sparse_chain(n), n, 1, sparse=True)
+    dense = SymbolicSys.from_callback(_get_sparse_chain(n), n, 1)
+    y0 = np.zeros(n)
+    y0[0] = 1
+    xout = np.linspace(0, 1, 9)
+    ref = dense.integrate(xout, y0, [3.0], integrator='cvode', atol=1e-10, rtol=1e-10)
+    res = odesys.integrate(xout, y0, [3.0], integrator='cvode', atol=1e-10, rtol=1e-10)
+    assert res.info['success']
+    assert np.allclose(res.yout, ref.yout, atol=1e-6, rtol=1e-6)
+
+
+@requires('sym')
+def test_SymbolicSys__jtimes():
+    n = 5
+    assert SymbolicSys.from_callback(_get_sparse_chain(n), n, 1).get_jtimes() is False
+    odesys = SymbolicSys.from_callback(_get_sparse_chain(n), n, 1, jtimes=True)
+    v, jtimes = odesys.get_jtimes()
+    assert len(v) == len(jtimes) == n
+    jac = odesys.get_jac()
+    vals = np.arange(2., n + 2)
+    subsd = dict(zip(v, vals))
+    subsd.update(dict(zip(odesys.dep, np.arange(1., n + 1))))
+    subsd[odesys.params[0]] = 3.0
+    for ri in range(n):
+        ref = sum(float(jac[ri, ci].subs(subsd))*vals[ci] for ci in range(n))
+        assert abs(float(jtimes[ri].subs(subsd)) - ref) < 1e-12
+
+    nojac = SymbolicSys.from_callback(_get_sparse_chain(n), n, 1, jac=False, jtimes=True)
+    v2, jtimes2 = nojac.get_jtimes()
+    assert len(jtimes2) == n
+
+
+@requires('sym', 'scipy')
+@pytest.mark.parametrize('sens_params', [None, ['k2', 'k1']])
+def test_ForwardSensitivitySystem(sens_params):
+    odesys = _get_decay3_names('a b c'.split(), 'k1 k2 k3'.split())
+    senssys = ForwardSensitivitySystem(odesys, sens_params=sens_params)
+    pnames = sens_params or odesys.param_names
+    y0, k = {'a': 5, 'b': 4, 'c': 2}, {'k1': 4, 'k2': 3, 'k3': 2}
+    xout = np.linspace(0, 2, 17)
+    kw = dict(integrator='scipy', atol=1e-12, rtol=1e-12)
+    res = senssys.integrate(xout, y0, k, **kw)
+    assert res.info['success']
+    assert res.odesys is odesys
+    assert res.yout.shape == (xout.size, 3)
+    assert res.sens.shape == (xout.size, 3, len(pnames))
+    ref = odesys.integrate(xout, y0, k, **kw)
+    assert np.allclose(res.yout, ref.yout)
+    assert np.allclose(res.sens[0], 0)
+    for pi, pname in enumerate(pnames):
+        h = k[pname]*1e-6
+        fd = (odesys.integrate(xout, y0, dict(k, **{pname: k[pname] + h}), **kw).yout - ref.yout)/h
+        assert np.allclose(res.sens[..., pi], fd, rtol=1e-4, atol=1e-5)
+
+    results = senssys.integrate(xout, dict(y0, a=[5, 7]), k, **kw)
+    assert len(results) == 2
+    assert np.allclose(results[0].sens, res.sens)
+    assert not np.allclose(results[1].sens, res.sens)
+
+
+@requires('sym', 'scipy')
+def test_ForwardSensitivitySystem__sparse():
+    odesys = _get_decay3()
+    dense = ForwardSensitivitySystem(odesys)
+    senssys = ForwardSensitivitySystem(odesys, sparse=True)
+    assert not dense.sparse and senssys.sparse
+    assert senssys.nnz < senssys.ny**2
+    assert ForwardSensitivitySystem(SymbolicSys.from_other(odesys, sparse=True)).sparse
+    xout, y0, k = np.linspace(0, 2, 17), [5, 4, 2], [4, 3, 2]
+    ref = dense.integrate(xout, y0, k, integrator='scipy', atol=1e-10, rtol=1e-10)
+    res = senssys.integrate(xout, y0, k, integrator='scipy', name='BDF', atol=1e-10, rtol=1e-10)
+    assert res.info['success'] and res.info['njev'] > 0
+    assert np.allclose(res.sens, ref.sens, rtol=1e-6, atol=1e-6)
+
+
+@requires('sym', 'scipy')
+def test_AdjointSystem():
+    odesys = _get_decay3()
+    y, p = odesys.dep, odesys.params
+    adjsys = AdjointSystem(odesys, final=y[2]**2*p[2], integrand=(y[0] - 1)**2 + y[1]*odesys.indep)
+    assert adjsys.ny == odesys.ny + len(p) + 1
+    xout, y0, k = np.linspace(0, 2, 41), [5, 4, 2], [4, 3, 2]
+    kw = dict(integrator='scipy', atol=1e-10, rtol=1e-10)
+    G, grad_p, grad_y0, res = adjsys.gradient(xout, y0, k, **kw)
+    assert res.odesys is odesys and res.yout.shape == (xout.size, 3)
+    assert grad_p.shape == (3,) and grad_y0.shape == (3,)
+    for idx in range(3):  # central differences (the backward pass steps across the points of xout)
+        h = k[idx]*1e-4
+        Gp, Gm = [adjsys.gradient(xout, y0, [ki + (sgn*h if i == idx else 0) for i, ki in enumerate(k)], **kw)[0]
+                  for sgn in (1, -1)]
+        assert abs((Gp - Gm)/(2*h) - grad_p[idx]) < 1e-4*abs(grad_p[idx]) + 1e-6
+    Gp, Gm = [adjsys.gradient(xout, [y0[0] + sgn*1e-4] + y0[1:], k, **kw)[0] for sgn in (1, -1)]
+    assert abs((Gp - Gm)/2e-4 - grad_y0[0]) < 1e-4*abs(grad_y0[0]) + 1e-6
+    for name in ('vode', 'dopri5'):  # the backward pass is a single integration (also in predefined mode)
+        G2, grad_p2, grad_y02, _ = adjsys.gradient(xout, y0, k, forward_kwargs=dict(name='lsoda'), name=name,
+                                                   **kw)
+        assert np.allclose([G2], [G], rtol=1e-7) and np.allclose(grad_p2, grad_p, rtol=1e-6, atol=1e-8)
+
+    with pytest.raises(ValueError):
+        AdjointSystem(odesys)
@@ -34,3 +34,118 @@ def test_import_():
     qux = import_('qux')
     with pytest.raises(ImportError):
         qux.__name__
+
+
+@requires('sym', 'numpy')
+def test_Callback__out():
+    import numpy as np
+    k = [4, 3]
+    odesys = SymbolicSys.from_callback(decay_dydt_factory(k), len(k)+1)
+    y = np.array([1., 2., 3.])
+    ref_f, ref_j = odesys.f_cb(0, y), odesys.j_cb(0, y)
+    fout = np.empty(3)
+    assert odesys.f_cb(0, y, out=fout) is fout
+    assert np.allclose(fout, ref_f)
+    jout = np.empty((3, 3), order='F')  # not C-contiguous: result is copied
+    assert odesys.j_cb(0, y, out=jout) is jout
+    assert np.allclose(jout, ref_j)
+    ys = np.array([y, 2*y])
+    fouts = np.empty((2, 3))
+    odesys.f_cb(np.zeros(2), ys, out=fouts)
+    assert np.allclose(fouts, [ref_f, 2*ref_f])
+    assert np.allclose(odesys.f_cb(0, 2*y), 2*ref_f)  # input buffer reused
+
+
+@requires('sym', 'numpy')
+def test_lambdify_cache():
+    from ..util import _lambdify_cache_info
+    odesys1 = SymbolicSys.from_callback(decay_dydt_factory([4, 3]), 3)
+    odesys1.j_cb
+    hits = _lambdify_cache_info['hits']
+    odesys2 = SymbolicSys.from_callback(decay_dydt_factory([4, 3]), 3)
+    odesys2.j_cb
+    assert _lambdify_cache_info['hits'] >= hits + 2  # f & jac (at least)
+    assert odesys1.f_cb.callback is odesys2.f_cb.callback
+    odesys3 = SymbolicSys.from_callback(decay_dydt_factory([4, 2]), 3)
+    assert odesys1.f_cb.callback is not odesys3.f_cb.callback
+
+
+@requires('sym', 'symengine', 'numpy')
+def test_lambdify_cache__disk(tmpdir, monkeypatch):
+    import numpy as np
+    from ..util import _lambdify_cache, _lambdify_cache_info
+    monkeypatch.setenv('PYODESYS_LAMBDIFY_CACHE_DIR', str(tmpdir))
+    _lambdify_cache.clear()
+    odesys1 = SymbolicSys.from_callback(decay_dydt_factory([4, 3]), 3, backend='symengine')
+    odesys1.j_cb
+    assert len(tmpdir.listdir()) > 0
+    _lambdify_cache.clear()
+    disk_hits = _lambdify_cache_info['disk_hits']
+    odesys2 = SymbolicSys.from_callback(decay_dydt_factory([4, 3]), 3, backend='symengine')
+    odesys2.j_cb
+    assert _lambdify_cache_info['disk_hits'] >= disk_hits + 2
+    y = [1, 2, 3]
+    assert np.allclose(odesys1.f_cb(0, y), odesys2.f_cb(0, y))
+    assert np.allclose(odesys1.j_cb(0, y), odesys2.j_cb(0, y))
+
+
+@requires('sym', 'numpy')
+@pytest.mark.parametrize('backend', ['sympy', 'symengine'])
+def test_lambdify_cache__lossless_key(backend):
+    import numpy as np
+    from ..util import _lossless_repr
+    if backend == 'symengine':
+        pytest.importorskip('symengine')
+    k1, k2 = 0.3, 0.30000000000000004
+    odesys1 = SymbolicSys.from_callback(lambda x, y, p: [-k1*y[0]], 1, backend=backend)
+    odesys2 = SymbolicSys.from_callback(lambda x, y, p: [-k2*y[0]], 1, backend=backend)
+    assert _lossless_repr(odesys1.exprs) != _lossless_repr(odesys2.exprs)  # str() is identical
+    assert odesys1.f_cb.callback is not odesys2.f_cb.callback
+    if backend == 'symengine':  # (sympy's printer rounds floats to 15 digits)
+        assert odesys1.f_cb(0, [1])[0] == -k1
+        assert odesys2.f_cb(0, [1])[0] == -k2
+    be = odesys1.be
+    assert _lossless_repr(be.Dummy()) != _lossless_repr(be.Dummy())
+    assert _lossless_repr(be.Symbol('x')) == _lossless_repr(be.Symbol('x'))
+
+
+@requires('sym', 'symengine', 'numpy')
+def test_lambdify_cache__disk__not_private(tmpdir, monkeypatch):
+    import os
+    from ..util import _lambdify_cache, _lambdify_cache_info
+    if not hasattr(os, 'getuid'):
+        pytest.skip("POSIX only")
+    monkeypatch.setenv('PYODESYS_LAMBDIFY_CACHE_DIR', str(tmpdir))
+    os.chmod(str(tmpdir), 0o777)
+    _lambdify_cache.clear()
+    disk_hits = _lambdify_cache_info['disk_hits']
+    with pytest.warns(UserWarning):
+        SymbolicSys.from_callback(decay_dydt_factory([4, 3]), 3, backend='symengine')
+    assert len(tmpdir.listdir()) == 0
+    assert _lambdify_cache_info['disk_hits'] == disk_hits
+
+
+class _LambdifyWithoutLLVM(object):
+    __module__ = 'symengine.lib.symengine_wrapper'  # mimics symengine built without LLVM
+
+    def __init__(self, args, exprs, backend=None):
+        if backend == 'llvm':
+            raise ValueError("Symengine was not compiled with LLVM support")
+        self.backend = backend
+
+
+def test_lambdify_cache__disk__no_llvm(tmpdir, monkeypatch):
+    from ..util import _lambdify
+    monkeypatch.setenv('PYODESYS_LAMBDIFY_CACHE_DIR', str(tmpdir))
+    callback = _lambdify(_LambdifyWithoutLLVM, ['x'], ['2*x'])
+    assert callback.backend is None
+
+
+def test_last_step():
+    import numpy as np
+    from ..util import _last_step
+    xout = np.array([0, .1, .3, .7, .70001])  # last step truncated to reach xend
+    assert _last_step({'mode': 'adaptive', 'internal_xout': xout}) == .7 - .3
+    assert _last_step({'mode': 'adaptive', 'internal_xout': xout, 'steps': [.1, .2, .4, .8]}) == .8
+    assert _last_step({'mode': 'adaptive', 'internal_xout': xout, 'ndecimated': 3}) is None
+    assert _last_step({'mode': 'predefined', 'internal_xout': xout}) is None
@@ -1,10 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import (absolute_import, division, print_function)
 
+from collections import OrderedDict
 from functools import reduce
+import hashlib
 import inspect
 import math
 import operator
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import warnings
 
 from pkg_resources import parse_requirements, parse_version
 
@@ -133,13 +141,23 @@ def _ensure_4args(func):
     if len(inspect.getargspec(func)[0]) == 4 + self_arg:
         return func
     if len(inspect.getargspec(func)[0]) == 3 + self_arg:
-        return lambda x, y, p=(), backend=math: func(x, y, p)
+        return _NArgs(func, 3)
     elif len(inspect.getargspec(func)[0]) == 2 + self_arg:
-        return lambda x, y, p=(), backend=math: func(x, y)
+        return _NArgs(func, 2)
     else:
         raise ValueError("Incorrect numer of arguments")
 
 
+class _NArgs(_Blessed):
+    """ Callable ignoring trailing arguments (unlike a lambda it is picklable). """
+
+    def __init__(self, func, nargs):
+        self.func, self.nargs = func, nargs
+
+    def __call__(self, x, y, p=(), backend=math):
+        return self.func(*(x, y, p)[:self.nargs])
+
+
 def _default(arg, default):
     return default if arg is None else arg
 
@@ -148,6 +166,158 @@ def _concat(*args):
     return np.concatenate(list(map(np.atleast_1d, args)))
 
 
+def _last_step(info):
+    """ Current step size of the solver (internal units) when known, otherwise ``None``.
+
+    Taken from the steps recorded by the solver (``info['steps']``, e.g. cvode with
+    ``record_steps=True``), otherwise in adaptive mode from the last step which was
+    not truncated to reach the end point (i.e. the second to last), unless the output
+    has been decimated.
+    """
+    steps = info.get('steps', None)
+    if steps is not None and len(steps) > 0:
+        return float(steps[-1])
+    xout = info.get('internal_xout', ())
+    if info.get('mode') != 'adaptive' or info.get('ndecimated') or len(xout) < 3:
+        return None
+    return float(xout[-2] - xout[-3])
+
+
+def _lossless_repr(obj):
+    """ Unambiguous string representation of (nested containers of) numbers & expressions.
+
+    Unlike ``str`` it keeps floats at full precision and tells apart dummies, symbols
+    with different assumptions and undefined functions of the same arguments.
+    """
+    if isinstance(obj, (str, bytes, bool, int, float, type(None))):
+        return repr(obj)  # repr of a float is exact
+    if isinstance(obj, dict):
+        return '{%s}' % ','.join(sorted('%s:%s' % (_lossless_repr(k), _lossless_repr(v)) for k, v in obj.items()))
+    if isinstance(obj, np.ndarray) and obj.dtype != object:
+        return 'array(%s,%s,%s)' % (obj.dtype.str, obj.shape, obj.tobytes().hex())
+    if isinstance(obj, (list, tuple, np.ndarray)):
+        return '%s[%s]' % (type(obj).__name__, ','.join(map(_lossless_repr, obj)))
+    if hasattr(obj, 'shape') and hasattr(obj, 'tolist'):  # symbolic matrix
+        return 'matrix%s%s' % (tuple(obj.shape), _lossless_repr(obj.tolist()))
+    head = type(obj).__name__
+    if hasattr(obj, 'get_name'):  # e.g. symengine.FunctionSymbol
+        head += ':' + obj.get_name()
+    args = getattr(obj, 'args', None)
+    if args:
+        return '%s(%s)' % (head, ','.join(map(_lossless_repr, args)))
+    if getattr(obj, 'is_Float', False):
+        mpf = getattr(obj, '_mpf_', None)
+        return '%s%s' % (head, mpf if mpf is not None else obj._sympy_()._mpf_)
+    if getattr(obj, 'is_Dummy', False):
+        return '%s(%s,%s)' % (head, obj, getattr(obj, 'dummy_index', None) or hash(obj))
+    assumptions = getattr(obj, 'assumptions0', None) if getattr(obj, 'is_Symbol', False) else None
+    return '%s(%s%s)' % (head, obj, '' if not assumptions else ',' + _lossless_repr(assumptions))
+
+
+def _content_hash(*parts):
+    """ Hex digest (sha256) of lossless string representations of ``parts``. """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(_lossless_repr(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _private_dir(path):
+    """ Whether ``path`` is a directory owned by the current user, not writable by others. """
+    if not hasattr(os, 'getuid'):
+        return os.path.isdir(path)
+    st = os.stat(path)
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+_lambdify_cache = OrderedDict()  # content hash -> Lambdify instance (LRU order)
+_lambdify_cache_lock = threading.Lock()
+_lambdify_cache_info = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+
+def _lambdify_name(Lambdify):
+    name = getattr(Lambdify, '__qualname__', getattr(Lambdify, '__name__', None))
+    if name is None:
+        return None
+    return '%s.%s' % (getattr(Lambdify, '__module__', ''), name)
+
+
+def _lambdify(Lambdify, args, exprs):
+    """ Calls ``Lambdify(args, exprs)`` unless an equivalent callback is cached.
+
+    Compiled callbacks are kept in a LRU cache keyed on the content of
+    ``(Lambdify, args, exprs)``, so that rebuilding an identical system (e.g. through
+    :meth:`SymbolicSys.from_other`) does not recompile its callbacks. The size of the cache
+    is taken from the environment variable ``PYODESYS_LAMBDIFY_CACHE_SIZE`` (default: 256,
+    0 disables the cache). If ``PYODESYS_LAMBDIFY_CACHE_DIR`` is set, picklable callbacks are
+    also stored in that directory (symengine's ``Lambdify`` then uses its LLVM backend, when
+    available, which supports pickling). Since unpickling may execute arbitrary code, the
+    directory is only used if it is owned by the current user and not writable by others.
+    """
+    maxsize = int(os.environ.get('PYODESYS_LAMBDIFY_CACHE_SIZE', '256'))
+    name = _lambdify_name(Lambdify)
+    if maxsize <= 0 or name is None:
+        return Lambdify(args, exprs)
+    key = _content_hash(name, args, getattr(exprs, 'shape', None), exprs)
+    with _lambdify_cache_lock:
+        if key in _lambdify_cache:
+            _lambdify_cache_info['hits'] += 1
+            _lambdify_cache[key] = callback = _lambdify_cache.pop(key)  # most recently used last
+            return callback
+
+    cache_dir = os.environ.get('PYODESYS_LAMBDIFY_CACHE_DIR', None)
+    if cache_dir:
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir, 0o700)
+            except OSError:  # created concurrently by another process
+                if not os.path.isdir(cache_dir):
+                    raise
+        if not _private_dir(cache_dir):
+            warnings.warn("Ignoring PYODESYS_LAMBDIFY_CACHE_DIR=%s (not owned by the current user or "
+                          "writable by others)" % cache_dir)
+            cache_dir = None
+    callback = None
+    if cache_dir:
+        path = os.path.join(cache_dir, key + '.pkl')
+        if os.path.exists(path):  # files are created with mode 0600 by mkstemp
+            try:
+                with open(path, 'rb') as ifh:
+                    callback = pickle.load(ifh)
+            except Exception:
+                callback = None  # e.g. truncated file or incompatible version, rebuild
+            else:
+                _lambdify_cache_info['disk_hits'] += 1
+        if callback is None:
+            if name.startswith('symengine'):
+                try:
+                    callback = Lambdify(args, exprs, backend='llvm')
+                except Exception:
+                    callback = None  # symengine built without LLVM
+            if callback is None:
+                callback = Lambdify(args, exprs)
+            try:
+                data = pickle.dumps(callback, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                pass  # not picklable: memory tier only
+            else:
+                fd, tmp = tempfile.mkstemp(dir=cache_dir)
+                with os.fdopen(fd, 'wb') as ofh:
+                    ofh.write(data)
+                getattr(os, 'replace', os.rename)(tmp, path)
+            _lambdify_cache_info['misses'] += 1
+    else:
+        callback = Lambdify(args, exprs)
+        _lambdify_cache_info['misses'] += 1
+
+    with _lambdify_cache_lock:
+        _lambdify_cache[key] = callback
+        while len(_lambdify_cache) > maxsize:
+            _lambdify_cache.popitem(last=False)
+    return callback
+
+
 class _Callback(_Blessed):
 
     def __init__(self, indep, dep, params, exprs, Lambdify=None):
@@ -158,26 +328,75 @@ class _Callback(_Blessed):
             self.args = _concat(self.indep, self.dep, self.params)
         self.input_width = len(self.args)
         self.exprs = exprs
-        self.callback = Lambdify(self.args, self.exprs)
+        self.Lambdify = Lambdify
+        self.callback = _lambdify(Lambdify, self.args, self.exprs)
         self.ny = len(dep)
         self.take_params = len(params)
-
-    def __call__(self, x, y, params=(), backend=None):
+        self.out_shape = tuple(getattr(exprs, 'shape', None) or (len(exprs),))
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['callback']  # regenerated from the expressions when unpickled
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.callback = _lambdify(self.Lambdify, self.args, self.exprs)
+        self._local = threading.local()
+
+    def _input_buffer(self, shape):
+        """ Input array reused between calls (one per thread and shape of x). """
+        try:
+            buffers = self._local.buffers
+        except AttributeError:
+            buffers = self._local.buffers = {}
+        try:
+            return buffers[shape]
+        except KeyError:
+            buf = buffers[shape] = np.empty(shape + (self.input_width,))
+            return buf
+
+    def __call__(self, x, y, params=(), backend=None, out=None):
+        """ Evaluates the expressions.
+
+        Parameters
+        ----------
+        x : float or array_like
+        y : array_like
+        params : array_like
+        backend : ignored
+        out : array (optional)
+            Array to write the result into (e.g. provided by the solver). Written to
+            directly when it is C-contiguous and of matching shape, otherwise the result
+            is copied into it.
+
+        Returns
+        -------
+        Array of results (``out`` when given).
+        """
         _x = np.asarray(x)
         _y = np.asarray(y)
-        _p = np.asarray(params)[..., :self.take_params]
         if _y.shape[-1] != self.ny:
             raise TypeError("Incorrect shape of y")
-        inp = np.empty(_x.shape + (self.input_width,))
+        inp = self._input_buffer(_x.shape)
         if self.indep is None:
             nx = 0
         else:
-            inp[..., 0] = _x = np.asarray(x)
+            inp[..., 0] = _x
             nx = 1
         inp[..., nx:(nx+self.ny)] = _y
-        inp[..., (nx+self.ny):] = _p
-        result = self.callback(inp)
-        return result
+        if self.take_params:
+            inp[..., (nx+self.ny):] = np.asarray(params)[..., :self.take_params]
+        if out is None:
+            return self.callback(inp)
+        if out.dtype == np.float64 and out.flags['C_CONTIGUOUS'] and out.flags['WRITEABLE'] and \
+           out.shape == _x.shape + self.out_shape:
+            self.callback(inp, out=out)
+        else:
+            out[...] = self.callback(inp)
+        return out
 
 
 class requires(object):